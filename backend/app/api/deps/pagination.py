@@ -0,0 +1,63 @@
+# backend/app/api/deps/pagination.py
+from dataclasses import dataclass
+import hashlib
+
+from fastapi import Query, Request, Response
+
+from app.core.config import settings
+
+
+@dataclass
+class KeysetParams:
+    """Parâmetros de paginação por chave (id crescente)."""
+    limit: int | None
+    after: int | None
+
+
+def keyset_params(
+    limit: int | None = Query(None, ge=1, le=settings.LISTING_MAX_PAGE_SIZE,
+                              description="Itens por página; sem limite retorna a lista completa."),
+    after: int | None = Query(None, ge=0, description="Cursor: retorna os itens com id maior que este."),
+) -> KeysetParams:
+    """
+    Dependência do FastAPI para listagens paginadas por chave.
+
+    A próxima página é pedida com `after` igual ao cabeçalho `X-Next-Cursor`
+    da resposta (ausente na última página).
+    """
+    return KeysetParams(limit, after)
+
+
+def listing_response(request: Request, response: Response, rows: list[dict], params: KeysetParams):
+    """
+    Finaliza uma listagem buscada com `limit + 1` linhas: corta a página,
+    define `X-Next-Cursor` e o ETag da página.
+
+    Se o ETag coincide com o `If-None-Match` da requisição, devolve 304 sem
+    corpo, antes de validar e serializar as linhas.
+    """
+    headers = {"Cache-Control": "private, no-cache"}
+    if params.limit is not None and len(rows) > params.limit:
+        rows = rows[:params.limit]
+        headers["X-Next-Cursor"] = str(rows[-1]['id'])
+
+    # Hash das linhas como vieram do banco (sem serializar o JSON da resposta)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{params.limit}:{params.after}:".encode())
+    for row in rows:
+        digest.update(repr(row).encode())
+        digest.update(b"\x00")
+    headers["ETag"] = f'W/"{digest.hexdigest()}"'
+
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return rows
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Comparação fraca: ignora o prefixo W/ de ambos os lados
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
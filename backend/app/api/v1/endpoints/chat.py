@@ -1,17 +1,59 @@
+import json
+import time
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from app.schemas.chat_schemas import ChatRequest, ChatResponse
-import google.generativeai as genai
 from supabase import Client
+from app.core.metrics import CHAT_STAGE_SECONDS
 from app.core.security import get_current_user
 from app.api.deps.db import get_db
-from app.core.config import settings
+from app.services.chat_history import get_chat_history
+from app.services.embedding_service import embed_query
+from app.services.llm_service import (
+    NO_CONTEXT_ANSWER,
+    build_prompt,
+    configure_gemini,
+    generate_answer,
+    stream_answer,
+)
+from app.services.query_cache import get_query_cache
+from app.services.rag_service import retrieve_chunks, workspace_top_k
 
 # Configura o Gemini
-genai.configure(api_key=settings.ORACULO_GEMINI_API_KEY)
+configure_gemini()
 
 router = APIRouter()
 
 
+def retrieve_for_question(db: Client, workspace_id: int, question: str) -> list[dict]:
+    """
+    Busca os chunks da pergunta, usando o cache do workspace quando possível.
+    O embedding da pergunta vem do cache de embeddings (embed_query).
+    """
+    cache = get_query_cache()
+    if cache is not None:
+        chunks = cache.get(workspace_id, "retrieval", question)
+        if chunks is not None:
+            return chunks
+
+    with CHAT_STAGE_SECONDS.labels("embedding").time():
+        question_embedding = embed_query(question)
+    with CHAT_STAGE_SECONDS.labels("retrieval").time():
+        chunks = retrieve_chunks(db, workspace_id, question_embedding,
+                                 match_count=workspace_top_k(db, workspace_id), query_text=question)
+    # Busca vazia não vai para o cache: o primeiro documento do workspace pode ainda estar em ingestão
+    if cache is not None and chunks:
+        cache.set(workspace_id, "retrieval", question, chunks)
+    return chunks
+
+
+def _sse(event: str, data: dict) -> str:
+    """Formata um evento Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 
 # --- Endpoint ---
 
@@ -23,66 +65,109 @@ def handle_chat(
     current_user_id: str = Depends(get_current_user)  # Garante a autenticação
 ):
     try:
-        # 1. Gerar embedding para a pergunta
-        question_embedding_response = genai.embed_content(
-            model='models/text-embedding-004',
-            content=request.question,
-            task_type="RETRIEVAL_QUERY"
-        )
-        question_embedding = question_embedding_response['embedding']
-
-        # 2. Buscar chunks relevantes no DB
-        match_params = {
-            'query_embedding': question_embedding,
-            'p_workspace_id': request.workspace_id,
-            'match_threshold': 0.2,
-            'match_count': 5
-        }
-        matching_chunks_res = db.rpc(
-            'match_document_chunks', match_params).execute()
-
-        if not matching_chunks_res.data:
-            return ChatResponse(answer="Desculpe, não encontrei informações relevantes nos documentos para responder a essa pergunta.")
-
-        # 3. Construir o contexto e o prompt
-        context_text = "\n\n".join([chunk['content']
-                                   for chunk in matching_chunks_res.data])
-        document_names = ", ".join(
-            list(set([chunk['document_name'] for chunk in matching_chunks_res.data])))
-
-        prompt = f"""
-        Você é o Oráculo, um assistente de IA especialista em análise de documentos.
-        Sua tarefa é responder à pergunta do usuário com base exclusivamente no contexto extraído dos seguintes documentos: {document_names}.
-        Seja preciso, objetivo e sempre baseie sua resposta nos trechos de texto fornecidos.
-        Se a informação não estiver no contexto, afirme claramente que não encontrou a resposta nos documentos analisados.
-
-        **Contexto Extraído dos Documentos:**
-        ---
-        {context_text}
-        ---
-
-        **Pergunta do Usuário:**
-        {request.question}
-
-        **Sua Resposta:**
-        """
-
-        # 4. Gerar a resposta da IA
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
-
-        # 5. Salvar a conversa no banco de dados (usando as variáveis)
-        messages_to_save = [
-            {'role': 'user', 'content': request.question,
-                'workspace_id': request.workspace_id, 'user_id': current_user_id},
-            {'role': 'assistant', 'content': response.text,
-                'workspace_id': request.workspace_id, 'user_id': current_user_id}
-        ]
-        db.table('chat_messages').insert(messages_to_save).execute()
-
-        return ChatResponse(answer=response.text)
+        cache = get_query_cache()
+        answer = cache.get(request.workspace_id, "answer", request.question) if cache else None
+
+        if answer is None:
+            # 1-2. Gerar embedding para a pergunta e buscar chunks relevantes no DB
+            chunks = retrieve_for_question(db, request.workspace_id, request.question)
+
+            if not chunks:
+                return ChatResponse(answer=NO_CONTEXT_ANSWER)
+
+            # 3. Construir o contexto e o prompt
+            prompt = build_prompt(request.question, chunks)
+
+            # 4. Gerar a resposta da IA
+            with CHAT_STAGE_SECONDS.labels("generation").time():
+                answer = generate_answer(prompt)
+            if cache is not None:
+                cache.set(request.workspace_id, "answer", request.question, answer)
+
+        # 5. Enfileirar a conversa para o histórico (gravada em lote, em segundo plano)
+        get_chat_history().record(request.workspace_id, current_user_id, request.question, answer)
+
+        return ChatResponse(answer=answer)
 
     except Exception as e:
         print(f"An error occurred during chat processing: {e}")
         raise HTTPException(
             status_code=500, detail="Ocorreu um erro ao processar sua pergunta.")
+
+
+@router.post("/stream")
+async def handle_chat_stream(
+    request: ChatRequest,
+    db: Client = Depends(get_db),
+    current_user_id: str = Depends(get_current_user)  # Garante a autenticação
+):
+    """
+    Responde à pergunta enviando a resposta como Server-Sent Events.
+
+    Eventos: `token` ({"text": ...}) a cada trecho gerado, `done` ao final
+    e `error` em caso de falha. O histórico é enfileirado depois que o stream termina.
+    """
+    cache = get_query_cache()
+    cached_answer = None
+    chunks: list[dict] = []
+    try:
+        # Cache, embedding e busca são chamadas síncronas: rodam no threadpool
+        if cache is not None:
+            cached_answer = await run_in_threadpool(
+                cache.get, request.workspace_id, "answer", request.question)
+        if cached_answer is None:
+            chunks = await run_in_threadpool(
+                retrieve_for_question, db, request.workspace_id, request.question)
+    except Exception as e:
+        print(f"An error occurred during chat retrieval: {e}")
+        raise HTTPException(
+            status_code=500, detail="Ocorreu um erro ao processar sua pergunta.")
+
+    answer_parts: list[str] = []
+    completed = False
+
+    async def event_stream():
+        nonlocal completed
+        if cached_answer is not None:
+            answer_parts.append(cached_answer)
+            completed = True
+            yield _sse("token", {"text": cached_answer})
+            yield _sse("done", {})
+            return
+
+        if not chunks:
+            yield _sse("token", {"text": NO_CONTEXT_ANSWER})
+            yield _sse("done", {})
+            return
+
+        try:
+            started = time.perf_counter()
+            async for text in stream_answer(build_prompt(request.question, chunks)):
+                if not answer_parts:
+                    CHAT_STAGE_SECONDS.labels("first_token").observe(time.perf_counter() - started)
+                answer_parts.append(text)
+                yield _sse("token", {"text": text})
+            CHAT_STAGE_SECONDS.labels("generation").observe(time.perf_counter() - started)
+        except Exception as e:
+            print(f"An error occurred during chat streaming: {e}")
+            yield _sse("error", {"detail": "Ocorreu um erro ao gerar a resposta."})
+            return
+        completed = True
+        if cache is not None:
+            await run_in_threadpool(
+                cache.set, request.workspace_id, "answer", request.question, "".join(answer_parts))
+        yield _sse("done", {})
+
+    async def persist_history():
+        # Só salva respostas completas (o cliente pode ter desconectado)
+        if completed:
+            await run_in_threadpool(
+                get_chat_history().record, request.workspace_id, current_user_id,
+                request.question, "".join(answer_parts))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(persist_history),
+    )
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import List
 from app.schemas.workspace_schemas import WorkspaceCreate, WorkspaceRead
 from app.schemas.document_schemas import DocumentRead
@@ -6,8 +6,11 @@ from app.crud import workspace_crud
 from app.celery_instance import celery_app # Importa a instância do Celery
 from supabase import Client
 # Mock de dependência de autenticação - será substituído em breve
-from app.core.security import get_current_user
+from app.api.deps.pagination import KeysetParams, keyset_params, listing_response
+from app.core.security import get_current_user, get_current_user_remote
 from app.crud.workspace_crud import get_supabase_client
+from app.services.query_cache import invalidate_workspace
+from app.services.rag_service import unindex_document
 
 router = APIRouter()
 
@@ -36,39 +39,49 @@ def create_workspace_endpoint(
 @router.get("/", response_model=List[WorkspaceRead])
 def list_workspaces_endpoint(
     *,
+    request: Request,
+    response: Response,
+    page: KeysetParams = Depends(keyset_params),
     db: Client = Depends(get_supabase_client),
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Lista todos os workspaces do usuário autenticado.
+    Lista os workspaces do usuário autenticado (todos, ou uma página com `limit`/`after`).
+    Responde 304 quando o `If-None-Match` coincide com o ETag da listagem.
     """
     user_id = current_user
     if not user_id:
         raise HTTPException(status_code=403, detail="Usuário não autenticado.")
 
-    workspaces = workspace_crud.get_workspaces_by_user(db, user_id=user_id)
-    return workspaces
+    # Uma linha a mais indica se há próxima página
+    workspaces = workspace_crud.get_workspaces_by_user(
+        db, user_id=user_id, limit=page.limit and page.limit + 1, after=page.after)
+    return listing_response(request, response, workspaces, page)
 
 
 @router.get("/{workspace_id}/documents", response_model=List[DocumentRead])
 def list_workspace_documents_endpoint(
     *,
     workspace_id: int,
+    request: Request,
+    response: Response,
+    page: KeysetParams = Depends(keyset_params),
     db: Client = Depends(get_supabase_client),
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Lista todos os documentos de um workspace específico.
+    Lista os documentos de um workspace específico (todos, ou uma página com `limit`/`after`).
+    Responde 304 quando o `If-None-Match` coincide com o ETag da listagem.
     """
     user_id = current_user
     if not user_id:
         raise HTTPException(status_code=403, detail="Usuário não autenticado.")
 
     documents = workspace_crud.get_documents_by_workspace(
-        db, workspace_id=workspace_id, user_id=user_id
+        db, workspace_id=workspace_id, user_id=user_id, limit=page.limit and page.limit + 1, after=page.after
     )
     # A função do CRUD já garante a segurança, retornando [] se o acesso for negado.
-    return documents
+    return listing_response(request, response, documents, page)
 
 @router.post("/process-document/{document_id}", status_code=202)
 def process_document_endpoint(
@@ -88,6 +101,11 @@ def process_document_endpoint(
     if doc_res.data['user_id'] != current_user:
         raise HTTPException(status_code=403, detail="Acesso negado. O documento não pertence ao usuário.")
 
+    # A tarefa só processa documentos PENDING (ela reivindica o documento ao começar)
+    queued = db.table('documents').update({'status': 'PENDING'}).eq('id', document_id).neq('status', 'PROCESSING').execute()
+    if not queued.data:
+        raise HTTPException(status_code=409, detail="O documento já está sendo processado.")
+
     print(f"DEBUG: Despachando tarefa para o broker: {celery_app.conf.broker_url}")
     try:
         # Dispara a tarefa Celery explicitamente pelo nome
@@ -105,14 +123,15 @@ def delete_document_endpoint(
     *,
     document_id: int,
     db: Client = Depends(get_supabase_client),
-    current_user: str = Depends(get_current_user)
+    # Operação destrutiva: valida também com o Supabase Auth (sessões revogadas)
+    current_user: str = Depends(get_current_user_remote)
 ):
     """
     Deleta um documento específico.
     O gatilho no Supabase cuidará de deletar o arquivo do Storage e os chunks.
     """
     # 1. Verificar se o documento existe e pertence ao usuário
-    doc_res = db.table('documents').select('id', 'user_id').eq('id', document_id).single().execute()
+    doc_res = db.table('documents').select('id', 'user_id', 'workspace_id').eq('id', document_id).single().execute()
     
     if not doc_res.data:
         raise HTTPException(status_code=404, detail="Documento não encontrado.")
@@ -126,4 +145,8 @@ def delete_document_endpoint(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao deletar o documento: {e}")
 
+    # 3. Remover os chunks do índice local e invalidar as respostas em cache do workspace
+    unindex_document(doc_res.data['workspace_id'], document_id)
+    invalidate_workspace(doc_res.data['workspace_id'])
+
     return {"message": "Documento deletado com sucesso."}
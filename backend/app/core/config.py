@@ -10,6 +10,16 @@ class Settings(BaseSettings):
     # CORREÇÃO: O backend precisa da SERVICE_KEY, não da ANON_KEY
     SUPABASE_SERVICE_KEY: str
     SUPABASE_JWT_SECRET: str
+    # Pool HTTP do cliente Supabase compartilhado (por processo, por sub-cliente)
+    SUPABASE_HTTP_MAX_CONNECTIONS: int = 50
+    SUPABASE_HTTP_MAX_KEEPALIVE: int = 20
+    SUPABASE_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    SUPABASE_HTTP_TIMEOUT: float = 60.0
+    # Verificação local dos JWTs do Supabase Auth
+    SUPABASE_JWT_AUDIENCE: str = "authenticated"
+    # Cache de claims já verificados (o TTL nunca passa do `exp` do token)
+    AUTH_CLAIMS_CACHE_MAX_ENTRIES: int = 10_000
+    AUTH_CLAIMS_CACHE_TTL_SECONDS: int = 300
 
     # Google Gemini
     # CORREÇÃO: Usa o nome customizado da variável
@@ -27,6 +37,165 @@ class Settings(BaseSettings):
 
     # Database (Listener)
     DATABASE_URL: str
+    # Janela para agrupar notificações em um lote e tamanho máximo do lote
+    LISTENER_BATCH_WINDOW_MS: int = 250
+    LISTENER_MAX_BATCH: int = 500
+    # Backoff exponencial (com jitter) entre reconexões
+    LISTENER_BACKOFF_INITIAL_SECONDS: float = 1.0
+    LISTENER_BACKOFF_MAX_SECONDS: float = 60.0
+
+    # Embeddings (ingestão e chat)
+    EMBEDDING_MODEL: str = "models/text-embedding-004"
+    # Quantidade de textos por requisição batchEmbedContents (máximo da API: 100)
+    EMBEDDING_BATCH_SIZE: int = 100
+    # Quantidade máxima de lotes em voo ao mesmo tempo por tarefa
+    EMBEDDING_MAX_CONCURRENCY: int = 4
+
+    # Pipeline de ingestão
+    # Linhas por INSERT em document_chunks (cada flush avança o checkpoint)
+    INGESTION_INSERT_BATCH_SIZE: int = 20
+    # Novas tentativas da tarefa; cada uma retoma após a última página gravada
+    INGESTION_MAX_RETRIES: int = 3
+    # Documentos com pelo menos esse número de páginas são divididos em
+    # subtarefas por faixa de páginas (group + chord). 0 desativa o fan-out.
+    INGESTION_FANOUT_MIN_PAGES: int = 200
+    # Páginas por subtarefa no modo fan-out
+    INGESTION_PAGE_RANGE_SIZE: int = 50
+    # Gravação dos chunks: "postgrest" (insert via API) ou "copy" (COPY binário
+    # direto no Postgres via DATABASE_URL, uma transação por documento/faixa)
+    CHUNK_WRITER_BACKEND: str = "postgrest"
+    # Linhas por lote de COPY
+    CHUNK_COPY_BATCH_SIZE: int = 500
+
+    # Download dos arquivos do Storage em streaming: até esse tamanho o arquivo
+    # fica em memória; acima vai para um arquivo temporário lido do disco
+    STORAGE_MEMORY_MAX_BYTES: int = 16 * 1024 * 1024
+    # Tamanho de cada leitura da resposta do Storage
+    DOWNLOAD_CHUNK_BYTES: int = 1024 * 1024
+    # Diretório dos arquivos temporários (vazio = diretório temporário do sistema)
+    DOWNLOAD_TMP_DIR: str = ""
+
+    # Extração de texto de PDFs em paralelo (processos); 0 = um por núcleo
+    PDF_EXTRACTION_WORKERS: int = 0
+    # Abaixo desse número de páginas a extração é serial (evita o custo do pool)
+    PDF_PARALLEL_MIN_PAGES: int = 64
+    # Páginas por tarefa enviada a cada processo do pool
+    PDF_EXTRACTION_RANGE_SIZE: int = 16
+
+    # Linhas de planilha (XLSX) por unidade de texto enviada ao chunking
+    XLSX_ROWS_PER_UNIT: int = 100
+
+    # Chunking por frases/parágrafos (tokens estimados por caracteres)
+    CHUNK_MAX_TOKENS: int = 350
+    CHUNK_MIN_TOKENS: int = 100
+    CHUNK_CHARS_PER_TOKEN: int = 4
+
+    # Contexto do chat: chunks buscados, orçamento em tokens estimados do
+    # contexto montado e limiar de quase-duplicatas (fração de trigramas de
+    # palavras já presentes em outro chunk; 0 desativa)
+    CONTEXT_CANDIDATES: int = 5
+    CONTEXT_TOKEN_BUDGET: int = 1500
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8
+
+    # Listagens de workspaces/documentos: linhas por consulta ao percorrer a
+    # lista completa e máximo aceito no parâmetro `limit`
+    LISTING_PAGE_SIZE: int = 1000
+    LISTING_MAX_PAGE_SIZE: int = 1000
+
+    # Limite de taxa das chamadas ao Gemini, compartilhado pelo cluster:
+    # "redis" (bucket único para API e workers) ou "memory" (por processo).
+    # Cotas em requisições por minuto; 0 desativa o bucket
+    GEMINI_RATE_LIMIT_BACKEND: str = "redis"
+    GEMINI_EMBED_RPM: int = 0
+    GEMINI_GENERATE_RPM: int = 0
+    # Rajada máxima, em segundos de cota acumulada
+    GEMINI_BURST_SECONDS: float = 1.0
+    # Fração do bucket reservada ao chat (a ingestão não a consome)
+    GEMINI_INTERACTIVE_RESERVE: float = 0.2
+    # Máximo de chamadas simultâneas por processo (reduzido automaticamente após 429/5xx)
+    GEMINI_MAX_CONCURRENCY: int = 16
+    # Novas tentativas após 429/5xx/timeout: ingestão e chat, com backoff exponencial e jitter
+    GEMINI_MAX_RETRIES: int = 6
+    GEMINI_CHAT_MAX_RETRIES: int = 2
+    GEMINI_RETRY_BASE_SECONDS: float = 1.0
+    GEMINI_RETRY_MAX_SECONDS: float = 30.0
+
+    # Cache de embeddings endereçado por conteúdo: "redis", "memory" ou "none"
+    EMBEDDING_CACHE_BACKEND: str = "redis"
+    # Número máximo de vetores mantidos no cache (evicção LRU)
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 50_000
+
+    # Cache por workspace de resultados de busca e respostas do chat:
+    # "redis" (compartilhado e invalidado pelos workers do Celery), "memory"
+    # (por processo: só vê invalidações do próprio processo, então serve
+    # respostas antigas após uma ingestão no worker) ou "none"
+    QUERY_CACHE_BACKEND: str = "redis"
+    QUERY_CACHE_TTL_SECONDS: int = 3600
+    QUERY_CACHE_MAX_ENTRIES: int = 10_000
+
+    # Histórico do chat (chat_messages) gravado em segundo plano, em lotes:
+    # "memory" (fila no processo), "redis" (fila compartilhada e durável) ou
+    # "sync" (insert a cada resposta)
+    CHAT_HISTORY_BACKEND: str = "memory"
+    # Grava quando há esse número de mensagens na fila ou a cada intervalo
+    CHAT_HISTORY_BATCH_SIZE: int = 200
+    CHAT_HISTORY_FLUSH_SECONDS: float = 2.0
+    # Limite da fila (memory: descarta as mais antigas; redis: recusa as novas)
+    # e da lista de mensagens rejeitadas pelo banco no Redis
+    CHAT_HISTORY_MAX_PENDING: int = 50_000
+    # Tentativas de gravar a fila no shutdown da API
+    CHAT_HISTORY_SHUTDOWN_RETRIES: int = 3
+    # Validade da trava de gravação da fila no Redis (renovada enquanto o flush roda)
+    CHAT_HISTORY_LOCK_SECONDS: float = 30.0
+
+    # Busca dos chunks do chat: "postgres" (RPC match_document_chunks, exata)
+    # ou "ivf" (índice aproximado local por workspace, em VECTOR_INDEX_DIR)
+    RETRIEVAL_BACKEND: str = "postgres"
+    # Diretório dos índices; precisa ser compartilhado pela API e pelos workers
+    VECTOR_INDEX_DIR: str = "vector_index"
+    # Listas visitadas por consulta (mais listas = maior recall, mais latência)
+    VECTOR_INDEX_NPROBE: int = 32
+    # Abaixo desse número de chunks o índice tem uma única lista (busca exata)
+    VECTOR_INDEX_MIN_IVF_SIZE: int = 10_000
+    # Reconstrói o índice quando delta + removidos passam dessa fração da base
+    VECTOR_INDEX_REBUILD_RATIO: float = 0.2
+    # Chunks inseridos acumulados antes de atualizar os índices locais (cada
+    # atualização grava uma nova versão do delta; no fim do documento ou do
+    # intervalo de páginas o resto é aplicado)
+    INDEX_UPDATE_BATCH_SIZE: int = 2000
+    # Busca em duas etapas sobre embeddings quantizados: "" (exata), "int8"
+    # (códigos no índice local) ou "binary" (índice local e coluna
+    # embedding_binary no Postgres); a shortlist de k * fator é reavaliada
+    # com os vetores exatos
+    EMBEDDING_QUANTIZATION: str = ""
+    QUANTIZED_RESCORE_FACTOR: int = 10
+
+    # Busca híbrida: funde os candidatos vetoriais com uma busca BM25 no texto
+    # dos chunks (índice local por workspace em LEXICAL_INDEX_DIR) via RRF
+    RETRIEVAL_HYBRID: bool = False
+    LEXICAL_INDEX_DIR: str = "lexical_index"
+    # Candidatos de cada busca antes da fusão e constante k do RRF
+    HYBRID_CANDIDATES: int = 20
+    HYBRID_RRF_K: int = 60
+    # Re-ranking MMR: candidatos buscados (com embeddings) antes de escolher o
+    # k final (`retrieval_top_k` do workspace) e peso da relevância contra a
+    # diversidade (1 = só relevância). Precisa da migração 005 (sem ela a
+    # busca usa match_document_chunks e o MMR não tem vetores para comparar)
+    RETRIEVAL_MMR: bool = False
+    MMR_CANDIDATES: int = 50
+    MMR_LAMBDA: float = 0.7
+
+    # Métricas Prometheus: porta do servidor de métricas do worker Celery
+    # (0 desativa) e filas do broker Redis cuja profundidade é exportada
+    WORKER_METRICS_PORT: int = 0
+    METRICS_CELERY_QUEUES: str = "celery"
+
+    # Modelo usado para gerar as respostas do chat
+    GENERATION_MODEL: str = "gemini-1.5-flash"
+
+    # Endpoint alternativo do Gemini (ex.: servidor falso local para benchmarks).
+    # Quando definido, o cliente usa o transporte REST apontando para essa URL.
+    GEMINI_API_ENDPOINT: str | None = None
 
     # Configuração da Aplicação
     PROJECT_NAME: str
@@ -0,0 +1,200 @@
+# backend/app/core/metrics.py
+'''
+Prometheus metrics of the API and of the Celery workers.
+
+The API serves them on `/metrics`; a worker serves them on its own port
+(WORKER_METRICS_PORT) once it starts. With several processes per service
+(uvicorn workers, prefork pool) set PROMETHEUS_MULTIPROC_DIR to a shared,
+empty directory so every process writes its samples there and the
+endpoint aggregates them.
+'''
+
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from app.core.config import settings
+
+INGESTION_STAGES = ("download", "extract", "chunk", "embed", "insert")
+
+# Latências por documento vão de segundos a dezenas de minutos
+_DOCUMENT_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+_PAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+INGESTION_STAGE_SECONDS = Histogram(
+    "oraculo_ingestion_stage_seconds", "Time spent in each ingestion stage per document run.",
+    ["stage"], buckets=_DOCUMENT_BUCKETS)
+INGESTION_STAGE_SECONDS_PER_PAGE = Histogram(
+    "oraculo_ingestion_stage_seconds_per_page", "Time spent in each ingestion stage per processed page.",
+    ["stage"], buckets=_PAGE_BUCKETS)
+INGESTION_DOCUMENTS = Counter(
+    "oraculo_ingestion_documents_total", "Document runs finished, by outcome.", ["outcome"])
+INGESTION_PAGES = Counter("oraculo_ingestion_pages_total", "Pages (units) processed.")
+INGESTION_CHUNKS = Counter("oraculo_ingestion_chunks_total", "Chunks inserted.")
+INGESTION_PEAK_RSS_BYTES = Histogram(
+    "oraculo_ingestion_peak_rss_bytes", "Peak resident memory of the worker process during an ingestion task.",
+    buckets=tuple(2 ** power * 1024 * 1024 for power in range(5, 14)))  # 32 MiB .. 8 GiB
+INGESTION_DOWNLOADS = Counter(
+    "oraculo_ingestion_downloads_total", "Files downloaded for ingestion, by where they were kept (memory/disk).",
+    ["route"])
+INGESTION_DOWNLOAD_BYTES = Counter(
+    "oraculo_ingestion_download_bytes_total", "Bytes downloaded for ingestion, by route.", ["route"])
+
+CHAT_STAGE_SECONDS = Histogram(
+    "oraculo_chat_stage_seconds", "Latency of the chat stages (embedding, retrieval, generation, first_token).",
+    ["stage"], buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32))
+GEMINI_REQUESTS = Counter(
+    "oraculo_gemini_requests_total", "Gemini API attempts by kind (embed/generate) and outcome (ok/throttled/error).",
+    ["kind", "outcome"])
+GEMINI_WAIT_SECONDS = Histogram(
+    "oraculo_gemini_rate_limit_wait_seconds", "Time waiting for the Gemini rate limiter, by priority.",
+    ["priority"], buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60))
+CHAT_HISTORY_MESSAGES = Counter(
+    "oraculo_chat_history_messages_total", "Chat history messages written, dropped (queue full) or rejected by the database.",
+    ["outcome"])
+CHAT_HISTORY_FLUSH_ERRORS = Counter(
+    "oraculo_chat_history_flush_errors_total", "Failed chat history flushes (retried later).")
+CHAT_CONTEXT_TOKENS = Histogram(
+    "oraculo_chat_context_tokens", "Estimated tokens of the packed chat context sent to the model.",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000))
+
+
+class StageTimer:
+    '''
+    Accumulates the exclusive time of the ingestion stages of one run.
+
+    Pipeline stages are nested generators (embedding pulls chunks, which
+    pull pages), so the time a stage spends waiting on an inner stage is
+    subtracted from it and each second is counted in one stage only.
+    '''
+
+    def __init__(self):
+        self.seconds: dict[str, float] = defaultdict(float)
+        self._children: list[float] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        started = perf_counter()
+        self._children.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - started
+            self.seconds[name] += elapsed - self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+
+    def iterate(self, name: str, iterable):
+        '''Yields from `iterable`, charging the time to produce each item to `name`.'''
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def as_dict(self) -> dict[str, float]:
+        return {name: round(self.seconds.get(name, 0.0), 3) for name in INGESTION_STAGES}
+
+
+def record_ingestion(timer: StageTimer, outcome: str | None, pages: int = 0, chunks: int = 0,
+                     peak_rss: int | None = None) -> None:
+    '''
+    Observes the stage times of a finished run. `outcome` counts the
+    document ("completed"/"failed"); page-range subtasks pass None and
+    the chord callback counts the document. `peak_rss` is the peak
+    resident memory of the task, in bytes, when it could be measured.
+    '''
+    if outcome is not None:
+        INGESTION_DOCUMENTS.labels(outcome).inc()
+    if peak_rss is not None:
+        INGESTION_PEAK_RSS_BYTES.observe(peak_rss)
+    INGESTION_PAGES.inc(pages)
+    INGESTION_CHUNKS.inc(chunks)
+    for name in INGESTION_STAGES:
+        seconds = timer.seconds.get(name, 0.0)
+        INGESTION_STAGE_SECONDS.labels(name).observe(seconds)
+        if pages and name != "download":
+            INGESTION_STAGE_SECONDS_PER_PAGE.labels(name).observe(seconds / pages)
+
+
+class CeleryQueueCollector:
+    '''Gauge with the number of messages waiting in the Redis broker queues, read at scrape time.'''
+
+    def __init__(self, broker_url: str, queues: tuple[str, ...]):
+        self.broker_url = broker_url
+        self.queues = queues
+        self._client = None
+
+    def collect(self):
+        gauge = GaugeMetricFamily(
+            "oraculo_celery_queue_depth", "Messages waiting in the Celery broker queue.", labels=["queue"])
+        try:
+            if self._client is None:
+                import redis
+                self._client = redis.Redis.from_url(self.broker_url, socket_timeout=1)
+            for queue in self.queues:
+                gauge.add_metric([queue], self._client.llen(queue))
+        except Exception as e:
+            print(f"Could not read Celery queue depth: {e}")
+        yield gauge
+
+
+_default_registry_ready = False
+_queue_collector: CeleryQueueCollector | None = None
+
+
+def _add_queue_collector(registry: CollectorRegistry) -> None:
+    global _queue_collector
+    if not settings.CELERY_BROKER_URL.startswith(("redis://", "rediss://")):
+        return
+    if _queue_collector is None:
+        queues = tuple(queue.strip() for queue in settings.METRICS_CELERY_QUEUES.split(",") if queue.strip())
+        _queue_collector = CeleryQueueCollector(settings.CELERY_BROKER_URL, queues)
+    registry.register(_queue_collector)
+
+
+def _collector_registry() -> CollectorRegistry:
+    global _default_registry_ready
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Modo multiprocesso: agrega os arquivos de todos os processos a cada coleta
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        _add_queue_collector(registry)
+        return registry
+    if not _default_registry_ready:
+        _add_queue_collector(REGISTRY)
+        _default_registry_ready = True
+    return REGISTRY
+
+
+def render_metrics() -> tuple[bytes, str]:
+    '''Body and content type of a metrics scrape.'''
+    return generate_latest(_collector_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int) -> None:
+    '''Serves the metrics of this process (or of all, in multiprocess mode) on `port`.'''
+    start_http_server(port, registry=_collector_registry())
+    print(f"Metrics available on port {port}.")
+
+
+def mark_process_dead(pid: int) -> None:
+    '''Drops the live gauges of a finished process in multiprocess mode.'''
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
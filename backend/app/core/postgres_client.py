@@ -0,0 +1,23 @@
+# backend/app/core/postgres_client.py
+import os
+
+import psycopg2
+
+from app.core.config import settings
+
+_connection = None
+_connection_pid: int | None = None
+
+
+def get_pg_connection():
+    """
+    Retorna a conexão direta com o Postgres (DATABASE_URL) do processo atual.
+
+    Usada para escritas em massa (COPY). A conexão é recriada após um fork
+    ou se tiver sido fechada (ex.: queda de rede).
+    """
+    global _connection, _connection_pid
+    if _connection is None or _connection.closed or _connection_pid != os.getpid():
+        _connection = psycopg2.connect(settings.DATABASE_URL)
+        _connection_pid = os.getpid()
+    return _connection
@@ -0,0 +1,23 @@
+# backend/app/core/redis_client.py
+import os
+
+import redis
+
+from app.core.config import settings
+
+_client: redis.Redis | None = None
+_client_pid: int | None = None
+
+
+def get_redis() -> redis.Redis:
+    """
+    Retorna o cliente Redis do processo atual (REDIS_URL).
+
+    O cliente é recriado após um fork (ex.: workers prefork do Celery),
+    pois o pool de conexões não pode ser compartilhado entre processos.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+        _client_pid = os.getpid()
+    return _client
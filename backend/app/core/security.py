@@ -1,40 +1,131 @@
 # backend/app/core/security.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from supabase import create_client, Client
+from jose import JWTError, jwt
 
 from app.core.config import settings
+from app.core.supabase_client import get_supabase_client
 
 # OAuth2PasswordBearer extrai o token do cabeçalho da requisição.
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
-# Cria uma única instância do cliente Supabase para ser reutilizada.
-supabase_client: Client = create_client(
-    settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+# Supabase Auth assina os access tokens com o JWT secret do projeto (HS256)
+JWT_ALGORITHMS = ["HS256"]
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
+
+class ClaimsCache:
     """
-    Valida um token JWT diretamente com o Supabase para obter o usuário atual.
-    Esta é a abordagem mais segura e robusta.
+    Cache LRU dos claims de tokens já verificados, indexado pelo hash do token.
+
+    Cada entrada vale por `ttl_seconds`, mas nunca além do `exp` do token.
     """
-    credentials_exception = HTTPException(
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> dict | None:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, claims = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return claims
+
+    def set(self, token: str, claims: dict) -> None:
+        expires_at = min(time.time() + self.ttl_seconds, claims["exp"])
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+claims_cache = ClaimsCache(settings.AUTH_CLAIMS_CACHE_TTL_SECONDS, settings.AUTH_CLAIMS_CACHE_MAX_ENTRIES)
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Não foi possível validar as credenciais",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+
+def verify_token(token: str) -> dict:
+    """
+    Verifica assinatura, expiração e audiência do token localmente, sem
+    chamar o Supabase Auth. Retorna os claims, usando o cache quando possível.
+
+    Lança JWTError se o token for inválido.
+    """
+    claims = claims_cache.get(token)
+    if claims is not None:
+        return claims
+
+    claims = jwt.decode(
+        token,
+        settings.SUPABASE_JWT_SECRET,
+        algorithms=JWT_ALGORITHMS,
+        audience=settings.SUPABASE_JWT_AUDIENCE,
+        options={"require_exp": True, "require_sub": True},
+    )
+    claims_cache.set(token, claims)
+    return claims
+
+
+def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
+    """
+    Valida o JWT do Supabase localmente e retorna o id do usuário atual.
+
+    Não detecta tokens revogados antes do `exp` (ex.: logout); para rotas
+    sensíveis a isso use `get_current_user_remote`.
+    """
+    try:
+        return str(verify_token(token)["sub"])
+    except JWTError as e:
+        print(f"DEBUG: Token inválido em get_current_user: {e}")
+        raise _credentials_exception()
+
+
+def get_current_user_remote(token: str = Depends(oauth2_scheme)) -> str:
+    """
+    Valida o token localmente e, em seguida, com o Supabase Auth, que
+    também rejeita sessões revogadas. Custa uma ida ao servidor de auth.
+    """
+    credentials_exception = _credentials_exception()
+
+    # Tokens inválidos são rejeitados sem chamada de rede
+    user_id = get_current_user(token)
+
     try:
-        # Usa a instância do cliente pré-configurada para validar o token
-        user_response = supabase_client.auth.get_user(token)
+        # Usa o cliente compartilhado do processo para validar o token
+        user_response = get_supabase_client().auth.get_user(token)
         user = user_response.user
 
-        if user is None:
+        if user is None or str(user.id) != user_id:
             raise credentials_exception
 
         return str(user.id)
 
     except Exception as e:
-        # Captura qualquer erro (token inválido, expirado, erro de rede, etc.)
-        print(f"DEBUG: Exceção em get_current_user: {e}")
+        # Captura qualquer erro (token revogado, erro de rede, etc.)
+        print(f"DEBUG: Exceção em get_current_user_remote: {e}")
         raise credentials_exception
-    
\ No newline at end of file
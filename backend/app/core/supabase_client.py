@@ -0,0 +1,99 @@
+# backend/app/core/supabase_client.py
+import os
+import threading
+
+import httpx
+from supabase import Client
+from supabase._sync.client import SyncClient
+
+from app.core.config import settings
+
+
+class PooledSupabaseClient(SyncClient):
+    """
+    Cliente Supabase cujos sub-clientes PostgREST e Storage usam, cada um,
+    um `httpx.Client` próprio com pool de conexões e keep-alive configuráveis.
+
+    Um único `httpx_client` em ClientOptions não serve: PostgREST e Storage
+    sobrescreveriam o `base_url` um do outro no mesmo cliente HTTP.
+    """
+
+    @property
+    def postgrest(self):
+        if self._postgrest is None:
+            self._postgrest = self._init_postgrest_client(
+                rest_url=self.rest_url,
+                headers=self.options.headers,
+                schema=self.options.schema,
+                http_client=_pooled_http_client(),
+            )
+        return self._postgrest
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            self._storage = self._init_storage_client(
+                storage_url=self.storage_url,
+                headers=self.options.headers,
+                http_client=_pooled_http_client(),
+            )
+        return self._storage
+
+    def close(self) -> None:
+        """Fecha as conexões HTTP abertas pelos sub-clientes."""
+        for sub_client in (self._postgrest, self._storage):
+            if sub_client is not None:
+                sub_client.session.close()
+
+
+def _pooled_http_client() -> httpx.Client:
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=settings.SUPABASE_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SUPABASE_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.SUPABASE_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=settings.SUPABASE_HTTP_TIMEOUT,
+        follow_redirects=True,
+    )
+
+
+_client: PooledSupabaseClient | None = None
+_client_pid: int | None = None
+_lock = threading.Lock()
+
+
+def get_supabase_client() -> Client:
+    """
+    Retorna o cliente Supabase compartilhado do processo atual.
+
+    Há um cliente por processo (API ou worker do Celery). Após um fork o
+    cliente herdado é descartado sem ser fechado, pois suas conexões
+    pertencem ao processo pai, e um novo é criado no primeiro uso.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                client = PooledSupabaseClient(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+                # Cria os sub-clientes já aqui para evitar corrida entre threads
+                client.postgrest, client.storage
+                _client, _client_pid = client, os.getpid()
+    return _client
+
+
+def close_supabase_client() -> None:
+    """Fecha o cliente do processo atual (ex.: no shutdown da API)."""
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client, _client_pid = None, None
+
+
+def _reset_after_fork() -> None:
+    global _client, _client_pid, _lock
+    _client, _client_pid, _lock = None, None, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,13 +1,21 @@
-from supabase import create_client, Client
+from postgrest.exceptions import APIError
+from supabase import Client
 from app.core.config import settings
-from app.schemas.workspace_schemas import WorkspaceCreate
+from app.core.supabase_client import get_supabase_client
+from app.schemas.document_schemas import DocumentRead
+from app.schemas.workspace_schemas import WorkspaceCreate, WorkspaceRead
 import uuid
 
-def get_supabase_client() -> Client:
-    """
-    Cria e retorna um cliente Supabase usando as configurações da aplicação.
-    """
-    return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+# Projeção das listagens: só as colunas devolvidas pela API
+WORKSPACE_COLUMNS = ",".join(WorkspaceRead.model_fields)
+DOCUMENT_COLUMNS = ",".join(DocumentRead.model_fields)
+# Colunas de migrações posteriores (005): a listagem as omite se o banco ainda não as tem
+OPTIONAL_WORKSPACE_COLUMNS = ("retrieval_top_k",)
+BASE_WORKSPACE_COLUMNS = ",".join(
+    name for name in WorkspaceRead.model_fields if name not in OPTIONAL_WORKSPACE_COLUMNS)
+# Código do Postgres para coluna inexistente
+_UNDEFINED_COLUMN = "42703"
+_workspace_columns = WORKSPACE_COLUMNS
 
 def create_workspace(db: Client, *, workspace_in: WorkspaceCreate, user_id: uuid.UUID) -> dict | None:
     """
@@ -26,7 +34,8 @@ def create_workspace(db: Client, *, workspace_in: WorkspaceCreate, user_id: uuid
         return None # Retorna None para indicar duplicidade
 
     # Se não houver duplicata, prossiga com a criação
-    workspace_data = workspace_in.model_dump()
+    # Campos vazios ficam com o padrão do banco (e colunas opcionais ausentes não quebram o insert)
+    workspace_data = workspace_in.model_dump(exclude_none=True)
     workspace_data['user_id'] = str(user_id)
 
     response = db.from_("workspaces").insert(workspace_data).execute()
@@ -38,32 +47,57 @@ def create_workspace(db: Client, *, workspace_in: WorkspaceCreate, user_id: uuid
     # mas é uma boa prática retornar None.
     return None
 
-def get_workspaces_by_user(db: Client, *, user_id: uuid.UUID) -> list[dict]:
+def _keyset_select(query_factory, limit: int | None, after: int | None) -> list[dict]:
     """
-    Busca e retorna todos os workspaces pertencentes a um usuário específico.
+    Executa uma consulta paginada por id crescente (keyset: `id > after`).
+
+    Com `limit`, busca uma página; sem `limit`, percorre todas as páginas de
+    LISTING_PAGE_SIZE linhas (o PostgREST limita o número de linhas por resposta).
     """
-    response = db.from_("workspaces").select("*").eq("user_id", str(user_id)).execute()
-    return response.data or []
+    page_size = limit or settings.LISTING_PAGE_SIZE
+    rows: list[dict] = []
+    while True:
+        query = query_factory().order("id").limit(page_size)
+        if after is not None:
+            query = query.gt("id", after)
+        page = query.execute().data or []
+        rows.extend(page)
+        if limit is not None or len(page) < page_size:
+            return rows
+        after = page[-1]['id']
 
-def get_documents_by_workspace(db: Client, *, workspace_id: int, user_id: uuid.UUID) -> list[dict]:
+
+def get_workspaces_by_user(db: Client, *, user_id: uuid.UUID, limit: int | None = None,
+                           after: int | None = None) -> list[dict]:
     """
-    Busca e retorna todos os documentos pertencentes a um workspace específico,
-    garantindo que o workspace pertença ao usuário.
+    Busca os workspaces pertencentes a um usuário, em ordem de id, com
+    apenas as colunas de `WorkspaceRead`.
     """
-    # Primeiro, verificamos se o workspace pertence ao usuário para segurança
-    ws_response = db.from_("workspaces")\
-        .select("id")\
-        .eq("id", str(workspace_id))\
-        .eq("user_id", str(user_id))\
-        .execute()
+    global _workspace_columns
+    try:
+        return _keyset_select(
+            lambda: db.from_("workspaces").select(_workspace_columns).eq("user_id", str(user_id)),
+            limit, after)
+    except APIError as e:
+        if e.code != _UNDEFINED_COLUMN or _workspace_columns == BASE_WORKSPACE_COLUMNS:
+            raise
+        print(f"Workspace columns missing (migration not applied?), listing without them: {e}")
+        _workspace_columns = BASE_WORKSPACE_COLUMNS
+        return _keyset_select(
+            lambda: db.from_("workspaces").select(_workspace_columns).eq("user_id", str(user_id)),
+            limit, after)
 
-    if not ws_response.data:
-        return [] # Retorna vazio se o usuário não for dono do workspace
+def get_documents_by_workspace(db: Client, *, workspace_id: int, user_id: uuid.UUID, limit: int | None = None,
+                               after: int | None = None) -> list[dict]:
+    """
+    Busca os documentos de um workspace específico, em ordem de id, com
+    apenas as colunas de `DocumentRead`.
 
-    # Se o usuário for o dono, busca os documentos
-    doc_response = db.from_("documents")\
-        .select("*")\
-        .eq("workspace_id", str(workspace_id))\
-        .execute()
-        
-    return doc_response.data or []
+    A posse é verificada na mesma consulta: os documentos são gravados com o
+    `user_id` do dono do workspace, então filtrar por ele retorna [] quando
+    o workspace não pertence ao usuário.
+    """
+    return _keyset_select(
+        lambda: db.from_("documents").select(DOCUMENT_COLUMNS)
+        .eq("workspace_id", str(workspace_id)).eq("user_id", str(user_id)),
+        limit, after)
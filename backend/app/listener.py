@@ -1,89 +1,178 @@
 from dotenv import load_dotenv
 
 import os
+import random
 import time
 import select
 import psycopg2
 import psycopg2.extensions
+
+# Load environment variables from .env file in the backend directory
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
 # Import the Celery app instance from the new central location
-from app.celery_instance import celery_app
+from app.celery_instance import celery_app  # noqa: E402
+from app.core.config import settings  # noqa: E402
+
+CHANNEL_NAME = 'new_document_channel'
+PROCESS_DOCUMENT_TASK = 'app.tasks.process_document'
 
 
 def get_db_connection():
     """Establishes and returns a connection to the PostgreSQL database."""
-    # Load environment variables from .env file in the backend directory
-    dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
-    load_dotenv(dotenv_path=dotenv_path)
+    # Connect using the DATABASE_URL environment variable
+    conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+    conn.set_isolation_level(
+        psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    print("Database connection established successfully.")
+    return conn
+
+
+class Dispatcher:
+    """
+    Publishes process_document tasks in batches over one broker connection.
+
+    Duplicates are dropped only within a batch: a notification is the only
+    signal that a document was (re)queued, so a document notified again in
+    a later batch (re-upload, re-queue) is dispatched again. A document
+    dispatched twice is processed once: `process_document` claims it
+    (PENDING -> PROCESSING) and the second task finds it taken.
+    """
+
+    def dispatch(self, document_ids) -> list[int]:
+        """Dispatches each id once, in order. Returns the dispatched ids."""
+        batch = list(dict.fromkeys(document_ids))
+        if not batch:
+            return []
+
+        # Um único producer (e conexão com o broker) para o lote inteiro
+        with celery_app.producer_or_acquire() as producer:
+            for doc_id in batch:
+                celery_app.send_task(PROCESS_DOCUMENT_TASK, args=[doc_id], producer=producer)
+        return batch
 
+
+def parse_payload(payload: str) -> int | None:
+    """The payload is the document_id."""
     try:
-        # Connect using the DATABASE_URL environment variable
-        conn = psycopg2.connect(os.getenv('DATABASE_URL'))
-        conn.set_isolation_level(
-            psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-        print("Database connection established successfully.")
-        return conn
-    except psycopg2.OperationalError as e:
-        print(f"Error connecting to the database: {e}")
-        # Retry connection after a delay
-        time.sleep(10)
-        raise
-
-
-def listen_for_notifications():
+        return int(payload)
+    except (ValueError, TypeError) as e:
+        print(f"Error processing notification payload '{payload}': {e}")
+        return None
+
+
+def fetch_pending_documents(conn) -> list[int]:
+    """Ids of documents still waiting for processing (status PENDING)."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT id FROM documents WHERE status = 'PENDING' ORDER BY id")
+        return [row[0] for row in cursor.fetchall()]
+
+
+def discard_backfilled(conn, backfilled: list[int]) -> int:
+    """
+    Drops the notifications already queued for documents the backfill
+    just dispatched (they were PENDING when it ran). Returns how many.
+    """
+    conn.poll()
+    backfilled = set(backfilled)
+    kept = [notify for notify in conn.notifies if parse_payload(notify.payload) not in backfilled]
+    discarded = len(conn.notifies) - len(kept)
+    conn.notifies[:] = kept
+    return discarded
+
+
+def drain_batch(conn) -> list[int]:
+    """
+    Collects the notifications available now plus those arriving within
+    LISTENER_BATCH_WINDOW_MS, up to LISTENER_MAX_BATCH ids.
+    """
+    document_ids = []
+    deadline = time.monotonic() + settings.LISTENER_BATCH_WINDOW_MS / 1000
+    while True:
+        conn.poll()
+        while conn.notifies and len(document_ids) < settings.LISTENER_MAX_BATCH:
+            doc_id = parse_payload(conn.notifies.pop(0).payload)
+            if doc_id is not None:
+                document_ids.append(doc_id)
+
+        remaining = deadline - time.monotonic()
+        if len(document_ids) >= settings.LISTENER_MAX_BATCH or remaining <= 0:
+            return document_ids
+        # Espera mais notificações até o fim da janela
+        select.select([conn], [], [], remaining)
+
+
+def listen_for_notifications(dispatcher: Dispatcher, on_connected=None):
     """Listens for notifications on a PostgreSQL channel and dispatches Celery tasks."""
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    channel_name = 'new_document_channel'
-    cursor.execute(f"LISTEN {channel_name}")
-    print(f"Waiting for notifications on channel: {channel_name}...")
-
     try:
+        cursor.execute(f"LISTEN {CHANNEL_NAME}")
+        print(f"Waiting for notifications on channel: {CHANNEL_NAME}...")
+
+        # LISTEN já está ativo: o que chegar durante o backfill fica na fila,
+        # e o que chegou enquanto estávamos desconectados é recuperado aqui.
+        # As notificações já enfileiradas desses documentos são descartadas
+        backfilled = dispatcher.dispatch(fetch_pending_documents(conn))
+        discarded = discard_backfilled(conn, backfilled)
+        print(f"Backfill: {len(backfilled)} pending documents dispatched, "
+              f"{discarded} queued notifications already covered.")
+        if on_connected is not None:
+            on_connected()
+
         while True:
-            # Use select to wait for notifications without blocking indefinitely
-            if select.select([conn], [], [], 60) == ([], [], []):
-                # print("Timeout: No notification received in the last 60 seconds. Still listening...")
+            # Use select to wait for notifications without blocking indefinitely.
+            # Notificações que sobraram de um lote cheio já estão em conn.notifies
+            # e não geram atividade no socket: são drenadas sem esperar
+            if not conn.notifies and select.select([conn], [], [], 60) == ([], [], []):
                 continue
 
-            conn.poll()
-            while conn.notifies:
-                notification = conn.notifies.pop(0)
-                print(
-                    f"\nReceived notification: PID={notification.pid}, Channel='{notification.channel}'")
-
-                try:
-                    # The payload is the document_id
-                    document_id = int(notification.payload)
-                    print(
-                        f"Extracted document_id: {document_id}. Dispatching task...")
-
-                    # Dispatch the Celery task using the shared app instance
-                    celery_app.send_task(
-                        'app.tasks.process_document', args=[document_id])
-
-                    print(
-                        f"Task for document_id {document_id} dispatched successfully.")
-                except (ValueError, TypeError) as e:
-                    print(
-                        f"Error processing notification payload '{notification.payload}': {e}")
-
-    except KeyboardInterrupt:
-        print("Listener stopped by user.")
+            document_ids = drain_batch(conn)
+            if not document_ids:
+                continue
+            dispatched = dispatcher.dispatch(document_ids)
+            print(f"Received {len(document_ids)} notifications, dispatched {len(dispatched)} tasks: {dispatched}")
+
     finally:
         print("Closing database connection.")
         cursor.close()
         conn.close()
 
 
+class Backoff:
+    """Exponential backoff with full jitter, reset after a healthy connection."""
+
+    def __init__(self, initial: float, maximum: float):
+        self.initial = initial
+        self.maximum = maximum
+        self.attempt = 0
+
+    def reset(self) -> None:
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        delay = min(self.maximum, self.initial * 2 ** self.attempt)
+        self.attempt += 1
+        return random.uniform(delay / 2, delay)
+
+
 if __name__ == "__main__":
     print("Starting database notification listener...")
+    dispatcher = Dispatcher()
+    backoff = Backoff(settings.LISTENER_BACKOFF_INITIAL_SECONDS, settings.LISTENER_BACKOFF_MAX_SECONDS)
     while True:
         try:
-            listen_for_notifications()
+            listen_for_notifications(dispatcher, on_connected=backoff.reset)
+        except KeyboardInterrupt:
+            print("Listener stopped by user.")
+            break
         except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
-            print(f"Connection lost: {e}. Reconnecting in 10 seconds...")
-            time.sleep(10)
+            delay = backoff.next_delay()
+            print(f"Connection lost: {e}. Reconnecting in {delay:.1f} seconds...")
+            time.sleep(delay)
         except Exception as e:
+            delay = backoff.next_delay()
             print(
-                f"An unexpected error occurred: {e}. Restarting in 10 seconds...")
-            time.sleep(10)
+                f"An unexpected error occurred: {e}. Restarting in {delay:.1f} seconds...")
+            time.sleep(delay)
@@ -1,11 +1,31 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
+from starlette.concurrency import run_in_threadpool
 from app.core.config import settings
+from app.core.metrics import render_metrics
+from app.core.supabase_client import close_supabase_client
 from app.api.v1.api import api_router
 from fastapi.middleware.cors import CORSMiddleware
+from app.services.chat_history import close_chat_history, get_chat_history
+from app.services.embedding_cache import get_embedding_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Inicia a gravação do histórico (na fila do Redis pode haver mensagens pendentes)
+    get_chat_history().start()
+    yield
+    # Grava o histórico ainda na fila antes de fechar o cliente Supabase
+    await run_in_threadpool(close_chat_history)
+    # Fecha as conexões HTTP mantidas pelo cliente Supabase compartilhado
+    close_supabase_client()
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
 )
 
 # Configuração do CORS
@@ -17,6 +37,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cabeçalhos das listagens lidos pelo frontend (paginação e requisições condicionais)
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 @app.get("/api/v1/health", tags=["Health"])
@@ -24,5 +46,19 @@ def health_check():
     """Verifica se a API está funcionando."""
     return {"status": "ok"}
 
+@app.get("/api/v1/health/embedding-cache", tags=["Health"])
+def embedding_cache_stats():
+    """Retorna os contadores de acerto/falha do cache de embeddings."""
+    cache = get_embedding_cache()
+    if cache is None:
+        return {"backend": "none"}
+    return cache.stats()
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métricas no formato Prometheus (ingestão, chat e fila do Celery)."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # Inclui todas as rotas da nossa API definidas no api_router
 app.include_router(api_router, prefix=settings.API_V1_STR)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 import uuid
 
@@ -6,6 +6,8 @@ import uuid
 class WorkspaceBase(BaseModel):
     name: str
     system_prompt: str | None = None
+    # Chunks usados no contexto do chat (vazio usa CONTEXT_CANDIDATES)
+    retrieval_top_k: int | None = Field(None, ge=1, le=50)
 
 # Schema para Criação: O que a API espera receber no POST
 class WorkspaceCreate(WorkspaceBase):
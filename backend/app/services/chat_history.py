@@ -0,0 +1,388 @@
+# backend/app/services/chat_history.py
+'''
+Write-behind persistence of the chat history (`chat_messages`).
+
+The chat endpoints only enqueue the question/answer pair; a background
+thread per process inserts the queued messages in bulk, as soon as
+CHAT_HISTORY_BATCH_SIZE messages are waiting or every
+CHAT_HISTORY_FLUSH_SECONDS. Batches that fail with a transient error
+(network, timeout, database unavailable) stay queued and are retried with
+backoff. A batch the database rejects for good (invalid value, violated
+constraint) is split in halves until the rejected messages are isolated;
+those are dropped (memory) or moved to a dead-letter list (redis) and the
+rest is written, so one bad message never blocks the queue.
+`close_chat_history` (API shutdown) flushes what is left.
+
+Backends (CHAT_HISTORY_BACKEND):
+
+- "memory": queue in the process. Fast, but messages still queued when
+  the process dies without a clean shutdown are lost; the queue is
+  capped at CHAT_HISTORY_MAX_PENDING (oldest dropped, with a log line).
+- "redis": queue in a Redis list shared by all API processes, so it
+  survives crashes and restarts; one process at a time flushes it
+  (guarded by a lock key, renewed while the flush runs). The list is
+  capped at CHAT_HISTORY_MAX_PENDING too, but new messages are the ones
+  dropped: the flusher trims the list by position. Rejected messages go
+  to `chat_history:v1:dead_letter` (same cap). Delivery is
+  at-least-once: a crash between an insert and the trim of the list
+  re-inserts those messages.
+- "sync": inserts inline, as before (one round trip per answer).
+
+Each message carries the time it was enqueued in `created_at`, so the
+history keeps its order and timestamps however late it is written.
+'''
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+
+import redis
+from postgrest.exceptions import APIError
+from supabase import Client
+
+from app.core.config import settings
+from app.core.metrics import CHAT_HISTORY_FLUSH_ERRORS, CHAT_HISTORY_MESSAGES
+from app.core.redis_client import get_redis
+from app.core.supabase_client import get_supabase_client
+
+_QUEUE_KEY = "chat_history:v1:pending"
+_LOCK_KEY = "chat_history:v1:flush_lock"
+_DEAD_LETTER_KEY = "chat_history:v1:dead_letter"
+_MAX_BACKOFF_SECONDS = 60.0
+# Classes de SQLSTATE de erros do próprio dado (22: valor inválido, 23: restrição
+# violada): repetir o insert não adianta. O resto (rede, timeout, 5xx) é transitório.
+_PERMANENT_SQLSTATE_CLASSES = ("22", "23")
+
+# Enfileira só se couber: ARGV[1] é o limite, o resto são as mensagens
+_PUSH_BOUNDED = """
+if redis.call('LLEN', KEYS[1]) + #ARGV - 1 > tonumber(ARGV[1]) then return -1 end
+return redis.call('RPUSH', KEYS[1], unpack(ARGV, 2))
+"""
+# Renova/libera a trava só se ainda for nossa
+_RENEW_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+def chat_message_rows(workspace_id: int, user_id: str, question: str, answer: str) -> list[dict]:
+    '''The `chat_messages` rows of one question and its answer.'''
+    created_at = datetime.now(timezone.utc).isoformat()
+    return [
+        {'role': 'user', 'content': question, 'workspace_id': workspace_id, 'user_id': user_id,
+         'created_at': created_at},
+        {'role': 'assistant', 'content': answer, 'workspace_id': workspace_id, 'user_id': user_id,
+         'created_at': created_at},
+    ]
+
+
+def insert_messages(db: Client, rows: list[dict]) -> None:
+    db.table('chat_messages').insert(rows).execute()
+
+
+def is_permanent_error(error: Exception) -> bool:
+    '''True when retrying the same rows cannot succeed (the database rejects the data itself).'''
+    if isinstance(error, json.JSONDecodeError):
+        return True
+    code = error.code if isinstance(error, APIError) else None
+    return isinstance(code, str) and code[:2] in _PERMANENT_SQLSTATE_CLASSES
+
+
+def insert_isolating(insert, rows: list, settle) -> None:
+    '''
+    Inserts `rows` with `insert(rows)`, splitting the batch in halves when
+    the database rejects it for good, down to the single rejected rows.
+
+    The rows are settled in order: `settle(count, rejected)` is called for
+    each leading run that was written (or for one rejected row), so the
+    caller can dequeue it right away and a transient error (raised) leaves
+    only unwritten rows queued.
+    '''
+    try:
+        insert(rows)
+    except Exception as e:
+        if not is_permanent_error(e):
+            raise
+        if len(rows) == 1:
+            print(f"Chat history: dropping a message the database rejects: {e}")
+            settle(rows, True)
+            return
+        middle = len(rows) // 2
+        insert_isolating(insert, rows[:middle], settle)
+        insert_isolating(insert, rows[middle:], settle)
+        return
+    settle(rows, False)
+
+
+class SyncChatHistory:
+    '''Inserts each question/answer pair inline.'''
+
+    def record(self, workspace_id: int, user_id: str, question: str, answer: str) -> None:
+        rows = chat_message_rows(workspace_id, user_id, question, answer)
+        insert_messages(get_supabase_client(), rows)
+        CHAT_HISTORY_MESSAGES.labels("written").inc(len(rows))
+
+    def start(self) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class _WriteBehindHistory:
+    '''
+    Base of the queued backends: a daemon thread that calls `_flush_once`
+    when the batch is full or the interval has passed, backing off after
+    failures. Subclasses implement `_push`, `_pending` and `_flush_once`.
+    '''
+
+    def __init__(self, batch_size: int, flush_seconds: float):
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._thread_lock = threading.Lock()
+        self._failures = 0
+
+    def record(self, workspace_id: int, user_id: str, question: str, answer: str) -> None:
+        '''Enqueues the question/answer pair; returns without waiting on the database.'''
+        self._push(chat_message_rows(workspace_id, user_id, question, answer))
+        self.start()
+        if self._pending() >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        '''Starts the flusher thread (also done by the first `record`).'''
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="chat-history", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            # Depois de falhas espera mais (backoff exponencial limitado)
+            delay = self.flush_seconds if not self._failures else \
+                min(self.flush_seconds * 2 ** self._failures, _MAX_BACKOFF_SECONDS)
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            if self._closed.is_set():
+                return
+            self.flush()
+
+    def flush(self) -> None:
+        '''Writes every queued batch; stops at the first transient failure (retried later).'''
+        while True:
+            try:
+                taken = self._flush_once()
+            except Exception as e:
+                self._failures += 1
+                CHAT_HISTORY_FLUSH_ERRORS.inc()
+                print(f"Could not write chat history (attempt {self._failures}), will retry: {e}")
+                return
+            self._failures = 0
+            if taken < self.batch_size:
+                return
+
+    def close(self) -> None:
+        '''Stops the flusher thread and writes what is still queued (shutdown).'''
+        self._closed.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for attempt in range(settings.CHAT_HISTORY_SHUTDOWN_RETRIES):
+            self.flush()
+            if not self._pending():
+                return
+            time.sleep(min(2 ** attempt, 5))
+        self._abandon()
+
+    def _abandon(self) -> None:
+        pending = self._pending()
+        if pending:
+            print(f"Chat history: {pending} messages could not be written before shutdown.")
+
+    def _push(self, rows: list[dict]) -> None:
+        raise NotImplementedError
+
+    def _pending(self) -> int:
+        raise NotImplementedError
+
+    def _flush_once(self) -> int:
+        '''Writes the head of the queue; returns how many messages left it (written or rejected).'''
+        raise NotImplementedError
+
+
+class MemoryChatHistory(_WriteBehindHistory):
+    '''Write-behind queue kept in the memory of the process.'''
+
+    def __init__(self, batch_size: int, flush_seconds: float, max_pending: int):
+        super().__init__(batch_size, flush_seconds)
+        self.max_pending = max_pending
+        self._queue: deque[dict] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _push(self, rows: list[dict]) -> None:
+        with self._lock:
+            self._queue.extend(rows)
+            overflow = len(self._queue) - self.max_pending
+            for _ in range(max(0, overflow)):
+                self._queue.popleft()
+        if overflow > 0:
+            CHAT_HISTORY_MESSAGES.labels("dropped").inc(overflow)
+            print(f"Chat history queue full: dropped the {overflow} oldest messages.")
+
+    def _pending(self) -> int:
+        return len(self._queue)
+
+    def _flush_once(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch = [self._queue[i] for i in range(min(self.batch_size, len(self._queue)))]
+            if not batch:
+                return 0
+            db = get_supabase_client()
+            insert_isolating(lambda rows: insert_messages(db, rows), batch, self._settle)
+            return len(batch)
+
+    def _settle(self, rows: list[dict], rejected: bool) -> None:
+        # Só remove da fila depois de gravar; falhas transitórias mantêm o resto do lote
+        with self._lock:
+            for row in rows:
+                # O lote pode ter sido descartado da fila (cheia) durante o insert
+                if self._queue and self._queue[0] is row:
+                    self._queue.popleft()
+        CHAT_HISTORY_MESSAGES.labels("rejected" if rejected else "written").inc(len(rows))
+
+    def _abandon(self) -> None:
+        super()._abandon()
+        CHAT_HISTORY_MESSAGES.labels("dropped").inc(len(self._queue))
+
+
+class RedisChatHistory(_WriteBehindHistory):
+    '''Write-behind queue in a Redis list shared by every API process.'''
+
+    def __init__(self, batch_size: int, flush_seconds: float, max_pending: int):
+        super().__init__(batch_size, flush_seconds)
+        self.max_pending = max_pending
+
+    def _push(self, rows: list[dict]) -> None:
+        try:
+            queued = get_redis().eval(_PUSH_BOUNDED, 1, _QUEUE_KEY, self.max_pending,
+                                      *(json.dumps(row, ensure_ascii=False) for row in rows))
+        except redis.RedisError as e:
+            # Sem Redis, grava direto para não perder o histórico
+            print(f"Chat history queue unavailable, writing inline: {e}")
+            insert_messages(get_supabase_client(), rows)
+            CHAT_HISTORY_MESSAGES.labels("written").inc(len(rows))
+            return
+        if queued < 0:
+            CHAT_HISTORY_MESSAGES.labels("dropped").inc(len(rows))
+            print(f"Chat history queue full: dropped {len(rows)} new messages.")
+
+    def _pending(self) -> int:
+        try:
+            return get_redis().llen(_QUEUE_KEY)
+        except redis.RedisError:
+            return 0
+
+    def _flush_once(self) -> int:
+        client = get_redis()
+        token = uuid.uuid4().hex
+        lock_ms = int(settings.CHAT_HISTORY_LOCK_SECONDS * 1000)
+        # Trava com expiração: só um processo grava o início da lista por vez
+        if not client.set(_LOCK_KEY, token, nx=True, px=lock_ms):
+            return 0
+        # Renovada enquanto o flush roda: um insert lento não deixa outro processo
+        # pegar a trava e gravar o mesmo lote
+        done, lost = threading.Event(), threading.Event()
+        renewer = threading.Thread(target=self._renew_lock, args=(client, token, lock_ms, done, lost),
+                                   name="chat-history-lock", daemon=True)
+        renewer.start()
+        try:
+            batch = client.lrange(_QUEUE_KEY, 0, self.batch_size - 1)
+            if not batch:
+                return 0
+            db = get_supabase_client()
+
+            def settle(items: list[bytes], rejected: bool) -> None:
+                if lost.is_set():
+                    raise RuntimeError("chat history flush lock lost; leaving the rest of the batch queued")
+                pipe = client.pipeline()
+                pipe.ltrim(_QUEUE_KEY, len(items), -1)
+                if rejected:
+                    pipe.rpush(_DEAD_LETTER_KEY, *items)
+                    pipe.ltrim(_DEAD_LETTER_KEY, -self.max_pending, -1)
+                pipe.execute()
+                CHAT_HISTORY_MESSAGES.labels("rejected" if rejected else "written").inc(len(items))
+
+            insert_isolating(lambda items: insert_messages(db, [json.loads(item) for item in items]),
+                             batch, settle)
+            return len(batch)
+        finally:
+            done.set()
+            renewer.join()
+            client.eval(_RELEASE_LOCK, 1, _LOCK_KEY, token)
+
+    @staticmethod
+    def _renew_lock(client, token: str, lock_ms: int, done: threading.Event, lost: threading.Event) -> None:
+        while not done.wait(lock_ms / 3000):
+            try:
+                renewed = client.eval(_RENEW_LOCK, 1, _LOCK_KEY, token, lock_ms)
+            except redis.RedisError as e:
+                print(f"Could not renew the chat history flush lock: {e}")
+                renewed = 0
+            if not renewed:
+                lost.set()
+                return
+
+    def _abandon(self) -> None:
+        pending = self._pending()
+        if pending:
+            print(f"Chat history: {pending} messages left in the Redis queue for the other processes.")
+
+
+_history: SyncChatHistory | MemoryChatHistory | RedisChatHistory | None = None
+_history_pid: int | None = None
+
+
+def get_chat_history() -> SyncChatHistory | MemoryChatHistory | RedisChatHistory:
+    '''Returns the configured chat history writer of the current process.'''
+    global _history, _history_pid
+    if _history is None or _history_pid != os.getpid():
+        backend = settings.CHAT_HISTORY_BACKEND.lower()
+        if backend == "sync":
+            _history = SyncChatHistory()
+        elif backend == "memory":
+            _history = MemoryChatHistory(settings.CHAT_HISTORY_BATCH_SIZE, settings.CHAT_HISTORY_FLUSH_SECONDS,
+                                         settings.CHAT_HISTORY_MAX_PENDING)
+        elif backend == "redis":
+            _history = RedisChatHistory(settings.CHAT_HISTORY_BATCH_SIZE, settings.CHAT_HISTORY_FLUSH_SECONDS,
+                                        settings.CHAT_HISTORY_MAX_PENDING)
+        else:
+            raise ValueError(f"Unknown CHAT_HISTORY_BACKEND: {settings.CHAT_HISTORY_BACKEND}")
+        _history_pid = os.getpid()
+    return _history
+
+
+def close_chat_history() -> None:
+    '''Flushes the queued messages of the current process (API shutdown).'''
+    global _history, _history_pid
+    if _history is not None and _history_pid == os.getpid():
+        _history.close()
+    _history, _history_pid = None, None
@@ -0,0 +1,128 @@
+# backend/app/services/chunking.py
+'''
+Offset-based, sentence-aware chunking over a stream of pages.
+
+Pages are appended to a rolling buffer and chunks are cut as (start, end)
+offsets into it, preferring paragraph breaks, then sentence ends, then
+whitespace, within a token budget. Chunks may span pages and do not
+overlap. Text is only copied once per chunk, when its content is sliced.
+
+Each chunk records its page range and the character offsets inside its
+first and last page:
+
+    {'page_number': 3, 'page_start': 3, 'char_start': 812,
+     'page_end': 4, 'char_end': 410}
+
+`page_number` (the first page) is kept for the checkpoint logic.
+'''
+
+import re
+from bisect import bisect_right
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+
+from app.core.config import settings
+
+# Separador entre páginas: conta como quebra de parágrafo
+PAGE_SEPARATOR = "\n\n"
+# Chunks com menos caracteres úteis que isso são descartados
+MIN_CHUNK_CHARS = 10
+
+_BREAK_PATTERNS = (
+    re.compile(r"\n[ \t]*\n\s*"),                   # parágrafo
+    re.compile(r"(?<=[.!?;:])[\"'”’)\]]*\s+"),      # fim de frase
+    re.compile(r"\s+"),                             # palavra
+)
+
+
+@dataclass
+class Chunk:
+    page_number: int
+    content: str
+    metadata: dict = field(default_factory=dict)
+
+
+def _find_break(buffer: str, lowest: int, limit: int) -> int:
+    '''Returns the best cut position in buffer[lowest:limit], or `limit` if none.'''
+    for pattern in _BREAK_PATTERNS:
+        last = None
+        for last in pattern.finditer(buffer, lowest, limit):
+            pass
+        if last is not None:
+            return last.end()
+    return limit
+
+
+def iter_document_chunks(
+    pages: Iterable[tuple[int, str]],
+    *,
+    max_tokens: int | None = None,
+    min_tokens: int | None = None,
+) -> Iterator[Chunk]:
+    '''
+    Yields chunks of roughly `min_tokens`..`max_tokens` tokens from (page_number, text) pairs.
+
+    Token counts are estimated as characters / CHUNK_CHARS_PER_TOKEN. The
+    buffer holds at most one chunk budget plus the current page.
+    '''
+    chars_per_token = settings.CHUNK_CHARS_PER_TOKEN
+    max_chars = (max_tokens or settings.CHUNK_MAX_TOKENS) * chars_per_token
+    min_chars = min((min_tokens or settings.CHUNK_MIN_TOKENS) * chars_per_token, max_chars)
+
+    buffer = ""
+    # Início de cada página no buffer, em paralelo com os números das páginas
+    page_starts: list[int] = []
+    page_numbers: list[int] = []
+    start = 0
+
+    for page_number, page_text in pages:
+        # Compacta o buffer: descarta o texto já emitido e páginas sem texto pendente
+        if start:
+            keep_from = max(bisect_right(page_starts, start) - 1, 0)
+            del page_starts[:keep_from], page_numbers[:keep_from]
+            page_starts = [offset - start for offset in page_starts]
+            buffer = buffer[start:]
+            start = 0
+
+        page_starts.append(len(buffer))
+        page_numbers.append(page_number)
+        buffer += page_text + PAGE_SEPARATOR
+
+        while len(buffer) - start > max_chars:
+            end = _find_break(buffer, start + min_chars, start + max_chars)
+            chunk = _make_chunk(buffer, page_starts, page_numbers, start, end)
+            if chunk is not None:
+                yield chunk
+            start = end
+
+    while start < len(buffer):
+        end = len(buffer)
+        if end - start > max_chars:
+            end = _find_break(buffer, start + min_chars, start + max_chars)
+        chunk = _make_chunk(buffer, page_starts, page_numbers, start, end)
+        if chunk is not None:
+            yield chunk
+        start = end
+
+
+def _make_chunk(
+    buffer: str, page_starts: list[int], page_numbers: list[int], start: int, end: int,
+) -> Chunk | None:
+    '''Builds a chunk for buffer[start:end] without surrounding whitespace.'''
+    while start < end and buffer[start].isspace():
+        start += 1
+    while end > start and buffer[end - 1].isspace():
+        end -= 1
+    if end - start <= MIN_CHUNK_CHARS:
+        return None
+
+    first = bisect_right(page_starts, start) - 1
+    last = bisect_right(page_starts, end - 1) - 1
+    metadata = {
+        'page_number': page_numbers[first],
+        'page_start': page_numbers[first],
+        'char_start': start - page_starts[first],
+        'page_end': page_numbers[last],
+        'char_end': end - page_starts[last],
+    }
+    return Chunk(page_numbers[first], buffer[start:end], metadata)
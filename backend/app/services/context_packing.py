@@ -0,0 +1,127 @@
+# backend/app/services/context_packing.py
+'''
+Assembles the chat context from the retrieved chunks.
+
+Retrieval returns chunks ranked by relevance, often several from the
+same page (neighbouring chunks, chunks of older ingestions that overlap
+by a few hundred characters, the same text in two uploaded copies).
+Instead of pasting them side by side, the context is packed:
+
+- near-duplicates of a chunk already taken are dropped (word shingles
+  of the candidate contained in a taken chunk >= CONTEXT_DEDUP_THRESHOLD);
+- chunks of the same document that share a page are merged into one
+  passage, in document order, with the text they overlap written once;
+- chunks are taken in relevance order while the passages fit in
+  CONTEXT_TOKEN_BUDGET (estimated as characters / CHUNK_CHARS_PER_TOKEN).
+  The most relevant chunk is always taken.
+
+Passages come out ordered by their most relevant chunk.
+'''
+
+import re
+from dataclasses import dataclass, field
+
+from app.core.config import settings
+
+# Janela usada para achar texto repetido entre o fim de um chunk e o início do seguinte
+_MAX_OVERLAP_CHARS = 1000
+_MIN_OVERLAP_CHARS = 20
+_SHINGLE_WORDS = 3
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class Passage:
+    '''Merged text of one or more chunks of the same document and pages.'''
+    document_id: int | None
+    document_name: str | None
+    rank: int
+    chunks: list[dict] = field(default_factory=list)
+    text: str = ""
+
+    @property
+    def page_start(self) -> int | None:
+        return min((_page_range(chunk)[0] for chunk in self.chunks), default=None)
+
+    @property
+    def page_end(self) -> int | None:
+        return max((_page_range(chunk)[1] for chunk in self.chunks), default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // max(1, settings.CHUNK_CHARS_PER_TOKEN)
+
+
+def _page_range(chunk: dict) -> tuple[int, int]:
+    metadata = chunk.get('metadata') or {}
+    first = metadata.get('page_start', metadata.get('page_number', 0)) or 0
+    return first, metadata.get('page_end', first) or first
+
+
+def _position(chunk: dict) -> tuple[int, int, int]:
+    metadata = chunk.get('metadata') or {}
+    # Chunks antigos não têm char_start: o id segue a ordem de inserção
+    return _page_range(chunk)[0], metadata.get('char_start') or 0, chunk.get('id') or 0
+
+
+def _shingles(text: str) -> set[tuple[str, ...]]:
+    words = _WORD.findall(text.lower())
+    if len(words) < _SHINGLE_WORDS:
+        return {tuple(words)}
+    return {tuple(words[i:i + _SHINGLE_WORDS]) for i in range(len(words) - _SHINGLE_WORDS + 1)}
+
+
+def _join(text: str, following: str) -> str:
+    '''Appends `following` to `text`, writing text they share at the seam only once.'''
+    if not text:
+        return following
+    if following in text:
+        return text
+    longest = min(len(text), len(following), _MAX_OVERLAP_CHARS)
+    for size in range(longest, _MIN_OVERLAP_CHARS - 1, -1):
+        if text.endswith(following[:size]):
+            return text + following[size:]
+    return text + "\n\n" + following
+
+
+def _render(chunks: list[dict]) -> str:
+    text = ""
+    for chunk in sorted(chunks, key=_position):
+        text = _join(text, chunk['content'].strip())
+    return text
+
+
+def _shares_page(passage: Passage, chunk: dict) -> bool:
+    first, last = _page_range(chunk)
+    return (passage.document_id == chunk.get('document_id')
+            and first <= passage.page_end and last >= passage.page_start)
+
+
+def pack_context(chunks: list[dict], token_budget: int | None = None) -> list[Passage]:
+    '''Packs chunks (most relevant first) into passages within the token budget.'''
+    budget = settings.CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    threshold = settings.CONTEXT_DEDUP_THRESHOLD
+    passages: list[Passage] = []
+    taken_shingles: list[set] = []
+    used = 0
+
+    for rank, chunk in enumerate(chunks):
+        shingles = _shingles(chunk['content'])
+        if threshold and any(len(shingles & taken) >= threshold * len(shingles) for taken in taken_shingles):
+            continue
+
+        # Um chunk que cruza páginas pode unir duas passagens (ex.: p. 3 e p. 4 por um chunk 3-4)
+        related = [passage for passage in passages if _shares_page(passage, chunk)]
+        members = [member for passage in related for member in passage.chunks] + [chunk]
+        text = _render(members)
+        cost = estimate_tokens(text) - sum(estimate_tokens(passage.text) for passage in related)
+        if passages and used + cost > budget:
+            continue
+
+        merged = Passage(chunk.get('document_id'), chunk.get('document_name'),
+                         min([rank] + [passage.rank for passage in related]), members, text)
+        passages = [passage for passage in passages if all(passage is not r for r in related)] + [merged]
+        taken_shingles.append(shingles)
+        used += cost
+
+    return sorted(passages, key=lambda passage: passage.rank)
@@ -0,0 +1,160 @@
+# backend/app/services/copy_chunk_writer.py
+'''
+Bulk writer for `document_chunks` over a direct Postgres connection.
+
+Rows are streamed with binary COPY into a temporary staging table and
+moved into `document_chunks` with one INSERT ... SELECT per batch. In
+binary COPY an embedding travels as pgvector's own format (dimension
+header + 4-byte floats), about a third of its JSON size, and the server
+parses no text.
+
+All batches of a writer run in one transaction, committed when the
+writer exits cleanly: a document (or a fan-out page range) is either
+fully written or not at all, and a retry starts over from the last
+committed checkpoint.
+'''
+
+import json
+import struct
+import uuid
+
+import numpy as np
+import psycopg2
+
+from app.core.config import settings
+from app.core.postgres_client import get_pg_connection
+from app.services.ingestion_pipeline import ChunkWriter
+from app.services.quantization import quantization_mode
+
+_STAGING_TABLE = "chunk_staging"
+_COLUMNS = ("document_id", "workspace_id", "user_id", "content", "embedding", "metadata")
+
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+
+
+class CopyWriterUnavailable(Exception):
+    '''The direct Postgres path cannot be used (connection or schema).'''
+
+
+def _encode_vector(value) -> bytes:
+    array = np.asarray(value, dtype=">f4")
+    return struct.pack(">HH", len(array), 0) + array.tobytes()
+
+
+def _encode_bits(value: str) -> bytes:
+    # bit(n): número de bits seguido dos bits empacotados
+    bits = np.frombuffer(value.encode("ascii"), dtype=np.uint8) - ord("0")
+    return struct.pack(">i", len(bits)) + np.packbits(bits).tobytes()
+
+
+# Codificadores do formato binário do COPY, pelo tipo da coluna de staging
+_ENCODERS = {
+    "bigint": lambda value: struct.pack(">q", value),
+    "integer": lambda value: struct.pack(">i", value),
+    "uuid": lambda value: uuid.UUID(str(value)).bytes,
+    "text": lambda value: value.encode("utf-8"),
+    "jsonb": lambda value: b"\x01" + json.dumps(value).encode("utf-8"),
+    "json": lambda value: json.dumps(value).encode("utf-8"),
+    "vector": _encode_vector,
+    "bit": _encode_bits,
+}
+
+
+def _encoder_for(type_name: str):
+    encoder = _ENCODERS.get(type_name.split("(")[0])
+    if encoder is None:
+        raise CopyWriterUnavailable(f"unsupported column type for binary COPY: {type_name}")
+    return encoder
+
+
+class CopyChunkWriter(ChunkWriter):
+    '''
+    ChunkWriter that writes batches of CHUNK_COPY_BATCH_SIZE rows with
+    binary COPY inside one transaction per writer.
+
+    Inserted rows are added to the local search indexes only after the
+    commit, so the indexes never reference rolled-back chunks.
+    '''
+
+    # O checkpoint vai na mesma transação dos chunks, antes do commit
+    CHECKPOINT_AFTER_INDEXING = False
+
+    def __init__(self, supabase, document: dict, batch_size: int | None = None, track_checkpoint: bool = True):
+        super().__init__(supabase, document, batch_size or settings.CHUNK_COPY_BATCH_SIZE, track_checkpoint)
+        self.columns = _COLUMNS + (("embedding_binary",) if quantization_mode() == "binary" else ())
+        try:
+            self.connection = get_pg_connection()
+            self.connection.rollback()  # Descarta qualquer transação pendente da conexão
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TEMP TABLE IF NOT EXISTS {_STAGING_TABLE} ON COMMIT DELETE ROWS AS "
+                    f"SELECT 0::int4 AS ord, {', '.join(self.columns)} FROM document_chunks WITH NO DATA")
+                cursor.execute(
+                    "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+                    "WHERE attrelid = %s::regclass AND attnum > 1 AND NOT attisdropped ORDER BY attnum",
+                    (f"pg_temp.{_STAGING_TABLE}",))
+                self.encoders = [_encoder_for(type_name) for (type_name,) in cursor.fetchall()]
+        except psycopg2.Error as e:
+            raise CopyWriterUnavailable(str(e)) from e
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.connection.rollback()
+            self.pending_index_rows = []
+            return False
+        self.connection.commit()
+        self.update_indexes()
+        return False
+
+    def _copy_payload(self, rows: list[dict]) -> bytes:
+        parts = [_COPY_HEADER]
+        field_count = struct.pack(">h", len(self.columns) + 1)
+        for ordinal, row in enumerate(rows):
+            parts.append(field_count)
+            parts.append(struct.pack(">ii", 4, ordinal))
+            for column, encode in zip(self.columns, self.encoders):
+                value = row[column]
+                if value is None:
+                    parts.append(struct.pack(">i", -1))
+                else:
+                    data = encode(value)
+                    parts.append(struct.pack(">i", len(data)))
+                    parts.append(data)
+        parts.append(_COPY_TRAILER)
+        return b"".join(parts)
+
+    def _insert(self, rows: list[dict]) -> None:
+        columns = ", ".join(self.columns)
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {_STAGING_TABLE} FROM STDIN WITH (FORMAT binary)",
+                               _BytesReader(self._copy_payload(rows)))
+            # Os ids seguem a ordem de `ord`, então ids ordenados = ordem das linhas
+            cursor.execute(f"INSERT INTO document_chunks ({columns}) "
+                           f"SELECT {columns} FROM {_STAGING_TABLE} ORDER BY ord RETURNING id")
+            chunk_ids = sorted(chunk_id for (chunk_id,) in cursor.fetchall())
+            cursor.execute(f"TRUNCATE {_STAGING_TABLE}")
+
+        # Sem limite de lote: só a partir do commit os chunks podem entrar nos índices
+        self.queue_for_indexes(rows, chunk_ids)
+
+    def _save_checkpoint(self, page_number: int) -> None:
+        # Na mesma transação: só vale se os chunks até essa página forem gravados
+        with self.connection.cursor() as cursor:
+            cursor.execute("UPDATE documents SET last_processed_page = %s, processed_chunks = %s WHERE id = %s",
+                           (page_number, self.processed_base + self.inserted, self.document['id']))
+
+
+class _BytesReader:
+    '''Minimal file-like object over a bytes payload for copy_expert.'''
+
+    def __init__(self, payload: bytes):
+        self.view = memoryview(payload)
+        self.position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = len(self.view) - self.position
+        chunk = self.view[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk.tobytes()
@@ -0,0 +1,174 @@
+# backend/app/services/document_download.py
+'''
+Streamed download of document files from Supabase Storage.
+
+The file is read from the response in DOWNLOAD_CHUNK_BYTES pieces. Files
+up to STORAGE_MEMORY_MAX_BYTES stay in memory; larger ones (or ones that
+grow past the limit when the size is not announced) are spooled to a
+temporary file, which the extractors open from disk, so a large scan
+never exists as one bytes object in the worker.
+'''
+
+import os
+import tempfile
+import threading
+
+from supabase import Client
+
+from app.core.config import settings
+
+STORAGE_BUCKET = 'workspaces_data'
+
+
+class DownloadedFile:
+    '''
+    A downloaded file: `data` in memory or `path` to a temporary file.
+
+    `source` is what the extractors open (bytes or a path). Used as a
+    context manager that removes the temporary file.
+    '''
+
+    def __init__(self, data: bytes | None = None, path: str | None = None, size: int = 0):
+        self.data = data
+        self.path = path
+        self.size = size
+
+    @property
+    def on_disk(self) -> bool:
+        return self.path is not None
+
+    @property
+    def source(self) -> bytes | str:
+        return self.path if self.on_disk else self.data
+
+    def head(self, size: int) -> bytes:
+        '''First bytes of the file (format detection).'''
+        if not self.on_disk:
+            return self.data[:size]
+        with open(self.path, "rb") as handle:
+            return handle.read(size)
+
+    def close(self) -> None:
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError as e:
+                print(f"Could not remove temporary file {self.path}: {e}")
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+        return False
+
+
+def download_file(supabase: Client, file_path: str, bucket: str = STORAGE_BUCKET) -> DownloadedFile:
+    '''Streams `bucket/file_path` into memory or a temporary file, by size.'''
+    memory_limit = settings.STORAGE_MEMORY_MAX_BYTES
+    # Mesma sessão HTTP (pool e autenticação) do cliente de Storage
+    with supabase.storage.session.stream("GET", f"object/{bucket}/{file_path}") as response:
+        if response.status_code >= 400:
+            response.read()
+            raise RuntimeError(
+                f"Failed to download file from storage: {file_path} ({response.status_code} {response.text[:200]})")
+
+        announced = int(response.headers.get("Content-Length") or 0)
+        pieces: list[bytes] = []
+        size = 0
+        handle = None
+        try:
+            if announced > memory_limit:
+                handle = _temporary_file()
+            for piece in response.iter_bytes(settings.DOWNLOAD_CHUNK_BYTES):
+                size += len(piece)
+                if handle is None and size > memory_limit:
+                    # Tamanho não anunciado: passa para o disco ao cruzar o limite
+                    handle = _temporary_file()
+                    handle.writelines(pieces)
+                    pieces = []
+                if handle is not None:
+                    handle.write(piece)
+                else:
+                    pieces.append(piece)
+        except BaseException:
+            if handle is not None:
+                handle.close()
+                os.unlink(handle.name)
+            raise
+
+    if handle is not None:
+        handle.close()
+        return DownloadedFile(path=handle.name, size=size)
+    return DownloadedFile(data=b"".join(pieces), size=size)
+
+
+def _temporary_file():
+    return tempfile.NamedTemporaryFile(
+        prefix="oraculo-", suffix=".download", dir=settings.DOWNLOAD_TMP_DIR or None, delete=False)
+
+
+class PeakMemoryMonitor:
+    '''
+    Samples the resident memory of the process in a background thread
+    while a task runs and keeps the peak, in bytes (None when the
+    platform offers no way to read it).
+
+    Reads /proc/self/statm (Linux). Elsewhere falls back to the
+    process-wide high-water mark of `resource.getrusage`, which only
+    reflects the task if it set a new peak.
+    '''
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak: int | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @staticmethod
+    def current_rss() -> int | None:
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            pass
+        try:
+            import resource
+            import sys
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss: bytes no macOS, KiB no Linux/BSD
+            return peak if sys.platform == "darwin" else peak * 1024
+        except ImportError:  # Windows
+            return None
+
+    def _sample(self) -> None:
+        rss = self.current_rss()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "PeakMemoryMonitor":
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name="peak-memory", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> int | None:
+        '''Stops sampling (idempotent) and returns the peak.'''
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._sample()
+        return self.peak
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stop()
+        return False
@@ -0,0 +1,168 @@
+# backend/app/services/embedding_cache.py
+'''
+Content-addressed embedding cache shared by ingestion and chat.
+
+Vectors are keyed by a SHA-256 of (model, task_type, title, text) and
+stored as packed float32. The Redis backend persists across processes
+and evicts the least recently used entries once
+EMBEDDING_CACHE_MAX_ENTRIES is exceeded; the memory backend keeps a
+per-process LRU with the same bound.
+'''
+
+import hashlib
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+_KEY_PREFIX = "emb_cache:v1:"
+_LRU_KEY = "emb_cache:v1:lru"
+_STATS_KEY = "emb_cache:v1:stats"
+
+
+def embedding_cache_key(model: str, task_type: str, title: str | None, text: str) -> str:
+    '''Returns the content hash that identifies one embedding.'''
+    digest = hashlib.sha256()
+    for part in (model, task_type, title or "", text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+def _pack(vector: list[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(data: bytes) -> list[float]:
+    values = array("f")
+    values.frombytes(data)
+    return values.tolist()
+
+
+class MemoryEmbeddingCache:
+    '''Per-process LRU cache of embeddings.'''
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: list[str]) -> list[list[float] | None]:
+        results = []
+        with self._lock:
+            for key in keys:
+                data = self._entries.get(key)
+                if data is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    results.append(_unpack(data))
+        return results
+
+    def set_many(self, items: dict[str, list[float]]) -> None:
+        with self._lock:
+            for key, vector in items.items():
+                self._entries[key] = _pack(vector)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "hits": self.hits, "misses": self.misses,
+                    "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+class RedisEmbeddingCache:
+    '''
+    Redis-backed LRU cache of embeddings.
+
+    Recency is tracked in a sorted set scored by last access time; on
+    writes the oldest members beyond `max_entries` are evicted. Redis
+    errors are logged and treated as misses so the cache never fails
+    ingestion or chat.
+    '''
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+
+    def get_many(self, keys: list[str]) -> list[list[float] | None]:
+        if not keys:
+            return []
+        client = get_redis()
+        try:
+            values = client.mget([_KEY_PREFIX + key for key in keys])
+            hit_keys = [key for key, value in zip(keys, values) if value is not None]
+            pipe = client.pipeline(transaction=False)
+            if hit_keys:
+                now = time.time()
+                pipe.zadd(_LRU_KEY, {key: now for key in hit_keys})
+                pipe.hincrby(_STATS_KEY, "hits", len(hit_keys))
+            if len(hit_keys) < len(keys):
+                pipe.hincrby(_STATS_KEY, "misses", len(keys) - len(hit_keys))
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"Embedding cache unavailable, skipping lookup: {e}")
+            return [None] * len(keys)
+        return [_unpack(value) if value is not None else None for value in values]
+
+    def set_many(self, items: dict[str, list[float]]) -> None:
+        if not items:
+            return
+        client = get_redis()
+        try:
+            now = time.time()
+            pipe = client.pipeline(transaction=False)
+            for key, vector in items.items():
+                pipe.set(_KEY_PREFIX + key, _pack(vector))
+            pipe.zadd(_LRU_KEY, {key: now for key in items})
+            pipe.zcard(_LRU_KEY)
+            size = pipe.execute()[-1]
+
+            overflow = size - self.max_entries
+            if overflow > 0:
+                evicted = [member.decode() for member, _ in client.zpopmin(_LRU_KEY, overflow)]
+                if evicted:
+                    client.delete(*[_KEY_PREFIX + key for key in evicted])
+        except redis.RedisError as e:
+            print(f"Embedding cache unavailable, skipping store: {e}")
+
+    def stats(self) -> dict:
+        try:
+            client = get_redis()
+            counters = client.hgetall(_STATS_KEY)
+            entries = client.zcard(_LRU_KEY)
+        except redis.RedisError as e:
+            return {"backend": "redis", "error": str(e)}
+        return {"backend": "redis",
+                "hits": int(counters.get(b"hits", 0)),
+                "misses": int(counters.get(b"misses", 0)),
+                "entries": entries, "max_entries": self.max_entries}
+
+
+_cache: MemoryEmbeddingCache | RedisEmbeddingCache | None = None
+
+
+def get_embedding_cache() -> MemoryEmbeddingCache | RedisEmbeddingCache | None:
+    '''Returns the configured cache, or None when caching is disabled.'''
+    global _cache
+    backend = settings.EMBEDDING_CACHE_BACKEND.lower()
+    if backend == "none":
+        return None
+    if _cache is None:
+        if backend == "memory":
+            _cache = MemoryEmbeddingCache(settings.EMBEDDING_CACHE_MAX_ENTRIES)
+        elif backend == "redis":
+            _cache = RedisEmbeddingCache(settings.EMBEDDING_CACHE_MAX_ENTRIES)
+        else:
+            raise ValueError(f"Unknown EMBEDDING_CACHE_BACKEND: {settings.EMBEDDING_CACHE_BACKEND}")
+    return _cache
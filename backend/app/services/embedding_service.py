@@ -0,0 +1,122 @@
+# backend/app/services/embedding_service.py
+'''
+Embedding helpers shared by the ingestion task and the chat endpoint.
+
+Document chunks are grouped into multi-content `batchEmbedContents`
+requests and a bounded number of batches is kept in flight at once.
+Vectors already present in the embedding cache are never re-requested.
+Every API call goes through the shared rate limiter (gemini_client):
+document batches as background work, questions as interactive.
+'''
+
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+
+from app.core.config import settings
+from app.services.embedding_cache import embedding_cache_key, get_embedding_cache
+from app.services.gemini_client import BACKGROUND, INTERACTIVE, call_gemini
+
+
+def _embed_batch(texts: list[str], title: str | None) -> list[list[float]]:
+    '''Embeds one batch of document texts with a single API call.'''
+    response = call_gemini(
+        "embed", genai.embed_content,
+        model=settings.EMBEDDING_MODEL,
+        content=texts,
+        task_type="RETRIEVAL_DOCUMENT",
+        title=title,
+        priority=BACKGROUND,
+    )
+    return response['embedding']
+
+
+def _through_cache(
+    texts: list[str],
+    task_type: str,
+    title: str | None,
+    compute: Callable[[list[str]], list[list[float]]],
+) -> list[list[float]]:
+    '''Serves `texts` from the cache and computes only the (deduplicated) misses.'''
+    cache = get_embedding_cache()
+    if cache is None:
+        return compute(texts)
+
+    keys = [embedding_cache_key(settings.EMBEDDING_MODEL, task_type, title, text) for text in texts]
+    cached = cache.get_many(keys)
+
+    missing: dict[str, str] = {}
+    for key, text, vector in zip(keys, texts, cached):
+        if vector is None and key not in missing:
+            missing[key] = text
+
+    fresh: dict[str, list[float]] = {}
+    if missing:
+        fresh = dict(zip(missing.keys(), compute(list(missing.values()))))
+        cache.set_many(fresh)
+
+    return [vector if vector is not None else fresh[key] for key, vector in zip(keys, cached)]
+
+
+def embed_documents(
+    texts: list[str],
+    *,
+    title: str | None = None,
+    batch_size: int | None = None,
+    max_concurrency: int | None = None,
+) -> list[list[float]]:
+    '''
+    Embeds a list of document texts and returns the vectors in input order.
+
+    Texts are split into batches of `batch_size` and at most
+    `max_concurrency` batches are sent concurrently.
+    '''
+    if not texts:
+        return []
+    return _through_cache(
+        texts, "RETRIEVAL_DOCUMENT", title,
+        lambda missing: _embed_uncached(missing, title, batch_size, max_concurrency),
+    )
+
+
+def _embed_uncached(
+    texts: list[str],
+    title: str | None,
+    batch_size: int | None,
+    max_concurrency: int | None,
+) -> list[list[float]]:
+    '''Calls the embedding API for `texts`, bypassing the cache.'''
+    batch_size = max(1, batch_size or settings.EMBEDDING_BATCH_SIZE)
+    max_concurrency = max(1, max_concurrency or settings.EMBEDDING_MAX_CONCURRENCY)
+
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    if len(batches) == 1 or max_concurrency == 1:
+        results = [_embed_batch(batch, title) for batch in batches]
+    else:
+        # `map` devolve os resultados na ordem dos lotes, não na de conclusão
+        workers = min(max_concurrency, len(batches))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+            results = list(pool.map(lambda batch: _embed_batch(batch, title), batches))
+
+    embeddings = [vector for batch_vectors in results for vector in batch_vectors]
+    if len(embeddings) != len(texts):
+        raise RuntimeError(
+            f"Embedding API returned {len(embeddings)} vectors for {len(texts)} texts.")
+    return embeddings
+
+
+def embed_query(text: str) -> list[float]:
+    '''Embeds a user question for retrieval.'''
+    def compute(missing: list[str]) -> list[list[float]]:
+        response = call_gemini(
+            "embed", genai.embed_content,
+            model=settings.EMBEDDING_MODEL,
+            content=missing[0],
+            task_type="RETRIEVAL_QUERY",
+            priority=INTERACTIVE,
+        )
+        return [response['embedding']]
+
+    return _through_cache([text], "RETRIEVAL_QUERY", None, compute)[0]
@@ -0,0 +1,245 @@
+# backend/app/services/extractors.py
+'''
+Text extractors by document format, resolved through a registry keyed on
+MIME type and file extension.
+
+An extractor opens the downloaded file and yields numbered text units,
+in order, to the chunk/embed pipeline:
+
+    (unit_number, text, location)
+
+The file is given as bytes or, for large downloads spooled to disk (see
+document_download), as the path of the temporary file.
+
+Units play the role of pages for the pipeline: chunks record the unit
+range they span and `documents.last_processed_page` stores the last
+fully committed unit. `location` describes the unit inside the file and
+is copied into the chunk metadata (None when the unit number says it
+all, as for PDF pages):
+
+    PDF     one unit per page           (page number only)
+    DOCX    one unit per paragraph      {'paragraph': 12} / {'table': 2}
+    XLSX    XLSX_ROWS_PER_UNIT rows     {'sheet': 'Vendas', 'row_start': 2, 'row_end': 101}
+'''
+
+import io
+from collections.abc import Iterator
+from pathlib import PurePosixPath
+
+from app.core.config import settings
+from app.services.document_download import DownloadedFile
+from app.services.pdf_extraction import extract_pages, open_pdf
+
+TextUnit = tuple[int, str, dict | None]
+
+_EXTRACTORS_BY_MIME: dict[str, type["Extractor"]] = {}
+_EXTRACTORS_BY_EXTENSION: dict[str, type["Extractor"]] = {}
+
+
+def register_extractor(extensions: tuple[str, ...], mime_types: tuple[str, ...]):
+    '''Class decorator that registers an extractor for the given extensions and MIME types.'''
+    def decorator(cls):
+        for extension in extensions:
+            _EXTRACTORS_BY_EXTENSION[extension.lower()] = cls
+        for mime_type in mime_types:
+            _EXTRACTORS_BY_MIME[mime_type.lower()] = cls
+        return cls
+    return decorator
+
+
+def get_extractor(filename: str | None, head: bytes, mime_type: str | None = None) -> type["Extractor"]:
+    '''
+    Resolves the extractor by MIME type, then by extension, then by the
+    file signature (files without extension are assumed to be PDFs, as
+    before the registry existed); `head` is the start of the file. Raises
+    ValueError for unsupported formats.
+    '''
+    if mime_type and mime_type.split(";")[0].strip().lower() in _EXTRACTORS_BY_MIME:
+        return _EXTRACTORS_BY_MIME[mime_type.split(";")[0].strip().lower()]
+    extension = PurePosixPath(filename or "").suffix.lower()
+    if extension in _EXTRACTORS_BY_EXTENSION:
+        return _EXTRACTORS_BY_EXTENSION[extension]
+    if head[:5] == b"%PDF-":
+        return PdfExtractor
+    raise ValueError(f"Unsupported document format: {filename!r} ({mime_type or 'unknown MIME type'})")
+
+
+def open_document(document: dict, file: DownloadedFile) -> "Extractor":
+    '''Opens the downloaded file of a `documents` row (in memory or on disk) with the matching extractor.'''
+    # O nome original costuma ter a extensão; o path do Storage fica como alternativa
+    filename = document.get('name')
+    if not PurePosixPath(filename or "").suffix:
+        filename = document.get('path')
+    return get_extractor(filename, file.head(5), document.get('mime_type'))(file.source)
+
+
+def _file_argument(content: bytes | str):
+    '''Path as is (the library reads from disk), bytes wrapped in a file object.'''
+    return content if isinstance(content, str) else io.BytesIO(content)
+
+
+class Extractor:
+    '''
+    Base class of the extractors. Used as a context manager that releases
+    the parsed file on exit.
+
+    `unit_count` is the number of units when known up front (None for
+    streamed formats). Extractors with `supports_ranges` can extract any
+    unit range cheaply, which the page-range fan-out requires.
+
+    `content` is the file as bytes or as a path on disk.
+    '''
+
+    supports_ranges = False
+
+    def __init__(self, content: bytes | str):
+        self.content = content
+        self.unit_count: int | None = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+        return False
+
+    def close(self) -> None:
+        pass
+
+    def iter_units(self, start_unit: int = 1, end_unit: int | None = None) -> Iterator[TextUnit]:
+        raise NotImplementedError
+
+
+@register_extractor((".pdf",), ("application/pdf",))
+class PdfExtractor(Extractor):
+    '''One unit per page; long ranges are extracted in parallel (see pdf_extraction).'''
+
+    supports_ranges = True
+
+    def __init__(self, content: bytes | str):
+        super().__init__(content)
+        self.pdf_document = open_pdf(content)
+        self.unit_count = self.pdf_document.page_count
+
+    def close(self) -> None:
+        self.pdf_document.close()
+
+    def iter_units(self, start_unit: int = 1, end_unit: int | None = None) -> Iterator[TextUnit]:
+        for page_number, text in extract_pages(self.pdf_document, self.content, start_unit, end_unit):
+            yield page_number, text, None
+
+
+@register_extractor(
+    (".docx",),
+    ("application/vnd.openxmlformats-officedocument.wordprocessingml.document",),
+)
+class DocxExtractor(Extractor):
+    '''
+    One unit per paragraph or table, in body order. Tables are rendered
+    one row per line with cells separated by " | ".
+    '''
+
+    def __init__(self, content: bytes | str):
+        super().__init__(content)
+        # Import tardio: python-docx só é carregado quando há arquivos DOCX
+        import docx
+        self.document = docx.Document(_file_argument(content))
+
+    def close(self) -> None:
+        self.document = None
+
+    def iter_units(self, start_unit: int = 1, end_unit: int | None = None) -> Iterator[TextUnit]:
+        from docx.table import Table
+        from docx.text.paragraph import Paragraph
+
+        paragraph_index = table_index = 0
+        for unit_number, element in enumerate(self.document.element.body.iterchildren(), start=1):
+            if end_unit is not None and unit_number > end_unit:
+                return
+            tag = element.tag.rsplit("}", 1)[-1]
+            if tag == "p":
+                paragraph_index += 1
+                if unit_number >= start_unit:
+                    text = Paragraph(element, self.document).text
+                    if text.strip():
+                        yield unit_number, text, {'paragraph': paragraph_index}
+            elif tag == "tbl":
+                table_index += 1
+                if unit_number >= start_unit:
+                    rows = (" | ".join(cell.text.strip() for cell in row.cells)
+                            for row in Table(element, self.document).rows)
+                    text = "\n".join(row for row in rows if row.strip(" |"))
+                    if text:
+                        yield unit_number, text, {'table': table_index}
+
+
+@register_extractor(
+    (".xlsx", ".xlsm"),
+    ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",),
+)
+class XlsxExtractor(Extractor):
+    '''
+    Streams the sheets in openpyxl read-only mode, XLSX_ROWS_PER_UNIT rows
+    per unit, so only one batch of rows is in memory at a time.
+
+    Each unit starts with the sheet name and the sheet's first non-empty
+    row (taken as the header), so chunks keep their column names.
+    '''
+
+    def __init__(self, content: bytes | str):
+        super().__init__(content)
+        # Import tardio: openpyxl só é carregado quando há planilhas
+        import openpyxl
+        self.workbook = openpyxl.load_workbook(_file_argument(content), read_only=True, data_only=True)
+
+    def close(self) -> None:
+        self.workbook.close()
+
+    @staticmethod
+    def _format_row(values) -> str:
+        cells = ["" if value is None else str(value).strip() for value in values]
+        while cells and not cells[-1]:
+            cells.pop()
+        return " | ".join(cells) if any(cells) else ""
+
+    def iter_units(self, start_unit: int = 1, end_unit: int | None = None) -> Iterator[TextUnit]:
+        rows_per_unit = max(1, settings.XLSX_ROWS_PER_UNIT)
+        unit_number = 0
+        for sheet in self.workbook.worksheets:
+            header = None
+            batch: list[str] = []
+            header_row = first_row = last_row = 0
+            for row_number, values in enumerate(sheet.iter_rows(values_only=True), start=1):
+                line = self._format_row(values)
+                if not line:
+                    continue
+                if header is None:
+                    header, header_row = line, row_number
+                    continue
+                if not batch:
+                    first_row = row_number
+                batch.append(line)
+                last_row = row_number
+                if len(batch) >= rows_per_unit:
+                    unit_number += 1
+                    if end_unit is not None and unit_number > end_unit:
+                        return
+                    if unit_number >= start_unit:
+                        yield self._unit(unit_number, sheet.title, header, batch, first_row, last_row)
+                    batch = []
+
+            if header is not None and not last_row:
+                # Planilha com uma única linha: ela mesma é o conteúdo
+                batch, first_row, last_row, header = [header], header_row, header_row, None
+            if batch:
+                unit_number += 1
+                if end_unit is not None and unit_number > end_unit:
+                    return
+                if unit_number >= start_unit:
+                    yield self._unit(unit_number, sheet.title, header, batch, first_row, last_row)
+
+    @staticmethod
+    def _unit(unit_number: int, title: str, header: str | None, rows: list[str],
+              first_row: int, last_row: int) -> TextUnit:
+        lines = [f"Planilha: {title}"] + ([header] if header else []) + rows
+        return unit_number, "\n".join(lines), {'sheet': title, 'row_start': first_row, 'row_end': last_row}
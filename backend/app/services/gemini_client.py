@@ -0,0 +1,438 @@
+# backend/app/services/gemini_client.py
+'''
+Rate limiting and retries shared by every Gemini call (embeddings and
+generation, from the chat and from the ingestion workers).
+
+Each call goes through `call_gemini` (or `call_gemini_async`; streaming
+calls through `stream_gemini`/`stream_gemini_async`), which:
+
+1. takes a token from the token bucket of its kind ("embed"/"generate"),
+   refilled at GEMINI_EMBED_RPM / GEMINI_GENERATE_RPM requests per minute
+   and kept in Redis, so the whole cluster (API + all Celery workers)
+   shares one quota. Bursts are capped at GEMINI_BURST_SECONDS of quota.
+   Background calls (ingestion) may not take the last
+   GEMINI_INTERACTIVE_RESERVE of the bucket, which stays for the chat;
+2. takes a slot of the per-process adaptive concurrency limit (AIMD):
+   halved on a 429 (quota), grown by ~1 per limit's worth of successes
+   up to GEMINI_MAX_CONCURRENCY; a stream holds its slot until it ends.
+   Other failures (5xx, timeouts, connection errors) are retried without
+   shrinking the limit;
+3. retries 429/5xx/timeouts with full-jitter exponential backoff. A 429
+   also sets a short cluster-wide cooldown for its kind, so every
+   process backs off together instead of piling on the quota.
+
+Without Redis (GEMINI_RATE_LIMIT_BACKEND="memory", or Redis errors) the
+bucket is kept per process. An RPM of 0 disables the bucket of that kind.
+
+`call_gemini_async` waits for tokens and slots on the event loop
+(`asyncio.sleep` and futures), so a throttled chat stream does not hold
+a threadpool thread; only the Redis round trip of the bucket runs in the
+threadpool.
+'''
+
+import asyncio
+import random
+import threading
+import time
+from collections.abc import Callable
+
+import redis
+from google.api_core import exceptions as google_exceptions
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import GEMINI_REQUESTS, GEMINI_WAIT_SECONDS
+from app.core.redis_client import get_redis
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Erros transitórios: cota (429), erros do servidor e timeouts
+_THROTTLED = (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted)
+_RETRYABLE = _THROTTLED + (
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+_KEY_PREFIX = "gemini:ratelimit:v1:"
+
+# Retira `cost` fichas se sobrar ao menos `floor`; senão devolve a espera em segundos.
+# Também respeita a pausa global (KEYS[2]) definida após um 429.
+_TOKEN_BUCKET_SCRIPT = """
+local cooldown = redis.call('PTTL', KEYS[2])
+if cooldown > 0 then return tostring(cooldown / 1000) end
+local capacity, rate, cost, floor = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1e6
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens - cost >= floor then
+    tokens = tokens - cost
+else
+    wait = (cost + floor - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class MemoryTokenBucket:
+    '''Token bucket of one process (same semantics as the Redis script).'''
+
+    def __init__(self):
+        self._state: dict[str, tuple[float, float]] = {}
+        self._cooldown_until: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def take(self, kind: str, capacity: float, rate: float, floor: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            cooldown = self._cooldown_until.get(kind, 0.0) - now
+            if cooldown > 0:
+                return cooldown
+            tokens, updated = self._state.get(kind, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens - 1 >= floor:
+                tokens -= 1
+            else:
+                wait = (1 + floor - tokens) / rate
+            self._state[kind] = (tokens, now)
+            return wait
+
+    def pause(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            self._cooldown_until[kind] = max(self._cooldown_until.get(kind, 0.0), time.monotonic() + seconds)
+
+
+class RedisTokenBucket:
+    '''Token bucket shared through Redis; falls back to a local bucket on Redis errors.'''
+
+    def __init__(self):
+        self._script = None
+        self._fallback = MemoryTokenBucket()
+
+    def take(self, kind: str, capacity: float, rate: float, floor: float) -> float:
+        try:
+            if self._script is None:
+                self._script = get_redis().register_script(_TOKEN_BUCKET_SCRIPT)
+            keys = [f"{_KEY_PREFIX}{kind}", f"{_KEY_PREFIX}{kind}:cooldown"]
+            return float(self._script(keys=keys, args=[capacity, rate, 1, floor]))
+        except redis.RedisError as e:
+            print(f"Gemini rate limiter unavailable, using a local bucket: {e}")
+            return self._fallback.take(kind, capacity, rate, floor)
+
+    def pause(self, kind: str, seconds: float) -> None:
+        try:
+            client = get_redis()
+            key = f"{_KEY_PREFIX}{kind}:cooldown"
+            # Não encurta uma pausa mais longa já definida por outro processo
+            if client.pttl(key) < seconds * 1000:
+                client.set(key, 1, px=max(1, int(seconds * 1000)))
+        except redis.RedisError:
+            self._fallback.pause(kind, seconds)
+
+
+class AdaptiveConcurrency:
+    '''
+    AIMD limit of the calls in flight in this process: halved on a
+    throttling error (at most once per second, so one burst of 429s
+    counts once), increased by 1/limit on each success.
+
+    Threads wait on a condition (`acquire`); coroutines wait on a future
+    of their event loop (`acquire_async`). Both share the same slots.
+    '''
+
+    def __init__(self, maximum: int):
+        self.maximum = max(1, maximum)
+        self.limit = float(self.maximum)
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._async_waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _try_acquire(self) -> bool:
+        if self._in_flight >= max(1, int(self.limit)):
+            return False
+        self._in_flight += 1
+        return True
+
+    def acquire(self) -> None:
+        with self._condition:
+            while not self._try_acquire():
+                self._condition.wait()
+
+    async def acquire_async(self) -> None:
+        '''Waits for a slot on the event loop; a cancelled wait takes no slot.'''
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            finally:
+                with self._condition:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def release(self, throttled: bool) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease >= 1.0:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+            # Acorda todas as corrotinas em espera; cada uma volta a disputar a vaga
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class GeminiLimiter:
+    '''Token buckets per kind plus the adaptive concurrency limit of the process.'''
+
+    def __init__(self, bucket: MemoryTokenBucket | RedisTokenBucket, max_concurrency: int):
+        self.bucket = bucket
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+
+    @staticmethod
+    def _rpm(kind: str) -> float:
+        return float(settings.GEMINI_EMBED_RPM if kind == "embed" else settings.GEMINI_GENERATE_RPM)
+
+    def _bucket(self, kind: str, priority: str) -> tuple[float, float, float] | None:
+        '''(capacity, rate, floor) of the bucket of `kind`, or None if it is disabled.'''
+        rpm = self._rpm(kind)
+        if rpm <= 0:
+            return None
+        rate = rpm / 60
+        capacity = max(1.0, rate * settings.GEMINI_BURST_SECONDS)
+        floor = capacity * settings.GEMINI_INTERACTIVE_RESERVE if priority == BACKGROUND else 0.0
+        return capacity, rate, floor
+
+    def wait_for_token(self, kind: str, priority: str) -> None:
+        '''Blocks until the bucket of `kind` grants a request.'''
+        bucket = self._bucket(kind, priority)
+        if bucket is None:
+            return
+        started = time.perf_counter()
+        while (wait := self.bucket.take(kind, *bucket)) > 0:
+            # Pequeno jitter para os processos não acordarem todos juntos
+            time.sleep(wait * random.uniform(1.0, 1.2))
+        GEMINI_WAIT_SECONDS.labels(priority).observe(time.perf_counter() - started)
+
+    async def wait_for_token_async(self, kind: str, priority: str) -> None:
+        '''`wait_for_token` for coroutines: sleeps on the event loop.'''
+        bucket = self._bucket(kind, priority)
+        if bucket is None:
+            return
+        started = time.perf_counter()
+        # Só a consulta ao bucket (ida ao Redis, bloqueante) passa pelo threadpool
+        while (wait := await run_in_threadpool(self.bucket.take, kind, *bucket)) > 0:
+            await asyncio.sleep(wait * random.uniform(1.0, 1.2))
+        GEMINI_WAIT_SECONDS.labels(priority).observe(time.perf_counter() - started)
+
+    def throttled(self, kind: str, seconds: float) -> None:
+        self.bucket.pause(kind, seconds)
+
+
+_limiter: GeminiLimiter | None = None
+_limiter_lock = threading.Lock()
+
+
+def get_gemini_limiter() -> GeminiLimiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                backend = settings.GEMINI_RATE_LIMIT_BACKEND.lower()
+                if backend == "redis":
+                    bucket = RedisTokenBucket()
+                elif backend == "memory":
+                    bucket = MemoryTokenBucket()
+                else:
+                    raise ValueError(f"Unknown GEMINI_RATE_LIMIT_BACKEND: {settings.GEMINI_RATE_LIMIT_BACKEND}")
+                _limiter = GeminiLimiter(bucket, settings.GEMINI_MAX_CONCURRENCY)
+    return _limiter
+
+
+def _max_retries(priority: str) -> int:
+    return settings.GEMINI_CHAT_MAX_RETRIES if priority == INTERACTIVE else settings.GEMINI_MAX_RETRIES
+
+
+def _backoff(attempt: int) -> float:
+    '''Full jitter: uniform in [0, min(cap, base * 2^attempt)].'''
+    return random.uniform(0, min(settings.GEMINI_RETRY_MAX_SECONDS,
+                                 settings.GEMINI_RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+def _on_error(limiter: GeminiLimiter, kind: str, error: Exception, attempt: int, priority: str) -> float | None:
+    '''
+    Records a failed attempt and returns the delay before the next one,
+    or None when the retries are exhausted.
+    '''
+    throttled = isinstance(error, _THROTTLED)
+    # Só a cota estourada reduz a concorrência; timeouts e falhas de rede não indicam sobrecarga
+    limiter.concurrency.release(throttled=throttled)
+    GEMINI_REQUESTS.labels(kind, "throttled" if throttled else "error").inc()
+    if attempt >= _max_retries(priority):
+        return None
+    delay = _backoff(attempt)
+    if throttled:
+        limiter.throttled(kind, delay)
+    print(f"Gemini {kind} call failed ({type(error).__name__}), retry {attempt + 1}/{_max_retries(priority)} "
+          f"in {delay:.1f}s.")
+    return delay
+
+
+class SlotStream:
+    '''
+    Streaming response that holds its concurrency slot until the stream is
+    exhausted, fails or is closed, so GEMINI_MAX_CONCURRENCY also caps the
+    streams in flight. Iterable both sync and async, like the SDK response
+    it wraps; the slot is released once.
+    '''
+
+    def __init__(self, response, concurrency: AdaptiveConcurrency):
+        self._response = response
+        self._iterator = None
+        self._concurrency: AdaptiveConcurrency | None = concurrency
+
+    def close(self, throttled: bool = False) -> None:
+        concurrency, self._concurrency = self._concurrency, None
+        if concurrency is not None:
+            concurrency.release(throttled=throttled)
+
+    async def aclose(self) -> None:
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = iter(self._response)
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            self.close()
+            raise
+        except BaseException as e:
+            self.close(throttled=isinstance(e, _THROTTLED))
+            raise
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._iterator is None:
+            self._iterator = self._response.__aiter__()
+        try:
+            return await self._iterator.__anext__()
+        except StopAsyncIteration:
+            self.close()
+            raise
+        except BaseException as e:
+            self.close(throttled=isinstance(e, _THROTTLED))
+            raise
+
+    def __del__(self):
+        # Rede de segurança: um stream abandonado sem close() não prende a vaga
+        self.close()
+
+
+def _call(kind: str, function: Callable, args: tuple, kwargs: dict, priority: str, stream: bool):
+    limiter = get_gemini_limiter()
+    attempt = 0
+    while True:
+        limiter.wait_for_token(kind, priority)
+        limiter.concurrency.acquire()
+        try:
+            result = function(*args, **kwargs)
+        except _RETRYABLE as e:
+            delay = _on_error(limiter, kind, e, attempt, priority)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except Exception:
+            limiter.concurrency.release(throttled=False)
+            raise
+        GEMINI_REQUESTS.labels(kind, "ok").inc()
+        if stream:
+            return SlotStream(result, limiter.concurrency)
+        limiter.concurrency.release(throttled=False)
+        return result
+
+
+async def _call_async(kind: str, function: Callable, args: tuple, kwargs: dict, priority: str, stream: bool):
+    limiter = get_gemini_limiter()
+    attempt = 0
+    while True:
+        await limiter.wait_for_token_async(kind, priority)
+        await limiter.concurrency.acquire_async()
+        try:
+            result = await function(*args, **kwargs)
+        except _RETRYABLE as e:
+            delay = _on_error(limiter, kind, e, attempt, priority)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        except BaseException:
+            limiter.concurrency.release(throttled=False)
+            raise
+        GEMINI_REQUESTS.labels(kind, "ok").inc()
+        if stream:
+            return SlotStream(result, limiter.concurrency)
+        limiter.concurrency.release(throttled=False)
+        return result
+
+
+def call_gemini(kind: str, function: Callable, *args, priority: str = BACKGROUND, **kwargs):
+    '''
+    Calls `function(*args, **kwargs)` (a Gemini SDK call of `kind`
+    "embed" or "generate") under the rate limits, retrying transient errors.
+    '''
+    return _call(kind, function, args, kwargs, priority, stream=False)
+
+
+def stream_gemini(kind: str, function: Callable, *args, priority: str = INTERACTIVE, **kwargs) -> SlotStream:
+    '''
+    `call_gemini` for streaming calls: retried only until the stream
+    starts, and the slot is held until the returned `SlotStream` ends.
+    '''
+    return _call(kind, function, args, kwargs, priority, stream=True)
+
+
+async def call_gemini_async(kind: str, function: Callable, *args, priority: str = INTERACTIVE, **kwargs):
+    '''Async variant of `call_gemini` for coroutine SDK calls (waits on the event loop).'''
+    return await _call_async(kind, function, args, kwargs, priority, stream=False)
+
+
+async def stream_gemini_async(kind: str, function: Callable, *args, priority: str = INTERACTIVE,
+                              **kwargs) -> SlotStream:
+    '''Async variant of `stream_gemini` (waits on the event loop).'''
+    return await _call_async(kind, function, args, kwargs, priority, stream=True)
@@ -0,0 +1,168 @@
+# backend/app/services/index_storage.py
+'''
+On-disk storage shared by the local per-workspace indexes
+(`vector_index`, `lexical_index`).
+
+Each workspace has a directory of immutable versions, each a set of
+`.npy` files:
+
+    {root}/{workspace_id}/
+        CURRENT         name of the live version (replaced atomically)
+        .lock           held by writers
+        v000012/        one .npy file per array of the index
+
+Readers memory-map a version (`np.load(mmap_mode="r")`) and switch when
+CURRENT changes. Writers publish a new version under the lock, hard-
+linking the files they did not change. Writers are the Celery workers
+(new chunks) and the API (deletions), so the directory must be shared
+by all of them.
+'''
+
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Versões antigas mantidas para leitores que ainda estão abrindo os arquivos
+_KEEP_VERSIONS = 2
+
+
+def needs_rebuild(base_rows: int, pending_rows: int, ratio: float, minimum: int) -> bool:
+    '''Delta and tombstones beyond `ratio` of the base (and `minimum` rows) trigger a rebuild.'''
+    return pending_rows >= max(minimum, ratio * base_rows)
+
+
+class WorkspaceIndexStore:
+    '''
+    Base class of the workspace index stores.
+
+    Subclasses list their arrays in FILES (plus OPTIONAL_FILES, missing
+    from some versions) and build their snapshot object in `_make_snapshot`. Loaded snapshots are cached per process and
+    reloaded when the workspace's CURRENT file points to a new version.
+    '''
+
+    FILES: tuple[str, ...] = ()
+    OPTIONAL_FILES: tuple[str, ...] = ()
+    NAME = "index"
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self._snapshots: dict[int, object] = {}
+        self._lock = threading.Lock()
+
+    def _make_snapshot(self, version: str, arrays: dict[str, np.ndarray]):
+        raise NotImplementedError
+
+    def _dir(self, workspace_id: int) -> Path:
+        return self.root / str(int(workspace_id))
+
+    @staticmethod
+    def _current_version(directory: Path) -> str | None:
+        try:
+            return (directory / "CURRENT").read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _load(self, directory: Path, version: str):
+        path = directory / version
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in self.FILES}
+        for name in self.OPTIONAL_FILES:
+            if (path / f"{name}.npy").exists():
+                arrays[name] = np.load(path / f"{name}.npy", mmap_mode="r")
+        return self._make_snapshot(version, arrays)
+
+    def exists(self, workspace_id: int) -> bool:
+        return self._current_version(self._dir(workspace_id)) is not None
+
+    def snapshot(self, workspace_id: int):
+        '''Current snapshot of a workspace, or None if it has no index.'''
+        directory = self._dir(workspace_id)
+        for _ in range(3):
+            version = self._current_version(directory)
+            if version is None:
+                self._snapshots.pop(workspace_id, None)
+                return None
+            cached = self._snapshots.get(workspace_id)
+            if cached is not None and cached.version == version:
+                return cached
+            try:
+                snapshot = self._load(directory, version)
+            except FileNotFoundError:
+                # Um escritor trocou e limpou a versão entre as leituras
+                continue
+            with self._lock:
+                self._snapshots[workspace_id] = snapshot
+            return snapshot
+        raise RuntimeError(f"{self.NAME.capitalize()} of workspace {workspace_id} changed during load")
+
+    # --- Escrita ---
+
+    @contextmanager
+    def _writer_lock(self, workspace_id: int):
+        directory = self._dir(workspace_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / ".lock", "a+b") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield directory
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+                else:
+                    handle.seek(0)
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _write_version(self, directory: Path, arrays: dict[str, np.ndarray], link_from: str | None = None) -> None:
+        '''
+        Writes a new version (hard-linking files not in `arrays`) and
+        publishes it. Optional files are linked only if `link_from` has them.
+        '''
+        versions = sorted(p.name for p in directory.glob("v*") if p.is_dir())
+        version = f"v{int(versions[-1][1:]) + 1 if versions else 1:06d}"
+        staging = directory / f".staging-{version}-{os.getpid()}"
+        staging.mkdir()
+        for name in self.FILES:
+            target = staging / f"{name}.npy"
+            if name in arrays:
+                np.save(target, arrays[name])
+            else:
+                os.link(directory / link_from / f"{name}.npy", target)
+        for name in self.OPTIONAL_FILES:
+            target = staging / f"{name}.npy"
+            if arrays.get(name) is not None:
+                np.save(target, arrays[name])
+            elif name not in arrays and link_from and (directory / link_from / f"{name}.npy").exists():
+                os.link(directory / link_from / f"{name}.npy", target)
+        staging.rename(directory / version)
+
+        pointer = directory / f".CURRENT-{os.getpid()}"
+        pointer.write_text(version)
+        os.replace(pointer, directory / "CURRENT")
+
+        for old in versions[:-(_KEEP_VERSIONS - 1) or None]:
+            for file in (directory / old).iterdir():
+                try:
+                    file.unlink()
+                except OSError:
+                    pass  # Windows: arquivo ainda mapeado por um leitor
+            try:
+                (directory / old).rmdir()
+            except OSError:
+                pass
+
+    def drop(self, workspace_id: int) -> None:
+        '''Unpublishes the workspace index; searches fall back to the database.'''
+        with self._writer_lock(workspace_id) as directory:
+            (directory / "CURRENT").unlink(missing_ok=True)
@@ -0,0 +1,473 @@
+# backend/app/services/ingestion_pipeline.py
+'''
+Streaming ingestion pipeline used by `app.tasks.process_document`.
+
+Each stage is a generator that holds at most a bounded window of work:
+
+    units -> chunks -> embedded chunks -> ChunkWriter (document_chunks)
+
+Units come from the format's extractor (`app.services.extractors`): pages
+of a PDF, paragraphs of a DOCX, row batches of an XLSX. The pipeline
+calls them pages. The writer flushes rows as it goes and records in
+`documents.last_processed_page` the last page whose chunks are all
+committed, so a retried task can resume from the following page. Since
+chunks may span pages, the resumed run can repeat the head of the first
+resumed page that a committed chunk already covered.
+'''
+
+import hashlib
+from collections.abc import Iterable, Iterator
+from itertools import islice
+
+import numpy as np
+from supabase import Client
+
+from app.core.config import settings
+from app.core.metrics import StageTimer
+from app.services.chunking import Chunk, iter_document_chunks
+from app.services.embedding_service import embed_documents
+from app.services.extractors import Extractor, TextUnit
+from app.services.quantization import bit_string, quantization_mode
+from app.services.rag_service import index_inserted_chunks, local_indexes_enabled, unindex_chunks
+
+
+# --- Pipeline Stages ---
+
+class UnitLocations:
+    '''
+    Remembers the location of the units whose text may still be in a
+    pending chunk, and copies it into the chunk metadata as
+    `location_start` / `location_end`.
+
+    Also hashes the text of every unit it passes along (`hashes`, by unit
+    number), so a run gets its `page_hashes` without a second extraction.
+    '''
+
+    def __init__(self):
+        self.locations: dict[int, dict] = {}
+        self.hashes: dict[int, str] = {}
+        self.last_unit = 0
+
+    def track(self, units: Iterable[TextUnit]) -> Iterator[tuple[int, str]]:
+        '''Yields (unit_number, text) for the chunker, recording each location and hash.'''
+        for number, text, location in units:
+            self.last_unit = number
+            self.hashes[number] = page_hash(text)
+            if location is not None:
+                self.locations[number] = location
+            yield number, text
+
+    def hash_list(self, first_unit: int, last_unit: int) -> list[str]:
+        '''Hashes of units first_unit..last_unit (units without text hash "").'''
+        empty = page_hash("")
+        return [self.hashes.get(number, empty) for number in range(first_unit, last_unit + 1)]
+
+    def annotate(self, chunks: Iterable[Chunk]) -> Iterator[Chunk]:
+        for chunk in chunks:
+            if self.locations:
+                start, end = chunk.metadata['page_start'], chunk.metadata['page_end']
+                if start in self.locations:
+                    chunk.metadata['location_start'] = self.locations[start]
+                if end in self.locations:
+                    chunk.metadata['location_end'] = self.locations[end]
+                # Chunks chegam em ordem: unidades anteriores não serão mais usadas
+                for number in [n for n in self.locations if n < start]:
+                    del self.locations[number]
+            yield chunk
+
+
+def iter_source_chunks(
+    source: Extractor,
+    start_unit: int = 1,
+    end_unit: int | None = None,
+    locations: UnitLocations | None = None,
+    timer: StageTimer | None = None,
+) -> Iterator[Chunk]:
+    '''Chunks the units start_unit..end_unit of an extractor, with their locations.'''
+    locations = locations or UnitLocations()
+    timer = timer or StageTimer()
+    units = locations.track(timer.iterate("extract", source.iter_units(start_unit, end_unit)))
+    return locations.annotate(timer.iterate("chunk", iter_document_chunks(units)))
+
+
+def write_chunks(writer: "ChunkWriter", chunks: Iterable[Chunk], title: str, timer: StageTimer) -> None:
+    '''Embeds chunks and hands them to the writer, timing the embed stage.'''
+    for chunk, embedding in timer.iterate("embed", iter_embedded(chunks, title=title)):
+        writer.add(chunk, embedding)
+
+
+def iter_embedded(
+    chunks: Iterable[Chunk],
+    *,
+    title: str | None = None,
+    window: int | None = None,
+) -> Iterator[tuple[Chunk, list[float]]]:
+    '''
+    Embeds chunks in windows of `window` items, yielding them in order.
+
+    The default window fills every concurrent batch of the embedding
+    service once, which bounds the number of chunks held in memory.
+    '''
+    window = window or settings.EMBEDDING_BATCH_SIZE * settings.EMBEDDING_MAX_CONCURRENCY
+    iterator = iter(chunks)
+    while batch := list(islice(iterator, window)):
+        vectors = embed_documents([chunk.content for chunk in batch], title=title)
+        yield from zip(batch, vectors)
+
+
+class ChunkWriter:
+    '''
+    Buffers embedded chunks and inserts them into `document_chunks` through
+    PostgREST.
+
+    After each flush the document checkpoint is advanced to the page
+    before the first page of the last inserted chunk: chunks arrive in
+    page order, so no later chunk can start on an earlier page. The
+    number of chunks written so far goes with it (`processed_chunks`).
+
+    Inserted chunks reach the local search indexes in batches of
+    INDEX_UPDATE_BATCH_SIZE and when the writer exits, not on every
+    flush: each index update publishes a new version with the whole
+    delta, so updating per insert batch would rewrite it over and over.
+    The checkpoint waits for the index update of its chunks: a resumed run
+    discards (and unindexes) what came after it, so no chunk is left out
+    of the indexes by a crash in between.
+
+    Used as a context manager; subclasses that write in a transaction
+    commit on a clean exit (see `app.services.copy_chunk_writer`).
+    '''
+
+    CHECKPOINT_AFTER_INDEXING = True
+
+    def __init__(
+        self,
+        supabase: Client,
+        document: dict,
+        batch_size: int | None = None,
+        track_checkpoint: bool = True,
+    ):
+        self.supabase = supabase
+        self.document = document
+        self.batch_size = batch_size or settings.INGESTION_INSERT_BATCH_SIZE
+        self.track_checkpoint = track_checkpoint
+        self.rows: list[dict] = []
+        self.inserted = 0
+        self.checkpoint: int | None = None
+        # Checkpoint à espera de os seus chunks entrarem nos índices locais
+        self.pending_checkpoint: int | None = None
+        # Uma execução retomada continua a contagem de chunks da anterior
+        self.processed_base = (document.get('processed_chunks') or 0) if document.get('last_processed_page') else 0
+        self.pending_index_rows: list[dict] = []
+
+    def add(self, chunk: Chunk, embedding: list[float]) -> None:
+        self.rows.append({
+            'document_id': self.document['id'],
+            'workspace_id': self.document['workspace_id'],
+            'user_id': self.document['user_id'],
+            'content': chunk.content,
+            'embedding': embedding,
+            'metadata': chunk.metadata,
+        })
+        if quantization_mode() == "binary":
+            # Bits de sinal para a primeira etapa da busca no Postgres (coluna bit(768))
+            self.rows[-1]['embedding_binary'] = bit_string(embedding)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # Cada lote do PostgREST já está gravado: indexa mesmo se a execução falhou
+        self.update_indexes()
+        return False
+
+    def _insert(self, rows: list[dict]) -> None:
+        result = self.supabase.table('document_chunks').insert(rows).execute()
+        self.queue_for_indexes(rows, [row['id'] for row in result.data])
+        if len(self.pending_index_rows) >= settings.INDEX_UPDATE_BATCH_SIZE:
+            self.update_indexes()
+
+    def queue_for_indexes(self, rows: list[dict], chunk_ids: list[int]) -> None:
+        '''Keeps what the local indexes need of the inserted rows until `update_indexes`.'''
+        if not local_indexes_enabled():
+            return
+        self.pending_index_rows.extend({
+            'id': chunk_id,
+            'document_id': row['document_id'],
+            'content': row['content'],
+            # float32 em vez da lista de floats do Python: ~8x menos memória no buffer
+            'embedding': np.asarray(row['embedding'], dtype=np.float32),
+        } for row, chunk_id in zip(rows, chunk_ids))
+
+    def update_indexes(self) -> None:
+        '''Adds the queued chunks to the local indexes (one new version per index).'''
+        if self.pending_index_rows:
+            rows, self.pending_index_rows = self.pending_index_rows, []
+            index_inserted_chunks(self.supabase, self.document['workspace_id'], rows)
+        if self.pending_checkpoint is not None:
+            self._save_checkpoint(self.pending_checkpoint)
+            self.checkpoint, self.pending_checkpoint = self.pending_checkpoint, None
+
+    def _save_checkpoint(self, page_number: int) -> None:
+        save_checkpoint(self.supabase, self.document['id'], page_number, self.processed_base + self.inserted)
+
+    def flush(self, completed_page: int | None = None) -> None:
+        '''Inserts buffered rows and records the checkpoint.'''
+        if self.rows:
+            self._insert(self.rows)
+            self.inserted += len(self.rows)
+            # A página inicial do último chunk pode ainda ter chunks pendentes
+            last_page = self.rows[-1]['metadata']['page_number'] - 1
+            self.rows = []
+            completed_page = max(completed_page or 0, last_page)
+
+        if not self.track_checkpoint:
+            return
+        if completed_page and completed_page > (self.checkpoint or 0):
+            if self.pending_index_rows and self.CHECKPOINT_AFTER_INDEXING:
+                self.pending_checkpoint = completed_page
+                return
+            self._save_checkpoint(completed_page)
+            self.checkpoint = completed_page
+
+
+def make_chunk_writer(supabase: Client, document: dict, track_checkpoint: bool = True) -> ChunkWriter:
+    '''
+    Returns the writer selected by CHUNK_WRITER_BACKEND. "copy" writes
+    through a direct Postgres connection and falls back to PostgREST when
+    the connection or its setup fails.
+    '''
+    if settings.CHUNK_WRITER_BACKEND.lower() == "copy":
+        # Import tardio: psycopg2 só é necessário com o backend "copy"
+        from app.services.copy_chunk_writer import CopyChunkWriter, CopyWriterUnavailable
+        try:
+            return CopyChunkWriter(supabase, document, track_checkpoint=track_checkpoint)
+        except CopyWriterUnavailable as e:
+            print(f"COPY chunk writer unavailable, falling back to PostgREST: {e}")
+    return ChunkWriter(supabase, document, track_checkpoint=track_checkpoint)
+
+
+# --- Checkpoints ---
+
+def save_checkpoint(
+    supabase: Client, document_id: int, page_number: int | None, processed_chunks: int | None = None,
+) -> None:
+    '''Records the last fully committed page of a document (None clears it) and the chunks written.'''
+    update = {'last_processed_page': page_number}
+    if processed_chunks is not None:
+        update['processed_chunks'] = processed_chunks
+    supabase.table('documents').update(update).eq('id', document_id).execute()
+
+
+def discard_uncommitted_chunks(
+    supabase: Client, document_id: int, after_page: int, through_page: int | None = None,
+) -> None:
+    '''Deletes chunks of pages after_page+1..through_page left behind by an interrupted run.'''
+    query = supabase.table('document_chunks').delete() \
+        .eq('document_id', document_id) \
+        .gt('metadata->page_number', after_page)
+    if through_page is not None:
+        query = query.lte('metadata->page_number', through_page)
+    deleted = query.execute().data or []
+    if deleted:
+        unindex_chunks(deleted[0]['workspace_id'], [row['id'] for row in deleted])
+
+
+# --- Fan-out ---
+
+def plan_page_ranges(page_count: int, range_size: int) -> list[tuple[int, int]]:
+    '''Splits pages 1..page_count into contiguous (first_page, last_page) ranges.'''
+    range_size = max(1, range_size)
+    return [
+        (first, min(first + range_size - 1, page_count))
+        for first in range(1, page_count + 1, range_size)
+    ]
+
+
+def run_pipeline(
+    supabase: Client, document: dict, source: Extractor, timer: StageTimer | None = None,
+) -> tuple[int, list[str]]:
+    '''
+    Streams a document through the pipeline, resuming after the stored checkpoint.
+
+    Returns the number of chunks inserted by this run and the hashes of
+    every unit of the document (the units before the checkpoint are
+    extracted again only to be hashed).
+    '''
+    timer = timer or StageTimer()
+    resume_after = document.get('last_processed_page') or 0
+    discard_uncommitted_chunks(supabase, document['id'], resume_after)
+    if resume_after:
+        print(f"Resuming document {document['id']} after page {resume_after}.")
+
+    locations = UnitLocations()
+    if resume_after:
+        # Páginas já gravadas pela execução anterior: só os hashes delas
+        with timer.stage("extract"):
+            locations.hashes.update(zip(range(1, resume_after + 1), unit_hashes(source, 1, resume_after)))
+    chunks = iter_source_chunks(source, resume_after + 1, locations=locations, timer=timer)
+    title = f"Chunk from {document.get('name', 'document')}"
+    # O tempo dos estágios internos (extração, chunking, embedding) é descontado do insert
+    with timer.stage("insert"), make_chunk_writer(supabase, document) as writer:
+        write_chunks(writer, chunks, title, timer)
+        unit_count = source.unit_count or max(locations.last_unit, resume_after)
+        writer.flush(completed_page=unit_count)
+    return writer.inserted, locations.hash_list(1, unit_count)
+
+
+def run_page_range(
+    supabase: Client,
+    document: dict,
+    source: Extractor,
+    first_page: int,
+    last_page: int,
+    timer: StageTimer | None = None,
+) -> tuple[int, list[str]]:
+    '''
+    Processes pages first_page..last_page independently of other ranges.
+
+    Used by the fan-out subtasks: the range is idempotent (its previous
+    chunks are discarded first) and does not touch the document checkpoint.
+    Returns the chunks inserted and the hashes of the pages of the range.
+    '''
+    discard_uncommitted_chunks(supabase, document['id'], first_page - 1, last_page)
+
+    timer = timer or StageTimer()
+    locations = UnitLocations()
+    chunks = iter_source_chunks(source, first_page, last_page, locations=locations, timer=timer)
+    title = f"Chunk from {document.get('name', 'document')}"
+    with timer.stage("insert"), make_chunk_writer(supabase, document, track_checkpoint=False) as writer:
+        write_chunks(writer, chunks, title, timer)
+        writer.flush()
+    return writer.inserted, locations.hash_list(first_page, last_page)
+
+
+# --- Incremental re-ingestion ---
+# Cada documento processado guarda em `documents.page_hashes` o hash do texto
+# de cada página (unidade). Reprocessar uma nova versão do arquivo compara os
+# hashes e só refaz os chunks das páginas alteradas.
+
+# Chunks removidos por requisição (o filtro `in` vai na URL)
+DELETE_BATCH_SIZE = 200
+
+
+def page_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def unit_hashes(source: Extractor, start_unit: int = 1, end_unit: int | None = None) -> list[str]:
+    '''
+    Hashes of the text of units start_unit..end_unit (default: every
+    unit), indexed by unit_number - start_unit (units without text hash "").
+    '''
+    hashes: list[str] = []
+    for number, text, _ in source.iter_units(start_unit, end_unit):
+        hashes.extend([page_hash("")] * (number - start_unit - len(hashes)))
+        hashes.append(page_hash(text))
+    last_unit = end_unit if end_unit is not None else (source.unit_count or 0)
+    hashes.extend([page_hash("")] * (last_unit - start_unit + 1 - len(hashes)))
+    return hashes
+
+
+def fetch_chunk_spans(supabase: Client, document_id: int) -> list[tuple[int, int, int]]:
+    '''(chunk_id, page_start, page_end) of the chunks of a document, paged by id.'''
+    spans, last_id = [], 0
+    while True:
+        rows = supabase.table('document_chunks').select('id, metadata') \
+            .eq('document_id', document_id).gt('id', last_id) \
+            .order('id').limit(1000).execute().data or []
+        for row in rows:
+            metadata = row['metadata'] or {}
+            start = metadata.get('page_start', metadata.get('page_number', 1))
+            spans.append((row['id'], start, metadata.get('page_end', start)))
+        if len(rows) < 1000:
+            return spans
+        last_id = rows[-1]['id']
+
+
+def plan_incremental(
+    old_hashes: list[str], new_hashes: list[str], spans: list[tuple[int, int, int]],
+) -> tuple[list[tuple[int, int]], list[int]]:
+    '''
+    Returns the page ranges to re-chunk and the ids of the stale chunks.
+
+    Pages are dirty when their hash changed, when they were added or
+    removed, or when a chunk that touches a dirty page also covers them:
+    chunks cross page boundaries, so the re-chunked ranges must start and
+    end where no surviving chunk does.
+    '''
+    page_total = max(len(old_hashes), len(new_hashes))
+    dirty = [False] * (page_total + 2)
+    for page in range(1, page_total + 1):
+        index = page - 1
+        if index >= len(old_hashes) or index >= len(new_hashes) or old_hashes[index] != new_hashes[index]:
+            dirty[page] = True
+
+    stale: set[int] = set()
+    changed = True
+    while changed:
+        changed = False
+        for chunk_id, start, end in spans:
+            if chunk_id in stale:
+                continue
+            start, end = max(start, 1), min(end, page_total)
+            if any(dirty[start:end + 1]):
+                stale.add(chunk_id)
+                for page in range(start, end + 1):
+                    changed |= not dirty[page]
+                    dirty[page] = True
+
+    ranges: list[tuple[int, int]] = []
+    for page in range(1, len(new_hashes) + 1):
+        if not dirty[page]:
+            continue
+        if ranges and ranges[-1][1] == page - 1:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges, sorted(stale)
+
+
+def delete_chunks(supabase: Client, workspace_id: int, chunk_ids: list[int]) -> None:
+    '''Deletes chunks by id in batches and removes them from the local indexes.'''
+    for start in range(0, len(chunk_ids), DELETE_BATCH_SIZE):
+        batch = chunk_ids[start:start + DELETE_BATCH_SIZE]
+        supabase.table('document_chunks').delete().in_('id', batch).execute()
+    unindex_chunks(workspace_id, chunk_ids)
+
+
+def run_incremental(
+    supabase: Client,
+    document: dict,
+    source: Extractor,
+    old_hashes: list[str],
+    new_hashes: list[str],
+    timer: StageTimer | None = None,
+) -> tuple[int, int, int]:
+    '''
+    Re-processes only the pages whose text changed since the last run.
+
+    New chunks of the dirty ranges are inserted before the stale ones are
+    deleted, so the document stays searchable meanwhile. The run is
+    idempotent: if it fails, the stored hashes are still the old ones and
+    the retry also treats the chunks inserted by the failed run as stale.
+
+    Returns (chunks inserted, chunks deleted, chunks of the document).
+    '''
+    timer = timer or StageTimer()
+    spans = fetch_chunk_spans(supabase, document['id'])
+    ranges, stale = plan_incremental(old_hashes, new_hashes, spans)
+    dirty_pages = sum(last - first + 1 for first, last in ranges)
+    print(f"Incremental update of document {document['id']}: {dirty_pages}/{len(new_hashes)} pages "
+          f"in {len(ranges)} ranges, {len(stale)}/{len(spans)} chunks stale.")
+
+    title = f"Chunk from {document.get('name', 'document')}"
+    with timer.stage("insert"):
+        with make_chunk_writer(supabase, document, track_checkpoint=False) as writer:
+            for first, last in ranges:
+                write_chunks(writer, iter_source_chunks(source, first, last, timer=timer), title, timer)
+            writer.flush()
+        delete_chunks(supabase, document['workspace_id'], stale)
+    return writer.inserted, len(stale), len(spans) - len(stale) + writer.inserted
+
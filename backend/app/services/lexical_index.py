@@ -0,0 +1,366 @@
+# backend/app/services/lexical_index.py
+'''
+Per-workspace BM25 inverted index over `document_chunks.content`.
+
+Complements vector search on exact identifiers that embeddings handle
+poorly: clause numbers ("5.2.1"), CNPJs ("12.345.678/0001-90"),
+product codes ("XPT-2040"). Compound tokens are indexed whole, without
+punctuation ("12345678000190") and split into their parts, so any of
+these spellings matches.
+
+Each version of a workspace index (see `app.services.index_storage`)
+holds a base and a delta segment, each stored as CSR arrays sorted by
+term, plus tombstones:
+
+    {segment}_terms.npy         (t,) unicode, sorted vocabulary
+    {segment}_term_offsets.npy  (t + 1,) int64, postings of term i
+    {segment}_posting_rows.npy  (p,) int32, row of each posting
+    {segment}_posting_tfs.npy   (p,) int32, term frequency
+    {segment}_chunk_ids.npy, {segment}_document_ids.npy, {segment}_lengths.npy
+    deleted.npy                 tombstoned chunk ids, sorted
+
+New chunks are merged into the delta segment; deletions are tombstoned;
+both are folded into the base once they exceed a fraction of it.
+'''
+
+import math
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.index_storage import WorkspaceIndexStore, needs_rebuild
+
+# Parâmetros usuais do BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Tokens mais longos são truncados (o vocabulário é um array de largura fixa)
+MAX_TOKEN_LENGTH = 32
+# Delta + removidos acima dessa fração da base disparam a reconstrução
+_REBUILD_RATIO = 0.2
+_REBUILD_MIN_ROWS = 2000
+
+_SEGMENT_ARRAYS = ("terms", "term_offsets", "posting_rows", "posting_tfs", "chunk_ids", "document_ids", "lengths")
+_SEGMENTS = ("base", "delta")
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[./\-][a-z0-9]+)*")
+_SEPARATORS = re.compile(r"[./\-]")
+
+STOPWORDS = frozenset("""
+a ao aos as at com como da das de del dela dele do dos e ela ele em entre era essa esse esta este eu
+foi ha isso isto ja la mais mas me mesmo na nas nao nem no nos o os ou para pela pelas pelo pelos
+por qual quais quando que quem se sem ser seu seus sua suas sao tambem te tem um uma umas uns voce
+the of and to in is for on
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    '''Lower-cases, strips accents and splits text into index terms.'''
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+
+    tokens = []
+    for match in _TOKEN.finditer(text):
+        token = match.group()[:MAX_TOKEN_LENGTH]
+        parts = _SEPARATORS.split(token)
+        if len(parts) > 1:
+            tokens.append(token)
+            tokens.append("".join(parts)[:MAX_TOKEN_LENGTH])
+        tokens.extend(part for part in parts
+                      if part not in STOPWORDS and (len(part) > 1 or part.isdigit()))
+    return tokens
+
+
+def _empty_segment() -> dict[str, np.ndarray]:
+    return {
+        "terms": np.empty(0, f"<U{MAX_TOKEN_LENGTH}"),
+        "term_offsets": np.zeros(1, np.int64),
+        "posting_rows": np.empty(0, np.int32),
+        "posting_tfs": np.empty(0, np.int32),
+        "chunk_ids": np.empty(0, np.int64),
+        "document_ids": np.empty(0, np.int64),
+        "lengths": np.empty(0, np.int32),
+    }
+
+
+def _count_terms(texts: list[str]) -> tuple[np.ndarray, ...]:
+    '''
+    Tokenizes texts into postings: (vocabulary, term_index, rows, tfs),
+    where term_index points into the (unsorted) vocabulary, plus the
+    length of each row in tokens.
+    '''
+    ids: dict[str, int] = {}
+    term_index, rows, tfs, lengths = array("i"), array("i"), array("i"), array("i")
+    for row, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            term_index.append(ids.setdefault(term, len(ids)))
+            rows.append(row)
+            tfs.append(tf)
+        lengths.append(sum(counts.values()))
+    return (np.asarray(list(ids), f"<U{MAX_TOKEN_LENGTH}"), np.asarray(term_index, np.int32),
+            np.asarray(rows, np.int32), np.asarray(tfs, np.int32), np.asarray(lengths, np.int32))
+
+
+def _build_segment(vocabulary, term_index, rows, tfs, chunk_ids, document_ids, lengths) -> dict[str, np.ndarray]:
+    '''
+    Builds a CSR segment from postings. The vocabulary may be unsorted and
+    repeat terms (concatenated vocabularies when merging segments).
+    '''
+    if not len(chunk_ids):
+        return _empty_segment()
+    terms, inverse = np.unique(vocabulary, return_inverse=True)
+    term_index = inverse.reshape(-1)[term_index]
+    order = np.lexsort((rows, term_index))
+    return {
+        "terms": terms.astype(f"<U{MAX_TOKEN_LENGTH}"),
+        "term_offsets": np.searchsorted(term_index[order], np.arange(len(terms) + 1)).astype(np.int64),
+        "posting_rows": np.asarray(rows, np.int32)[order],
+        "posting_tfs": np.asarray(tfs, np.int32)[order],
+        "chunk_ids": np.asarray(chunk_ids, np.int64),
+        "document_ids": np.asarray(document_ids, np.int64),
+        "lengths": np.asarray(lengths, np.int32),
+    }
+
+
+@dataclass
+class Segment:
+    terms: np.ndarray
+    term_offsets: np.ndarray
+    posting_rows: np.ndarray
+    posting_tfs: np.ndarray
+    chunk_ids: np.ndarray
+    document_ids: np.ndarray
+    lengths: np.ndarray
+
+    def postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        '''(rows, tfs) of a term, empty if it is not in the segment.'''
+        position = np.searchsorted(self.terms, term)
+        if position == len(self.terms) or self.terms[position] != term:
+            return self.posting_rows[:0], self.posting_tfs[:0]
+        start, end = self.term_offsets[position], self.term_offsets[position + 1]
+        return self.posting_rows[start:end], self.posting_tfs[start:end]
+
+    def postings_list(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''Every posting as (term_index, row, tf), term_index pointing into `terms`.'''
+        term_index = np.repeat(np.arange(len(self.terms), dtype=np.int32), np.diff(self.term_offsets))
+        return term_index, np.asarray(self.posting_rows), np.asarray(self.posting_tfs)
+
+
+@dataclass
+class LexicalSnapshot:
+    '''One immutable version of a workspace lexical index.'''
+    version: str
+    base: Segment
+    delta: Segment
+    deleted: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.base.chunk_ids) + len(self.delta.chunk_ids) - len(self.deleted)
+
+    def all_chunk_ids(self) -> np.ndarray:
+        return np.concatenate([self.base.chunk_ids, self.delta.chunk_ids])
+
+    def search(self, query: str, k: int) -> tuple[np.ndarray, np.ndarray]:
+        '''Returns (chunk_ids, BM25 scores) of the best `k` chunks, best first.'''
+        terms = list(dict.fromkeys(tokenize(query)))
+        segments = (self.base, self.delta)
+        rows = sum(len(segment.chunk_ids) for segment in segments)
+        if not terms or not rows:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+
+        count = max(len(self), 1)
+        average_length = max(sum(float(np.sum(segment.lengths)) for segment in segments) / rows, 1.0)
+        postings = {term: [segment.postings(term) for segment in segments] for term in terms}
+
+        ids, scores = [], []
+        for index, segment in enumerate(segments):
+            if not len(segment.chunk_ids):
+                continue
+            accumulator = np.zeros(len(segment.chunk_ids), np.float32)
+            norms = BM25_K1 * (1 - BM25_B + BM25_B * np.asarray(segment.lengths, np.float32) / average_length)
+            for term in terms:
+                document_frequency = sum(len(term_rows) for term_rows, _ in postings[term])
+                if not document_frequency:
+                    continue
+                idf = math.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5))
+                term_rows, tfs = postings[term][index]
+                tfs = tfs.astype(np.float32)
+                np.add.at(accumulator, term_rows, idf * tfs * (BM25_K1 + 1) / (tfs + norms[term_rows]))
+            matched = np.flatnonzero(accumulator)
+            ids.append(segment.chunk_ids[matched])
+            scores.append(accumulator[matched])
+
+        ids = np.concatenate(ids) if ids else np.empty(0, np.int64)
+        scores = np.concatenate(scores) if scores else np.empty(0, np.float32)
+        if len(self.deleted):
+            keep = ~np.isin(ids, self.deleted)
+            ids, scores = ids[keep], scores[keep]
+        if len(scores) > k:
+            top = np.argpartition(scores, -k)[-k:]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return ids[order], scores[order]
+
+
+def _segment_files(arrays: dict[str, np.ndarray], segment: str) -> dict[str, np.ndarray]:
+    return {f"{segment}_{name}": array for name, array in arrays.items()}
+
+
+class LexicalIndexStore(WorkspaceIndexStore):
+    '''Loads, searches and updates the BM25 workspace indexes under `root`.'''
+
+    FILES = tuple(f"{segment}_{name}" for segment in _SEGMENTS for name in _SEGMENT_ARRAYS) + ("deleted",)
+    NAME = "lexical index"
+
+    def _make_snapshot(self, version: str, arrays: dict[str, np.ndarray]) -> LexicalSnapshot:
+        base, delta = (Segment(**{name: arrays[f"{segment}_{name}"] for name in _SEGMENT_ARRAYS})
+                       for segment in _SEGMENTS)
+        return LexicalSnapshot(version=version, base=base, delta=delta, deleted=arrays["deleted"])
+
+    def search(self, workspace_id: int, query: str, k: int) -> tuple[np.ndarray, np.ndarray] | None:
+        '''Returns (chunk_ids, scores), or None if the workspace has no index.'''
+        snapshot = self.snapshot(workspace_id)
+        if snapshot is None:
+            return None
+        return snapshot.search(query, k)
+
+    # --- Escrita ---
+
+    @staticmethod
+    def _full_version(chunk_ids, document_ids, texts) -> dict[str, np.ndarray]:
+        vocabulary, term_index, rows, tfs, lengths = _count_terms(list(texts))
+        segment = _build_segment(vocabulary, term_index, rows, tfs, chunk_ids, document_ids, lengths)
+        return {
+            **_segment_files(segment, "base"),
+            **_segment_files(_empty_segment(), "delta"),
+            "deleted": np.empty(0, np.int64),
+        }
+
+    @staticmethod
+    def _merge(segments: list[Segment], deleted: np.ndarray, extra=None) -> dict[str, np.ndarray]:
+        '''Merges segments (minus `deleted`) and optional new (chunk_ids, document_ids, texts) into one.'''
+        vocabularies, term_indexes, all_rows, all_tfs = [], [], [], []
+        chunk_ids, document_ids, lengths = [], [], []
+        next_row = next_term = 0
+
+        def append(vocabulary, term_index, rows, tfs, ids, documents, row_lengths):
+            nonlocal next_row, next_term
+            vocabularies.append(vocabulary)
+            term_indexes.append(term_index + next_term)
+            all_rows.append(rows + next_row)
+            all_tfs.append(tfs)
+            chunk_ids.append(ids)
+            document_ids.append(documents)
+            lengths.append(row_lengths)
+            next_row += len(ids)
+            next_term += len(vocabulary)
+
+        for segment in segments:
+            keep = ~np.isin(segment.chunk_ids, deleted)
+            # Nova posição de cada linha mantida (-1 para as removidas)
+            remap = np.where(keep, np.cumsum(keep) - 1, -1).astype(np.int32)
+            term_index, rows, tfs = segment.postings_list()
+            kept = remap[rows] >= 0
+            append(np.asarray(segment.terms), term_index[kept], remap[rows][kept], tfs[kept],
+                   np.asarray(segment.chunk_ids)[keep], np.asarray(segment.document_ids)[keep],
+                   np.asarray(segment.lengths)[keep])
+        if extra is not None:
+            new_ids, new_documents, texts = extra
+            vocabulary, term_index, rows, tfs, new_lengths = _count_terms(list(texts))
+            append(vocabulary, term_index, rows, tfs, np.asarray(new_ids, np.int64),
+                   np.asarray(new_documents, np.int64), new_lengths)
+
+        return _build_segment(*(np.concatenate(parts) for parts in (
+            vocabularies, term_indexes, all_rows, all_tfs, chunk_ids, document_ids, lengths)))
+
+    def rebuild(self, workspace_id: int, chunk_ids, document_ids, texts) -> None:
+        '''Replaces the workspace index with one built from the given chunks.'''
+        if not len(chunk_ids):
+            self.drop(workspace_id)
+            return
+        with self._writer_lock(workspace_id) as directory:
+            self._write_version(directory, self._full_version(chunk_ids, document_ids, texts))
+
+    def add(self, workspace_id: int, chunk_ids, document_ids, texts, backfill=None) -> None:
+        '''
+        Adds chunks to the workspace index.
+
+        Same contract as `VectorIndexStore.add`: without an index,
+        `backfill()` returns every (chunk_ids, document_ids, texts) of the
+        workspace. Chunk ids already indexed are skipped.
+        '''
+        chunk_ids = np.asarray(chunk_ids, np.int64)
+        with self._writer_lock(workspace_id) as directory:
+            version = self._current_version(directory)
+            if version is None:
+                if backfill is not None:
+                    chunk_ids, document_ids, texts = backfill()
+                self._write_version(directory, self._full_version(chunk_ids, document_ids, texts))
+                return
+
+            current = self._load(directory, version)
+            new = ~np.isin(chunk_ids, current.all_chunk_ids())
+            if not new.any():
+                return
+            extra = (chunk_ids[new], np.asarray(document_ids, np.int64)[new],
+                     [text for text, is_new in zip(texts, new) if is_new])
+
+            pending = len(current.delta.chunk_ids) + int(new.sum()) + len(current.deleted)
+            if needs_rebuild(len(current.base.chunk_ids), pending, _REBUILD_RATIO, _REBUILD_MIN_ROWS):
+                base = self._merge([current.base, current.delta], current.deleted, extra)
+                self._write_version(directory, {
+                    **_segment_files(base, "base"), **_segment_files(_empty_segment(), "delta"),
+                    "deleted": np.empty(0, np.int64),
+                })
+            else:
+                delta = self._merge([current.delta], np.empty(0, np.int64), extra)
+                self._write_version(directory, _segment_files(delta, "delta"), link_from=version)
+
+    def remove_chunks(self, workspace_id: int, chunk_ids) -> None:
+        '''Tombstones chunks; the next rebuild drops them from the files.'''
+        with self._writer_lock(workspace_id) as directory:
+            version = self._current_version(directory)
+            if version is None:
+                return
+            current = self._load(directory, version)
+            removed = np.intersect1d(np.asarray(chunk_ids, np.int64), current.all_chunk_ids())
+            deleted = np.union1d(current.deleted, removed)
+            if len(deleted) == len(current.deleted):
+                return
+            pending = len(current.delta.chunk_ids) + len(deleted)
+            if needs_rebuild(len(current.base.chunk_ids), pending, _REBUILD_RATIO, _REBUILD_MIN_ROWS):
+                base = self._merge([current.base, current.delta], deleted)
+                self._write_version(directory, {
+                    **_segment_files(base, "base"), **_segment_files(_empty_segment(), "delta"),
+                    "deleted": np.empty(0, np.int64),
+                })
+            else:
+                self._write_version(directory, {"deleted": deleted}, link_from=version)
+
+    def remove_document(self, workspace_id: int, document_id: int) -> None:
+        '''Tombstones every chunk of a document.'''
+        snapshot = self.snapshot(workspace_id)
+        if snapshot is None:
+            return
+        chunk_ids = np.concatenate([
+            segment.chunk_ids[np.asarray(segment.document_ids) == document_id]
+            for segment in (snapshot.base, snapshot.delta)
+        ])
+        if len(chunk_ids):
+            self.remove_chunks(workspace_id, chunk_ids)
+
+
+_store: LexicalIndexStore | None = None
+
+
+def get_lexical_index() -> LexicalIndexStore:
+    '''Process-wide store rooted at LEXICAL_INDEX_DIR.'''
+    global _store
+    if _store is None:
+        _store = LexicalIndexStore(settings.LEXICAL_INDEX_DIR)
+    return _store
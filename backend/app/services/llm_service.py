@@ -0,0 +1,103 @@
+# backend/app/services/llm_service.py
+'''
+Google Gemini client configuration, prompt building and answer generation.
+
+Generation calls go through the shared rate limiter (gemini_client) as
+interactive work; a stream is retried only until it starts.
+'''
+
+from collections.abc import AsyncIterator
+
+import google.generativeai as genai
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import CHAT_CONTEXT_TOKENS
+from app.services.context_packing import estimate_tokens, pack_context
+from app.services.gemini_client import INTERACTIVE, call_gemini, stream_gemini, stream_gemini_async
+
+NO_CONTEXT_ANSWER = "Desculpe, não encontrei informações relevantes nos documentos para responder a essa pergunta."
+
+
+def configure_gemini():
+    '''Configures the Google Gemini API.'''
+    if settings.GEMINI_API_ENDPOINT:
+        # Permite apontar o SDK para um servidor compatível (ex.: fake local)
+        genai.configure(
+            api_key=settings.ORACULO_GEMINI_API_KEY,
+            transport="rest",
+            client_options={"api_endpoint": settings.GEMINI_API_ENDPOINT},
+        )
+    else:
+        genai.configure(api_key=settings.ORACULO_GEMINI_API_KEY)
+
+
+def build_prompt(question: str, chunks: list[dict]) -> str:
+    '''
+    Builds the RAG prompt from the retrieved chunks (most relevant first),
+    packed into passages within CONTEXT_TOKEN_BUDGET (see context_packing).
+    '''
+    passages = pack_context(chunks)
+    context_text = "\n\n".join([passage.text for passage in passages])
+    CHAT_CONTEXT_TOKENS.observe(estimate_tokens(context_text))
+    document_names = ", ".join(
+        list(dict.fromkeys([passage.document_name for passage in passages])))
+
+    return f"""
+        Você é o Oráculo, um assistente de IA especialista em análise de documentos.
+        Sua tarefa é responder à pergunta do usuário com base exclusivamente no contexto extraído dos seguintes documentos: {document_names}.
+        Seja preciso, objetivo e sempre baseie sua resposta nos trechos de texto fornecidos.
+        Se a informação não estiver no contexto, afirme claramente que não encontrou a resposta nos documentos analisados.
+
+        **Contexto Extraído dos Documentos:**
+        ---
+        {context_text}
+        ---
+
+        **Pergunta do Usuário:**
+        {question}
+
+        **Sua Resposta:**
+        """
+
+
+def generate_answer(prompt: str) -> str:
+    '''Generates the full answer for a prompt.'''
+    model = genai.GenerativeModel(settings.GENERATION_MODEL)
+    response = call_gemini("generate", model.generate_content, prompt, priority=INTERACTIVE)
+    return response.text
+
+
+def _chunk_text(chunk) -> str:
+    # `chunk.text` levanta erro quando o pedaço não tem partes de texto
+    if not chunk.candidates:
+        return ""
+    return "".join(part.text for part in chunk.candidates[0].content.parts)
+
+
+async def stream_answer(prompt: str) -> AsyncIterator[str]:
+    '''Yields the answer text as the model generates it.'''
+    model = genai.GenerativeModel(settings.GENERATION_MODEL)
+
+    if settings.GEMINI_API_ENDPOINT:
+        # O cliente assíncrono do SDK só suporta gRPC; com REST o stream
+        # síncrono é consumido no threadpool (e o SDK só o entrega completo)
+        response = await run_in_threadpool(
+            stream_gemini, "generate", model.generate_content, prompt, stream=True, priority=INTERACTIVE)
+        try:
+            async for chunk in iterate_in_threadpool(response):
+                if text := _chunk_text(chunk):
+                    yield text
+        finally:
+            # Cliente desconectado no meio do stream: libera a vaga de concorrência
+            response.close()
+        return
+
+    response = await stream_gemini_async(
+        "generate", model.generate_content_async, prompt, stream=True, priority=INTERACTIVE)
+    try:
+        async for chunk in response:
+            if text := _chunk_text(chunk):
+                yield text
+    finally:
+        response.close()
@@ -0,0 +1,120 @@
+# backend/app/services/pdf_extraction.py
+'''
+PDF text extraction, serial or spread across CPU cores.
+
+Each pool worker opens its own fitz document from the PDF source (the
+bytes, or the path of a file spooled to disk, passed once at worker
+start-up) and extracts disjoint page ranges. Results are
+yielded in page order with a bounded number of ranges in flight.
+'''
+
+import multiprocessing
+import os
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from app.core.config import settings
+
+# Documento aberto em cada processo do pool (ver _init_worker)
+_worker_document = None
+
+
+def iter_pages(
+    pdf_document, start_page: int = 1, end_page: int | None = None,
+) -> Iterator[tuple[int, str]]:
+    '''Yields (page_number, text) one page at a time for pages start_page..end_page (1-based).'''
+    end_page = min(end_page or pdf_document.page_count, pdf_document.page_count)
+    for index in range(start_page - 1, end_page):
+        page = pdf_document.load_page(index)
+        yield index + 1, page.get_text()
+
+
+def open_pdf(pdf_source: bytes | str):
+    '''Opens a PDF from its bytes or from a file path (read from disk on demand).'''
+    if isinstance(pdf_source, str):
+        return fitz.open(pdf_source, filetype="pdf")
+    return fitz.open(stream=pdf_source, filetype="pdf")
+
+
+def _init_worker(pdf_source: bytes | str) -> None:
+    global _worker_document
+    _worker_document = open_pdf(pdf_source)
+
+
+def _extract_range(first_page: int, last_page: int) -> list[str]:
+    return [text for _, text in iter_pages(_worker_document, first_page, last_page)]
+
+
+def _pool_available() -> bool:
+    # Processos daemon (ex.: filhos do pool prefork do Celery) não podem criar subprocessos
+    return not multiprocessing.current_process().daemon
+
+
+def extract_pages(
+    pdf_document,
+    pdf_source: bytes | str | None = None,
+    start_page: int = 1,
+    end_page: int | None = None,
+) -> Iterator[tuple[int, str]]:
+    '''
+    Yields (page_number, text) for pages start_page..end_page in page order.
+
+    Uses a process pool when the source (bytes or file path) is available,
+    the range has at least PDF_PARALLEL_MIN_PAGES pages and the current
+    process may fork; otherwise falls back to reading `pdf_document` serially.
+    '''
+    end_page = min(end_page or pdf_document.page_count, pdf_document.page_count)
+    page_total = end_page - start_page + 1
+    workers = settings.PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+
+    if (
+        pdf_source is None
+        or workers <= 1
+        or page_total < settings.PDF_PARALLEL_MIN_PAGES
+        or not _pool_available()
+    ):
+        yield from iter_pages(pdf_document, start_page, end_page)
+        return
+
+    yield from _extract_parallel(pdf_source, start_page, end_page, workers)
+
+
+def _extract_parallel(
+    pdf_source: bytes | str, start_page: int, end_page: int, workers: int,
+) -> Iterator[tuple[int, str]]:
+    range_size = max(1, settings.PDF_EXTRACTION_RANGE_SIZE)
+    ranges = [
+        (first, min(first + range_size - 1, end_page))
+        for first in range(start_page, end_page + 1, range_size)
+    ]
+    workers = min(workers, len(ranges))
+
+    # Nada de "fork": a tarefa já tem threads rodando (monitor de memória,
+    # threads de embedding de documentos anteriores, o gerenciador do próprio
+    # pool) e um filho herdaria travas seguradas por elas. Os workers nascem
+    # do forkserver, que já importou este módulo (e o fitz) uma vez; a fonte
+    # chega serializada só uma vez por worker (um caminho é só uma string)
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+    else:
+        context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=context,
+        initializer=_init_worker, initargs=(pdf_source,),
+    ) as pool:
+        pending = deque()
+        next_range = 0
+        # Mantém no máximo 2 faixas por worker em voo para limitar a memória
+        while pending or next_range < len(ranges):
+            while next_range < len(ranges) and len(pending) < workers * 2:
+                first, last = ranges[next_range]
+                pending.append((first, pool.submit(_extract_range, first, last)))
+                next_range += 1
+
+            first, future = pending.popleft()
+            for offset, text in enumerate(future.result()):
+                yield first + offset, text
@@ -0,0 +1,94 @@
+# backend/app/services/quantization.py
+'''
+Quantized codes of the chunk embeddings, for two-stage search: a coarse
+scan over the small codes picks a shortlist that is rescored with the
+exact float vectors.
+
+EMBEDDING_QUANTIZATION selects the codes:
+
+- "int8": one signed byte per dimension plus one float32 scale per
+  vector (symmetric, scale = max |x| / 127), ~4x smaller than float32.
+  Coarse scores are close to the exact ones, so a short shortlist keeps
+  the recall.
+- "binary": one bit per dimension (x > 0), 32x smaller. The local index
+  scores the bits against the float query (asymmetric); Postgres keeps
+  them in the `embedding_binary bit(768)` column (same bits as pgvector's
+  `binary_quantize`) and shortlists by Hamming distance. Coarse scores
+  are rougher than int8 ones, so the shortlist must be longer.
+- "" (default): no codes; searches score the float vectors directly.
+
+The shortlist has k * QUANTIZED_RESCORE_FACTOR rows.
+'''
+
+import numpy as np
+
+from app.core.config import settings
+
+MODES = ("int8", "binary")
+# Linhas por bloco ao converter os códigos para float32 (limita a memória temporária)
+_BLOCK_ROWS = 16384
+
+
+def quantization_mode() -> str | None:
+    '''The configured code type ("int8"/"binary"), or None for exact search.'''
+    mode = settings.EMBEDDING_QUANTIZATION.lower()
+    if not mode or mode == "none":
+        return None
+    if mode not in MODES:
+        raise ValueError(f"Unknown EMBEDDING_QUANTIZATION: {settings.EMBEDDING_QUANTIZATION}")
+    return mode
+
+
+def code_mode(codes: np.ndarray) -> str:
+    '''Code type of a code array: int8 codes are signed, binary codes are packed bytes.'''
+    return "int8" if codes.dtype == np.int8 else "binary"
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    '''(codes int8 (n, dim), scales float32 (n,)) with vectors ~= codes * scales[:, None].'''
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=-1) / 127 if vectors.size else np.empty(len(vectors), np.float32)
+    scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    '''Sign bits of each vector packed 8 per byte (uint8 (n, ceil(dim / 8))).'''
+    return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+
+def int8_scores(codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    '''Approximate dot products of the int8 rows with a float query.'''
+    query = np.asarray(query, dtype=np.float32)
+    scores = np.empty(len(codes), np.float32)
+    for start in range(0, len(codes), _BLOCK_ROWS):
+        block = slice(start, start + _BLOCK_ROWS)
+        scores[block] = (codes[block].astype(np.float32) @ query) * scales[block]
+    return scores
+
+
+def binary_scores(codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+    '''
+    Asymmetric scores of the packed sign bits against a float query: the
+    dot product of the query with the +-1 vector of each row (the bits
+    are unpacked block by block, so only the codes stay resident).
+    '''
+    query = np.asarray(query, dtype=np.float32)
+    total = query.sum()
+    scores = np.empty(len(codes), np.float32)
+    for start in range(0, len(codes), _BLOCK_ROWS):
+        block = slice(start, start + _BLOCK_ROWS)
+        bits = np.unpackbits(codes[block], axis=1, count=len(query)).astype(np.float32)
+        # (2 * bits - 1) @ query, sem materializar o vetor de sinais
+        scores[block] = 2 * (bits @ query) - total
+    return scores
+
+
+def bit_string(vector) -> str:
+    '''Text of a `bit(n)` value with the sign bits of `vector` (as pgvector's `binary_quantize`).'''
+    return ((np.asarray(vector, dtype=np.float32) > 0).astype(np.uint8) + ord("0")).tobytes().decode()
+
+
+def shortlist_size(k: int) -> int:
+    return max(k, k * settings.QUANTIZED_RESCORE_FACTOR)
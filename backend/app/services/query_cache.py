@@ -0,0 +1,155 @@
+# backend/app/services/query_cache.py
+'''
+Per-workspace cache of retrieval results and answers for chat questions.
+
+Entries are keyed by (workspace, generation, kind, normalized question).
+Invalidating a workspace bumps its generation, so every older entry
+stops matching at once and simply ages out through TTL/LRU eviction.
+
+The Redis backend (default) is shared by all API workers and sees the
+invalidations made by the Celery workers (`process_document`) and by
+other API processes. The memory backend is per process: it never sees
+an ingestion finished in a worker, so it only suits setups where the
+API process also ingests (e.g. local development).
+'''
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+_KEY_PREFIX = "qcache:v1:"
+_INDEX_KEY = "qcache:v1:index"
+
+
+def _question_hash(question: str) -> str:
+    normalized = " ".join(question.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class MemoryQueryCache:
+    '''Per-process TTL + LRU query cache.'''
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+        self._generations: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, workspace_id: int, kind: str, question: str) -> tuple:
+        return (workspace_id, self._generations.get(workspace_id, 0), kind, _question_hash(question))
+
+    def get(self, workspace_id: int, kind: str, question: str):
+        with self._lock:
+            key = self._key(workspace_id, kind, question)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, workspace_id: int, kind: str, question: str, value) -> None:
+        with self._lock:
+            key = self._key(workspace_id, kind, question)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, workspace_id: int) -> None:
+        with self._lock:
+            self._generations[workspace_id] = self._generations.get(workspace_id, 0) + 1
+
+
+class RedisQueryCache:
+    '''
+    Redis-backed query cache shared by every API and Celery process.
+
+    Entries expire after `ttl_seconds`; a sorted set indexes them by
+    insertion time so the oldest are evicted beyond `max_entries`. Redis
+    errors are logged and treated as misses.
+    '''
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    @staticmethod
+    def _generation_key(workspace_id: int) -> str:
+        return f"{_KEY_PREFIX}gen:{workspace_id}"
+
+    def _key(self, client: redis.Redis, workspace_id: int, kind: str, question: str) -> str:
+        generation = int(client.get(self._generation_key(workspace_id)) or 0)
+        return f"{_KEY_PREFIX}{workspace_id}:{generation}:{kind}:{_question_hash(question)}"
+
+    def get(self, workspace_id: int, kind: str, question: str):
+        try:
+            client = get_redis()
+            data = client.get(self._key(client, workspace_id, kind, question))
+        except redis.RedisError as e:
+            print(f"Query cache unavailable, skipping lookup: {e}")
+            return None
+        return json.loads(data) if data is not None else None
+
+    def set(self, workspace_id: int, kind: str, question: str, value) -> None:
+        try:
+            client = get_redis()
+            key = self._key(client, workspace_id, kind, question)
+            pipe = client.pipeline(transaction=False)
+            pipe.set(key, json.dumps(value, default=str), ex=self.ttl_seconds)
+            pipe.zadd(_INDEX_KEY, {key: time.time()})
+            # Remove do índice as chaves que já expiraram pelo TTL
+            pipe.zremrangebyscore(_INDEX_KEY, 0, time.time() - self.ttl_seconds)
+            pipe.zcard(_INDEX_KEY)
+            size = pipe.execute()[-1]
+
+            overflow = size - self.max_entries
+            if overflow > 0:
+                evicted = [member for member, _ in client.zpopmin(_INDEX_KEY, overflow)]
+                if evicted:
+                    client.delete(*evicted)
+        except redis.RedisError as e:
+            print(f"Query cache unavailable, skipping store: {e}")
+
+    def invalidate(self, workspace_id: int) -> None:
+        try:
+            get_redis().incr(self._generation_key(workspace_id))
+        except redis.RedisError as e:
+            print(f"Query cache unavailable, could not invalidate workspace {workspace_id}: {e}")
+
+
+_cache: MemoryQueryCache | RedisQueryCache | None = None
+
+
+def get_query_cache() -> MemoryQueryCache | RedisQueryCache | None:
+    '''Returns the configured cache, or None when caching is disabled.'''
+    global _cache
+    backend = settings.QUERY_CACHE_BACKEND.lower()
+    if backend == "none":
+        return None
+    if _cache is None:
+        if backend == "memory":
+            _cache = MemoryQueryCache(settings.QUERY_CACHE_TTL_SECONDS, settings.QUERY_CACHE_MAX_ENTRIES)
+        elif backend == "redis":
+            _cache = RedisQueryCache(settings.QUERY_CACHE_TTL_SECONDS, settings.QUERY_CACHE_MAX_ENTRIES)
+        else:
+            raise ValueError(f"Unknown QUERY_CACHE_BACKEND: {settings.QUERY_CACHE_BACKEND}")
+    return _cache
+
+
+def invalidate_workspace(workspace_id: int) -> None:
+    '''Drops every cached retrieval result and answer of a workspace.'''
+    cache = get_query_cache()
+    if cache is not None:
+        cache.invalidate(workspace_id)
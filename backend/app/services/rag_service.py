@@ -0,0 +1,378 @@
+# backend/app/services/rag_service.py
+'''
+Retrieval of the document chunks used as chat context.
+
+The backend is chosen by RETRIEVAL_BACKEND:
+
+- "postgres": exact search in the database via `match_document_chunks`
+  (two-stage `match_document_chunks_binary` with
+  EMBEDDING_QUANTIZATION="binary", see `app.services.quantization`).
+- "ivf": approximate search in the local per-workspace index
+  (`app.services.vector_index`), falling back to Postgres for
+  workspaces that have no index yet.
+
+Both return rows shaped like the RPC result: id, document_id, content,
+metadata, document_name and similarity.
+
+With RETRIEVAL_HYBRID, the vector candidates are fused with a BM25
+search over the chunk text (`app.services.lexical_index`) by reciprocal
+rank fusion, so exact identifiers (clause numbers, CNPJs, codes) make
+it into a small top-k. Fused rows also carry `rrf_score`; chunks found
+only lexically have `similarity` None.
+
+With RETRIEVAL_MMR, MMR_CANDIDATES candidates are fetched with their
+embeddings (from the local index, or from the
+`match_document_chunks_with_embedding` RPC) and the final k is picked by
+maximal marginal relevance (`app.services.reranking`), so the context is
+not filled with near-identical neighbours. The final k is the
+workspace's `retrieval_top_k`, or CONTEXT_CANDIDATES when unset.
+'''
+
+import base64
+import json
+import threading
+import time
+
+import numpy as np
+from postgrest.exceptions import APIError
+from supabase import Client
+
+from app.core.config import settings
+from app.services.lexical_index import get_lexical_index
+from app.services.quantization import quantization_mode, shortlist_size
+from app.services.reranking import rerank_mmr
+from app.services.vector_index import VectorIndexStore, get_vector_index
+
+# Linhas por página ao reconstruir um índice a partir de document_chunks
+BACKFILL_PAGE_SIZE = 1000
+
+
+# Código do PostgREST para função RPC inexistente (migração ainda não aplicada)
+_MISSING_FUNCTION = "PGRST202"
+
+
+class PostgresRetriever:
+    '''
+    Exact search in Postgres via the `match_document_chunks` RPC.
+
+    The variants added by later migrations (`..._with_embedding`,
+    `..._binary`) fall back to `match_document_chunks` while they are
+    missing from the database; the fallback rows carry no embeddings.
+    '''
+
+    def __init__(self):
+        self.missing_functions: set[str] = set()
+
+    def retrieve(
+        self, db: Client, workspace_id: int, query_embedding: list[float],
+        match_count: int, match_threshold: float, with_embeddings: bool = False,
+    ) -> list[dict]:
+        match_params = {
+            'query_embedding': query_embedding,
+            'p_workspace_id': workspace_id,
+            'match_threshold': match_threshold,
+            'match_count': match_count
+        }
+        if quantization_mode() == "binary":
+            # Duas etapas no banco: Hamming sobre embedding_binary, depois cosseno exato da shortlist
+            match_params['shortlist_count'] = shortlist_size(match_count)
+            match_params['with_embedding'] = with_embeddings
+            function = 'match_document_chunks_binary'
+        else:
+            # A variante com embedding devolve também o vetor de cada chunk (re-ranking MMR)
+            function = 'match_document_chunks_with_embedding' if with_embeddings else 'match_document_chunks'
+
+        if function != 'match_document_chunks' and function not in self.missing_functions:
+            try:
+                return db.rpc(function, match_params).execute().data or []
+            except APIError as e:
+                if e.code != _MISSING_FUNCTION:
+                    raise
+                # Lembra a ausência para não repetir a chamada que falha a cada pergunta
+                self.missing_functions.add(function)
+                print(f"RPC {function} not found (migration not applied?), using match_document_chunks: {e}")
+        base_params = {key: match_params[key] for key in
+                       ('query_embedding', 'p_workspace_id', 'match_threshold', 'match_count')}
+        return db.rpc('match_document_chunks', base_params).execute().data or []
+
+
+class VectorIndexRetriever:
+    '''
+    Approximate search in the local workspace index.
+
+    Only ids and vectors live in the index: the content of the matches is
+    read from `document_chunks` by primary key. Ids no longer in the
+    table (chunks deleted after the index was written) are skipped.
+    '''
+
+    def __init__(self, store: VectorIndexStore, fallback: PostgresRetriever):
+        self.store = store
+        self.fallback = fallback
+
+    def retrieve(
+        self, db: Client, workspace_id: int, query_embedding: list[float],
+        match_count: int, match_threshold: float, with_embeddings: bool = False,
+    ) -> list[dict]:
+        result = self.store.search(workspace_id, query_embedding, match_count, with_vectors=with_embeddings)
+        if result is None:
+            return self.fallback.retrieve(
+                db, workspace_id, query_embedding, match_count, match_threshold, with_embeddings)
+
+        chunk_ids, similarities = result[:2]
+        vectors = dict(zip(chunk_ids.tolist(), result[2])) if with_embeddings else {}
+        matches = {int(chunk_id): float(similarity)
+                   for chunk_id, similarity in zip(chunk_ids, similarities) if similarity > match_threshold}
+        rows = fetch_chunks(db, list(matches))
+        for row in rows.values():
+            row['similarity'] = matches[row['id']]
+            if with_embeddings:
+                row['embedding'] = vectors[row['id']]
+        return sorted(rows.values(), key=lambda row: row['similarity'], reverse=True)
+
+
+def fetch_chunks(db: Client, chunk_ids: list[int]) -> dict[int, dict]:
+    '''Reads chunks by id, with their document name. Ids no longer in the table are skipped.'''
+    if not chunk_ids:
+        return {}
+    rows = db.table('document_chunks').select('id, document_id, content, metadata') \
+        .in_('id', chunk_ids).execute().data or []
+    document_ids = sorted({row['document_id'] for row in rows})
+    names = {doc['id']: doc['name'] for doc in
+             db.table('documents').select('id, name').in_('id', document_ids).execute().data or []} \
+        if document_ids else {}
+    for row in rows:
+        row['document_name'] = names.get(row['document_id'], 'document')
+    return {row['id']: row for row in rows}
+
+
+def reciprocal_rank_fusion(rankings: list[list[int]], k: int = 60) -> list[tuple[int, float]]:
+    '''Fuses ranked id lists: score(id) = sum of 1 / (k + rank). Best first.'''
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda entry: entry[1], reverse=True)
+
+
+_postgres = PostgresRetriever()
+
+
+def get_retriever() -> PostgresRetriever | VectorIndexRetriever:
+    backend = settings.RETRIEVAL_BACKEND.lower()
+    if backend == "postgres":
+        return _postgres
+    if backend == "ivf":
+        return VectorIndexRetriever(get_vector_index(), _postgres)
+    raise ValueError(f"Unknown RETRIEVAL_BACKEND: {settings.RETRIEVAL_BACKEND}")
+
+
+def retrieve_chunks(
+    db: Client,
+    workspace_id: int,
+    query_embedding: list[float],
+    match_count: int = 5,
+    match_threshold: float = 0.2,
+    query_text: str | None = None,
+) -> list[dict]:
+    '''
+    Returns the chunks most similar to the query using the configured backend.
+
+    With RETRIEVAL_HYBRID and `query_text`, vector and BM25 candidates are
+    fused; workspaces without a lexical index use vector search alone.
+    With RETRIEVAL_MMR the `match_count` chunks are re-ranked by MMR out of
+    MMR_CANDIDATES candidates.
+    '''
+    retriever = get_retriever()
+    mmr = settings.RETRIEVAL_MMR and settings.MMR_CANDIDATES > match_count
+    pool = settings.MMR_CANDIDATES if mmr else match_count
+
+    if not (settings.RETRIEVAL_HYBRID and query_text):
+        rows = retriever.retrieve(db, workspace_id, query_embedding, pool, match_threshold, mmr)
+        return _rerank(rows, match_count) if mmr else rows
+
+    candidates = max(pool, settings.HYBRID_CANDIDATES)
+    vector_rows = retriever.retrieve(db, workspace_id, query_embedding, candidates, match_threshold, mmr)
+    lexical = get_lexical_index().search(workspace_id, query_text, candidates)
+    if lexical is None:
+        return _rerank(vector_rows[:pool], match_count) if mmr else vector_rows[:match_count]
+
+    fused = reciprocal_rank_fusion(
+        [[row['id'] for row in vector_rows], [int(chunk_id) for chunk_id in lexical[0]]],
+        k=settings.HYBRID_RRF_K,
+    )[:pool]
+    rows = {row['id']: row for row in vector_rows}
+    lexical_only = fetch_chunks(db, [chunk_id for chunk_id, _ in fused if chunk_id not in rows])
+    for row in lexical_only.values():
+        row['similarity'] = None
+    rows.update(lexical_only)
+
+    results = []
+    for chunk_id, score in fused:
+        if chunk_id in rows:
+            rows[chunk_id]['rrf_score'] = score
+            results.append(rows[chunk_id])
+    return _rerank(results, match_count) if mmr else results
+
+
+def decode_vector_b64(value: str) -> np.ndarray:
+    '''Decodes `encode(vector_send(v), 'base64')`: int16 dim, int16 unused, big-endian float4s.'''
+    return np.frombuffer(base64.b64decode(value), dtype=">f4", offset=4).astype(np.float32)
+
+
+def _embedding_matrix(rows: list[dict]) -> np.ndarray | None:
+    '''
+    Pops the embedding of each row into a matrix (zeros where missing);
+    None if no row has one. Rows from the local index carry `embedding`
+    (an array); rows from the RPCs carry `embedding_b64`.
+    '''
+    vectors = []
+    for row in rows:
+        value = row.pop('embedding', None)
+        encoded = row.pop('embedding_b64', None)
+        if encoded is not None:
+            value = decode_vector_b64(encoded)
+        vectors.append(None if value is None else np.asarray(value, np.float32))
+    dim = next((len(vector) for vector in vectors if vector is not None), None)
+    if dim is None:
+        return None
+    return np.stack([vector if vector is not None else np.zeros(dim, np.float32) for vector in vectors])
+
+
+def _rerank(rows: list[dict], match_count: int) -> list[dict]:
+    '''MMR stage: picks `match_count` rows and drops the embeddings from every row.'''
+    vectors = _embedding_matrix(rows)
+    if vectors is None:
+        return rows[:match_count]
+    return rerank_mmr(rows, vectors, match_count)
+
+
+_top_k_cache: dict[int, tuple[float, int]] = {}
+_top_k_lock = threading.Lock()
+# Por quanto tempo o k de um workspace fica em memória antes de ser relido
+_TOP_K_TTL_SECONDS = 60.0
+
+
+def workspace_top_k(db: Client, workspace_id: int) -> int:
+    '''Final number of chunks of a workspace: `workspaces.retrieval_top_k`, or CONTEXT_CANDIDATES.'''
+    now = time.monotonic()
+    with _top_k_lock:
+        cached = _top_k_cache.get(workspace_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    top_k = settings.CONTEXT_CANDIDATES
+    try:
+        rows = db.table('workspaces').select('retrieval_top_k').eq('id', workspace_id).execute().data or []
+        if rows and rows[0].get('retrieval_top_k'):
+            top_k = int(rows[0]['retrieval_top_k'])
+    except APIError as e:
+        # Ex.: migração 005 ainda não aplicada
+        print(f"Could not read retrieval_top_k of workspace {workspace_id}: {e}")
+    with _top_k_lock:
+        _top_k_cache[workspace_id] = (now + _TOP_K_TTL_SECONDS, top_k)
+    return top_k
+
+
+# --- Manutenção dos índices locais ---
+
+def _parse_embedding(value) -> list[float]:
+    # pgvector chega pelo PostgREST como texto: "[0.1,0.2,...]"
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def _vector_index_enabled() -> bool:
+    return settings.RETRIEVAL_BACKEND.lower() == "ivf"
+
+
+def local_indexes_enabled() -> bool:
+    '''Whether inserted chunks must be added to a local index.'''
+    return _vector_index_enabled() or settings.RETRIEVAL_HYBRID
+
+
+def _iter_workspace_chunks(db: Client, workspace_id: int, columns: str):
+    '''Pages through the `document_chunks` of a workspace by id.'''
+    last_id = 0
+    while True:
+        rows = db.table('document_chunks').select(f'id, document_id, {columns}') \
+            .eq('workspace_id', workspace_id).gt('id', last_id) \
+            .order('id').limit(BACKFILL_PAGE_SIZE).execute().data or []
+        yield from rows
+        if len(rows) < BACKFILL_PAGE_SIZE:
+            return
+        last_id = rows[-1]['id']
+
+
+def load_workspace_vectors(db: Client, workspace_id: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''Reads (chunk_ids, document_ids, vectors) of a workspace from `document_chunks`.'''
+    chunk_ids, document_ids, vectors = [], [], []
+    for row in _iter_workspace_chunks(db, workspace_id, 'embedding'):
+        chunk_ids.append(row['id'])
+        document_ids.append(row['document_id'])
+        vectors.append(_parse_embedding(row['embedding']))
+    vectors = np.asarray(vectors, np.float32) if vectors else np.empty((0, 0), np.float32)
+    return np.asarray(chunk_ids, np.int64), np.asarray(document_ids, np.int64), vectors
+
+
+def load_workspace_texts(db: Client, workspace_id: int) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    '''Reads (chunk_ids, document_ids, contents) of a workspace from `document_chunks`.'''
+    rows = list(_iter_workspace_chunks(db, workspace_id, 'content'))
+    return (np.asarray([row['id'] for row in rows], np.int64),
+            np.asarray([row['document_id'] for row in rows], np.int64),
+            [row['content'] for row in rows])
+
+
+def index_inserted_chunks(db: Client, workspace_id: int, rows: list[dict]) -> None:
+    '''
+    Adds freshly inserted `document_chunks` rows to the local indexes
+    enabled by RETRIEVAL_BACKEND ("ivf") and RETRIEVAL_HYBRID.
+
+    The first insert of a workspace without an index builds it from every
+    chunk of the workspace, so the index never misses older documents.
+    '''
+    if not rows:
+        return
+    chunk_ids = [row['id'] for row in rows]
+    document_ids = [row['document_id'] for row in rows]
+    if _vector_index_enabled():
+        get_vector_index().add(
+            workspace_id, chunk_ids, document_ids,
+            [_parse_embedding(row['embedding']) for row in rows],
+            backfill=lambda: load_workspace_vectors(db, workspace_id),
+        )
+    if settings.RETRIEVAL_HYBRID:
+        get_lexical_index().add(
+            workspace_id, chunk_ids, document_ids, [row['content'] for row in rows],
+            backfill=lambda: load_workspace_texts(db, workspace_id),
+        )
+
+
+def unindex_chunks(workspace_id: int, chunk_ids: list[int]) -> None:
+    '''Removes chunks from the enabled local indexes.'''
+    if not chunk_ids:
+        return
+    if _vector_index_enabled():
+        get_vector_index().remove_chunks(workspace_id, chunk_ids)
+    if settings.RETRIEVAL_HYBRID:
+        get_lexical_index().remove_chunks(workspace_id, chunk_ids)
+
+
+def unindex_document(workspace_id: int, document_id: int) -> None:
+    '''Removes every chunk of a document from the enabled local indexes.'''
+    if _vector_index_enabled():
+        get_vector_index().remove_document(workspace_id, document_id)
+    if settings.RETRIEVAL_HYBRID:
+        get_lexical_index().remove_document(workspace_id, document_id)
+
+
+def rebuild_workspace_indexes(db: Client, workspace_id: int) -> int:
+    '''Rebuilds the enabled local indexes of a workspace from the database. Returns the number of chunks.'''
+    count = 0
+    if _vector_index_enabled():
+        chunk_ids, document_ids, vectors = load_workspace_vectors(db, workspace_id)
+        get_vector_index().rebuild(workspace_id, chunk_ids, document_ids, vectors)
+        count = len(chunk_ids)
+    if settings.RETRIEVAL_HYBRID:
+        chunk_ids, document_ids, texts = load_workspace_texts(db, workspace_id)
+        get_lexical_index().rebuild(workspace_id, chunk_ids, document_ids, texts)
+        count = len(chunk_ids)
+    return count
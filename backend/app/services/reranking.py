@@ -0,0 +1,76 @@
+# backend/app/services/reranking.py
+'''
+Maximal marginal relevance (MMR) re-ranking of retrieval candidates.
+
+Retrieval over-fetches MMR_CANDIDATES rows with their embeddings and
+this stage picks the final k one at a time, maximizing
+
+    MMR_LAMBDA * relevance(c) - (1 - MMR_LAMBDA) * max similarity(c, picked)
+
+so near-identical neighbours (the same passage on the same page, a copy
+of a document) give way to chunks that add information.
+
+Each pick costs one matrix-vector product over the candidates: the
+running maximum similarity to the picked set is updated with the
+similarities to the last pick only, so k picks over n candidates of
+dimension d cost O(k * n * d) (no n x n similarity matrix).
+'''
+
+import numpy as np
+
+from app.core.config import settings
+
+
+def mmr_select(relevance: np.ndarray, vectors: np.ndarray, k: int, lambda_: float) -> np.ndarray:
+    '''
+    Returns the indices of the `k` rows picked by MMR, in pick order.
+
+    `vectors` must be L2-normalized (zero rows are allowed: they are
+    similar to nothing); `relevance` is the score of each row for the query.
+    '''
+    count = len(relevance)
+    k = min(k, count)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    relevance = lambda_ * np.asarray(relevance, dtype=np.float32)
+    penalty = np.full(count, -np.inf, dtype=np.float32)  # maior similaridade com os escolhidos
+    picked = np.empty(k, dtype=np.int64)
+    available = np.ones(count, dtype=bool)
+
+    choice = int(np.argmax(relevance))
+    for step in range(k):
+        picked[step] = choice
+        available[choice] = False
+        if step == k - 1:
+            break
+        np.maximum(penalty, vectors @ vectors[choice], out=penalty)
+        scores = relevance - (1 - lambda_) * penalty
+        scores[~available] = -np.inf
+        choice = int(np.argmax(scores))
+    return picked
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def rerank_mmr(rows: list[dict], vectors: np.ndarray, k: int, lambda_: float | None = None) -> list[dict]:
+    '''
+    Picks `k` of the candidate `rows` (best first) by MMR.
+
+    `vectors[i]` is the embedding of `rows[i]` (zeros when unknown, e.g.
+    chunks found only by the lexical search). Relevance is the fused RRF
+    score when the rows were fused, otherwise the vector similarity.
+    '''
+    if len(rows) <= k:
+        return rows
+    lambda_ = settings.MMR_LAMBDA if lambda_ is None else lambda_
+    if all(row.get('rrf_score') is not None for row in rows):
+        relevance = np.asarray([row['rrf_score'] for row in rows], np.float32)
+        relevance /= relevance.max()
+    else:
+        relevance = np.asarray([row.get('similarity') or 0.0 for row in rows], np.float32)
+    picked = mmr_select(relevance, _normalize(np.asarray(vectors, np.float32)), k, lambda_)
+    return [rows[i] for i in picked]
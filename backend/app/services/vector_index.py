@@ -0,0 +1,379 @@
+# backend/app/services/vector_index.py
+'''
+Per-workspace approximate nearest-neighbour index (IVF) over NumPy arrays.
+
+Vectors are normalised to unit length and grouped into `nlist` inverted
+lists by spherical k-means. A query scores the centroids, then only the
+rows of the `nprobe` closest lists. Chunks added after the last build
+live in a small delta segment that is searched exactly; deleted chunks
+are tombstoned until the next rebuild compacts them away.
+
+Each version of a workspace index (see `app.services.index_storage`)
+holds these arrays:
+
+    centroids.npy       (nlist, dim) float32
+    offsets.npy         (nlist + 1,) int64, list i = rows offsets[i]:offsets[i + 1]
+    vectors.npy         (n, dim) float32, sorted by list
+    chunk_ids.npy       (n,) int64
+    document_ids.npy    (n,) int64
+    delta_vectors.npy, delta_chunk_ids.npy, delta_document_ids.npy
+    deleted.npy         tombstoned chunk ids, sorted
+
+With EMBEDDING_QUANTIZATION the version also holds the quantized codes
+of the rows (`codes.npy`, `delta_codes.npy` and, for int8, the scales;
+see `app.services.quantization`). Searches then scan the codes of the
+probed lists and rescore only a shortlist with the float vectors, whose
+memory-mapped pages are read for those rows alone.
+'''
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.index_storage import WorkspaceIndexStore, needs_rebuild
+from app.services.quantization import (
+    binary_scores,
+    code_mode,
+    int8_scores,
+    quantization_mode,
+    quantize_binary,
+    quantize_int8,
+    shortlist_size,
+)
+
+_BASE_FILES = ("centroids", "offsets", "vectors", "chunk_ids", "document_ids")
+_DELTA_FILES = ("delta_vectors", "delta_chunk_ids", "delta_document_ids")
+_CODE_FILES = ("codes", "scales", "delta_codes", "delta_scales")
+# Linhas por bloco nas multiplicações da construção (limita a memória)
+_BLOCK_ROWS = 16384
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    '''Index of the closest centroid of each row, computed in blocks.'''
+    return np.concatenate([
+        np.argmax(vectors[start:start + _BLOCK_ROWS] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), _BLOCK_ROWS)
+    ]) if len(vectors) else np.empty(0, dtype=np.int64)
+
+
+def train_centroids(
+    vectors: np.ndarray, nlist: int, *, iterations: int = 10, sample_size: int = 65536, seed: int = 0,
+) -> np.ndarray:
+    '''Spherical k-means over a sample of unit-length vectors.'''
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > sample_size:
+        sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    sample = np.ascontiguousarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=nlist)
+        # Listas vazias recebem um ponto aleatório da amostra
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+@dataclass
+class IndexSnapshot:
+    '''One immutable version of a workspace index.'''
+    version: str
+    centroids: np.ndarray
+    offsets: np.ndarray
+    vectors: np.ndarray
+    chunk_ids: np.ndarray
+    document_ids: np.ndarray
+    delta_vectors: np.ndarray
+    delta_chunk_ids: np.ndarray
+    delta_document_ids: np.ndarray
+    deleted: np.ndarray
+    codes: np.ndarray | None = None
+    scales: np.ndarray | None = None
+    delta_codes: np.ndarray | None = None
+    delta_scales: np.ndarray | None = None
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids) + len(self.delta_chunk_ids) - len(self.deleted)
+
+    def all_chunk_ids(self) -> np.ndarray:
+        return np.concatenate([self.chunk_ids, self.delta_chunk_ids])
+
+    def live_rows(self, deleted: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''(chunk_ids, document_ids, vectors) of every chunk not in `deleted` (default: tombstones).'''
+        chunk_ids = self.all_chunk_ids()
+        keep = ~np.isin(chunk_ids, self.deleted if deleted is None else deleted)
+        document_ids = np.concatenate([self.document_ids, self.delta_document_ids])
+        vectors = np.concatenate([self.vectors, self.delta_vectors])
+        return chunk_ids[keep], document_ids[keep], vectors[keep]
+
+    def quantization(self) -> str | None:
+        '''Code type used by searches: the configured one, if this version has its codes.'''
+        mode = quantization_mode()
+        if mode is None or self.codes is None or self.delta_codes is None or code_mode(self.codes) != mode:
+            return None
+        if mode == "int8" and (self.scales is None or self.delta_scales is None):
+            return None
+        return mode
+
+    def search(
+        self, query: np.ndarray, k: int, nprobe: int, with_vectors: bool = False,
+    ) -> tuple[np.ndarray, ...]:
+        '''
+        Returns (chunk_ids, cosine similarities) of the best `k` rows, best
+        first, plus their normalized vectors with `with_vectors`.
+        '''
+        query = _normalize(query)
+        nlist = len(self.centroids)
+        base_count = len(self.chunk_ids)
+
+        if nlist <= nprobe:
+            ranges = [(0, base_count)]
+        else:
+            probe = np.argpartition(self.centroids @ query, -nprobe)[-nprobe:]
+            ranges = [(self.offsets[i], self.offsets[i + 1]) for i in probe]
+        # (linhas, é do delta?) de cada trecho visitado
+        segments = [(slice(start, end), False) for start, end in ranges]
+        if len(self.delta_chunk_ids):
+            segments.append((slice(0, len(self.delta_chunk_ids)), True))
+
+        mode = self.quantization()
+        score = self._exact_scorer(query) if mode is None else self._coarse_scorer(query, mode)
+        ids = np.concatenate([(self.delta_chunk_ids if delta else self.chunk_ids)[rows] for rows, delta in segments])
+        scores = np.concatenate([score(rows, delta) for rows, delta in segments])
+        # Posições nas matrizes (base seguida do delta), para achar os vetores sem copiar listas
+        positions = np.concatenate([np.arange(rows.start, rows.stop) + (base_count if delta else 0)
+                                    for rows, delta in segments])
+        if len(self.deleted):
+            keep = ~np.isin(ids, self.deleted)
+            ids, scores, positions = ids[keep], scores[keep], positions[keep]
+
+        vectors = None
+        if mode is not None:
+            # Segunda etapa: reordena a shortlist dos códigos com os vetores exatos
+            shortlist = shortlist_size(k)
+            if len(scores) > shortlist:
+                top = np.argpartition(scores, -shortlist)[-shortlist:]
+                ids, positions = ids[top], positions[top]
+            vectors = self._gather(positions)
+            scores = vectors @ query
+
+        if len(scores) > k:
+            top = np.argpartition(scores, -k)[-k:]
+            ids, scores, positions = ids[top], scores[top], positions[top]
+            vectors = vectors[top] if vectors is not None else None
+        order = np.argsort(-scores, kind="stable")
+        if not with_vectors:
+            return ids[order], scores[order]
+        vectors = vectors[order] if vectors is not None else self._gather(positions[order])
+        return ids[order], scores[order], vectors
+
+    def _exact_scorer(self, query: np.ndarray):
+        def score(rows: slice, delta: bool) -> np.ndarray:
+            return (self.delta_vectors if delta else self.vectors)[rows] @ query
+        return score
+
+    def _coarse_scorer(self, query: np.ndarray, mode: str):
+        if mode == "binary":
+            def score(rows: slice, delta: bool) -> np.ndarray:
+                return binary_scores((self.delta_codes if delta else self.codes)[rows], query)
+            return score
+
+        def score(rows: slice, delta: bool) -> np.ndarray:
+            if delta:
+                return int8_scores(self.delta_codes[rows], self.delta_scales[rows], query)
+            return int8_scores(self.codes[rows], self.scales[rows], query)
+        return score
+
+    def _gather(self, positions: np.ndarray) -> np.ndarray:
+        '''Float vectors of the given positions (base followed by delta).'''
+        base_count = len(self.chunk_ids)
+        in_base = positions < base_count
+        vectors = np.empty((len(positions), self.dim), np.float32)
+        vectors[in_base] = self.vectors[positions[in_base]]
+        vectors[~in_base] = self.delta_vectors[positions[~in_base] - base_count]
+        return vectors
+
+
+def encode_codes(vectors: np.ndarray, mode: str | None, prefix: str = "") -> dict[str, np.ndarray]:
+    '''Code arrays of normalized `vectors` (`{prefix}codes`, `{prefix}scales`); empty without a mode.'''
+    if mode == "int8":
+        codes, scales = quantize_int8(vectors)
+        return {f"{prefix}codes": codes, f"{prefix}scales": scales}
+    if mode == "binary":
+        return {f"{prefix}codes": quantize_binary(vectors)}
+    return {}
+
+
+def build_arrays(chunk_ids: np.ndarray, document_ids: np.ndarray, vectors: np.ndarray) -> dict[str, np.ndarray]:
+    '''Builds the base files of an index (plus empty delta and tombstones).'''
+    vectors = _normalize(vectors)
+    count, dim = vectors.shape
+    if count >= settings.VECTOR_INDEX_MIN_IVF_SIZE:
+        nlist = max(1, int(round(np.sqrt(count))))
+        centroids = train_centroids(vectors, nlist)
+        labels = _assign(vectors, centroids)
+    else:
+        # Workspaces pequenos: uma única lista, ou seja, busca exata
+        nlist = 1
+        centroids = _normalize(vectors.mean(axis=0, keepdims=True)) if count else np.zeros((1, dim), np.float32)
+        labels = np.zeros(count, dtype=np.int64)
+
+    order = np.argsort(labels, kind="stable")
+    offsets = np.searchsorted(labels[order], np.arange(nlist + 1)).astype(np.int64)
+    vectors = np.ascontiguousarray(vectors[order])
+    mode = quantization_mode()
+    return {
+        **encode_codes(vectors, mode),
+        **encode_codes(np.empty((0, dim), np.float32), mode, "delta_"),
+        "centroids": centroids.astype(np.float32),
+        "offsets": offsets,
+        "vectors": vectors,
+        "chunk_ids": np.asarray(chunk_ids, dtype=np.int64)[order],
+        "document_ids": np.asarray(document_ids, dtype=np.int64)[order],
+        "delta_vectors": np.empty((0, dim), np.float32),
+        "delta_chunk_ids": np.empty(0, np.int64),
+        "delta_document_ids": np.empty(0, np.int64),
+        "deleted": np.empty(0, np.int64),
+    }
+
+
+class VectorIndexStore(WorkspaceIndexStore):
+    '''Loads, searches and updates the IVF workspace indexes under `root`.'''
+
+    FILES = _BASE_FILES + _DELTA_FILES + ("deleted",)
+    OPTIONAL_FILES = _CODE_FILES
+    NAME = "vector index"
+
+    def _make_snapshot(self, version: str, arrays: dict[str, np.ndarray]) -> IndexSnapshot:
+        return IndexSnapshot(version=version, **arrays)
+
+    def search(
+        self, workspace_id: int, query: list[float] | np.ndarray, k: int, nprobe: int | None = None,
+        with_vectors: bool = False,
+    ) -> tuple[np.ndarray, ...] | None:
+        '''Returns (chunk_ids, similarities[, vectors]), or None if the workspace has no index.'''
+        snapshot = self.snapshot(workspace_id)
+        if snapshot is None:
+            return None
+        return snapshot.search(np.asarray(query, dtype=np.float32), k, nprobe or settings.VECTOR_INDEX_NPROBE,
+                               with_vectors)
+
+    # --- Escrita ---
+
+    def rebuild(self, workspace_id: int, chunk_ids, document_ids, vectors) -> None:
+        '''Replaces the workspace index with one built from the given rows.'''
+        if not len(chunk_ids):
+            self.drop(workspace_id)
+            return
+        with self._writer_lock(workspace_id) as directory:
+            self._write_version(directory, build_arrays(
+                np.asarray(chunk_ids, np.int64), np.asarray(document_ids, np.int64),
+                np.asarray(vectors, np.float32)))
+
+    def add(self, workspace_id: int, chunk_ids, document_ids, vectors, backfill=None) -> None:
+        '''
+        Adds rows to the workspace index.
+
+        If the workspace has no index yet, `backfill()` must return every
+        (chunk_ids, document_ids, vectors) of the workspace (the new rows
+        included), so the first index is complete; without it the index is
+        built from the given rows alone. Chunk ids already indexed are skipped.
+        '''
+        chunk_ids = np.asarray(chunk_ids, np.int64)
+        with self._writer_lock(workspace_id) as directory:
+            version = self._current_version(directory)
+            if version is None:
+                if backfill is not None:
+                    chunk_ids, document_ids, vectors = backfill()
+                self._write_version(directory, build_arrays(
+                    np.asarray(chunk_ids, np.int64), np.asarray(document_ids, np.int64),
+                    np.asarray(vectors, np.float32)))
+                return
+
+            current = self._load(directory, version)
+            new = ~np.isin(chunk_ids, current.all_chunk_ids())
+            if not new.any():
+                return
+            new_vectors = _normalize(np.asarray(vectors)[new])
+            delta = {
+                "delta_vectors": np.concatenate([current.delta_vectors, new_vectors]),
+                "delta_chunk_ids": np.concatenate([current.delta_chunk_ids, chunk_ids[new]]),
+                "delta_document_ids": np.concatenate(
+                    [current.delta_document_ids, np.asarray(document_ids, np.int64)[new]]),
+            }
+            if current.codes is not None and current.delta_codes is not None:
+                # Mantém os códigos do delta junto com os vetores (mesmo tipo da base)
+                for name, codes in encode_codes(new_vectors, code_mode(current.codes), "delta_").items():
+                    delta[name] = np.concatenate([getattr(current, name), codes])
+            if self._needs_rebuild(len(current.chunk_ids), len(delta["delta_chunk_ids"])):
+                live_ids, live_docs, live_vectors = current.live_rows()
+                self._write_version(directory, build_arrays(
+                    np.concatenate([live_ids, chunk_ids[new]]),
+                    np.concatenate([live_docs, np.asarray(document_ids, np.int64)[new]]),
+                    np.concatenate([live_vectors, np.asarray(vectors, np.float32)[new]]),
+                ))
+            else:
+                self._write_version(directory, delta, link_from=version)
+
+    def remove_chunks(self, workspace_id: int, chunk_ids) -> None:
+        '''Tombstones chunks; the next rebuild drops them from the files.'''
+        with self._writer_lock(workspace_id) as directory:
+            version = self._current_version(directory)
+            if version is None:
+                return
+            current = self._load(directory, version)
+            removed = np.intersect1d(np.asarray(chunk_ids, np.int64), current.all_chunk_ids())
+            deleted = np.union1d(current.deleted, removed)
+            if len(deleted) == len(current.deleted):
+                return
+            total = len(current.chunk_ids) + len(current.delta_chunk_ids)
+            if self._needs_rebuild(total - len(deleted), len(deleted) + len(current.delta_chunk_ids)):
+                self._write_version(directory, build_arrays(*current.live_rows(deleted)))
+            else:
+                self._write_version(directory, {"deleted": deleted}, link_from=version)
+
+    def remove_document(self, workspace_id: int, document_id: int) -> None:
+        '''Tombstones every chunk of a document.'''
+        snapshot = self.snapshot(workspace_id)
+        if snapshot is None:
+            return
+        chunk_ids = np.concatenate([
+            snapshot.chunk_ids[np.asarray(snapshot.document_ids) == document_id],
+            snapshot.delta_chunk_ids[np.asarray(snapshot.delta_document_ids) == document_id],
+        ])
+        if len(chunk_ids):
+            self.remove_chunks(workspace_id, chunk_ids)
+
+    @staticmethod
+    def _needs_rebuild(base_rows: int, pending_rows: int) -> bool:
+        return needs_rebuild(base_rows, pending_rows, settings.VECTOR_INDEX_REBUILD_RATIO,
+                             settings.VECTOR_INDEX_MIN_IVF_SIZE // 4)
+
+
+_store: VectorIndexStore | None = None
+
+
+def get_vector_index() -> VectorIndexStore:
+    '''Process-wide store rooted at VECTOR_INDEX_DIR.'''
+    global _store
+    if _store is None:
+        _store = VectorIndexStore(settings.VECTOR_INDEX_DIR)
+    return _store
@@ -4,126 +4,315 @@ Celery tasks for the Oraculo backend.
 '''
 
 import os
-import fitz  # PyMuPDF
-import google.generativeai as genai
-from supabase import create_client, Client
+from celery import chord
+from supabase import Client
 from dotenv import load_dotenv
 
 from .celery_instance import celery_app
 from .core.config import settings # Importa as configurações centralizadas
+from .core.metrics import (
+    INGESTION_DOCUMENTS,
+    INGESTION_DOWNLOAD_BYTES,
+    INGESTION_DOWNLOADS,
+    StageTimer,
+    record_ingestion,
+)
+from .core.supabase_client import get_supabase_client
+from .services.document_download import DownloadedFile, PeakMemoryMonitor, download_file
+from .services.embedding_cache import get_embedding_cache
+from .services.extractors import open_document
+from .services.ingestion_pipeline import (
+    discard_uncommitted_chunks,
+    plan_page_ranges,
+    run_incremental,
+    run_page_range,
+    run_pipeline,
+    unit_hashes,
+)
+from .services.llm_service import configure_gemini
+from .services.query_cache import invalidate_workspace
+from .services.rag_service import rebuild_workspace_indexes
 
 load_dotenv()
 
-# --- Supabase & Gemini Initialization ---
-
-def get_supabase_client() -> Client:
-    '''Creates and returns a Supabase client instance.'''
-    # Usa as configurações do config.py para consistência
-    return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
-
-def configure_gemini():
-    '''Configures the Google Gemini API.'''
-    # Usa a variável de ambiente correta do config.py
-    genai.configure(api_key=settings.ORACULO_GEMINI_API_KEY)
-
-# --- Text Processing Functions ---
-
-def chunk_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> list[str]:
-    '''Splits a long text into smaller chunks with a specified overlap.'''
-    if not text:
-        return []
-    
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start += chunk_size - chunk_overlap
-    return chunks
+# --- Document Helpers ---
+# O cliente Supabase vem de get_supabase_client: um por processo do worker
+
+def fetch_document(supabase: Client, document_id: int) -> dict:
+    '''Loads and validates a `documents` row.'''
+    doc_res = supabase.table('documents').select('*').eq('id', document_id).single().execute()
+    if not doc_res.data:
+        raise ValueError(f"Document with id {document_id} not found.")
+
+    document = doc_res.data
+    # CORREÇÃO 2: Adiciona user_id à verificação
+    if not document.get('path') or not document.get('workspace_id') or not document.get('user_id'):
+        raise ValueError("Document record is missing path, workspace_id, or user_id.")
+    return document
+
+
+def download_document(supabase: Client, document: dict) -> DownloadedFile:
+    '''
+    Streams the document file from Supabase Storage: small files stay in
+    memory, large ones go to a temporary file (removed when the returned
+    object is closed).
+    '''
+    file_path = document['path']
+    print(f"Downloading file: {file_path}")
+    file = download_file(supabase, file_path)
+    if not file.size:
+        file.close()
+        raise RuntimeError(f"Failed to download file from storage: {file_path}")
+    route = "disk" if file.on_disk else "memory"
+    INGESTION_DOWNLOADS.labels(route).inc()
+    INGESTION_DOWNLOAD_BYTES.labels(route).inc(file.size)
+    print(f"Downloaded {file.size} bytes ({route}).")
+    return file
+
+def claim_document(supabase: Client, document_id: int, update: dict, retrying: bool) -> bool:
+    '''
+    Moves the document to PROCESSING (applying `update`) only if it is
+    still in the status this attempt expects: PENDING for a first attempt;
+    for a retry also PROCESSING, left by the attempt that failed.
+
+    The conditional UPDATE is atomic, so when the same document is
+    dispatched twice (a notification plus the listener backfill after a
+    reconnect) only one task gets the row. Returns False for the other.
+    '''
+    expected = ['PENDING', 'PROCESSING'] if retrying else ['PENDING']
+    res = (supabase.table('documents').update({**update, 'status': 'PROCESSING'})
+           .eq('id', document_id).in_('status', expected).execute())
+    return bool(res.data)
 
 # --- Main Celery Task ---
 
-@celery_app.task
-def process_document(document_id: int):
+@celery_app.task(
+    bind=True,
+    autoretry_for=(Exception,),
+    dont_autoretry_for=(ValueError,),
+    max_retries=settings.INGESTION_MAX_RETRIES,
+    retry_backoff=True,
+)
+def process_document(self, document_id: int):
     '''
     Celery task to process a single document.
+
+    The file is opened with the extractor of its format (PDF, DOCX, XLSX)
+    and its units are streamed through `run_pipeline`, which commits chunks
+    as it goes; a retry resumes after `documents.last_processed_page`.
+
+    The task first claims the document (`claim_document`); a duplicate
+    dispatch of a document already claimed by another task does nothing.
+
+    A document processed before (with `page_hashes` and no interrupted
+    run) is updated incrementally: only pages whose text changed are
+    re-chunked and re-embedded.
+
+    Stage timings go to the Prometheus metrics and, with the number of
+    chunks written, to the `documents` row (`stage_seconds`, `processed_chunks`).
+    The peak memory of the task goes to the metrics as well.
     '''
     supabase = get_supabase_client()
     configure_gemini()
+    document = None
+    timer = StageTimer()
+    page_hashes: list[str] = []
+    page_count = 0
+    memory = PeakMemoryMonitor().start()
 
     try:
         # 1. Fetch the document record
-        print(f"Processing document_id: {document_id}")
-        doc_res = supabase.table('documents').select('*').eq('id', document_id).single().execute()
-        if not doc_res.data:
-            raise ValueError(f"Document with id {document_id} not found.")
-        
-        document = doc_res.data
-        # CORREÇÃO 1: Extrai o user_id
-        user_id = document.get('user_id')
-        file_path = document.get('path')
-        workspace_id = document.get('workspace_id')
-
-        # CORREÇÃO 2: Adiciona user_id à verificação
-        if not file_path or not workspace_id or not user_id:
-            raise ValueError("Document record is missing path, workspace_id, or user_id.")
-
-        # Update status to PROCESSING
-        supabase.table('documents').update({'status': 'PROCESSING'}).eq('id', document_id).execute()
+        print(f"Processing document_id: {document_id} (attempt {self.request.retries + 1})")
+        document = fetch_document(supabase, document_id)
+
+        # Versão anterior completa: atualização incremental pelos hashes das páginas
+        old_hashes = document.get('page_hashes')
+        incremental = bool(old_hashes) and not document.get('last_processed_page')
+
+        # Update status to PROCESSING. Uma execução completa invalida os hashes
+        # até terminar, para que uma nova tentativa não seja tratada como incremental
+        resumed_chunks = (document.get('processed_chunks') or 0) if document.get('last_processed_page') else 0
+        update = {} if incremental else {'page_hashes': None, 'processed_chunks': resumed_chunks}
+        if not claim_document(supabase, document_id, update, retrying=self.request.retries > 0):
+            # Outra tarefa já está com o documento (ou ele não está mais pendente)
+            print(f"Document {document_id} is {document.get('status')}, already claimed. Skipping.")
+            return
 
         # 2. Download the file from Supabase Storage
-        print(f"Downloading file: {file_path}")
-        file_content = supabase.storage.from_('workspaces_data').download(file_path)
-        if not file_content:
-            raise RuntimeError(f"Failed to download file from storage: {file_path}")
-
-        # 3. Use pymupdf to extract text
-        print("Extracting text from PDF...")
-        pdf_document = fitz.open(stream=file_content, filetype="pdf")
-        
-        chunks_to_insert = []
-        for page_num, page in enumerate(pdf_document):
-            page_text = page.get_text()
-            
-            text_chunks = chunk_text(page_text)
-
-            for chunk in text_chunks:
-                # Adiciona verificação de qualidade do chunk
-                if len(chunk.strip()) > 10:
-                    embedding_response = genai.embed_content(
-                        model='models/text-embedding-004',
-                        content=chunk,
-                        task_type="RETRIEVAL_DOCUMENT",
-                        title=f"Chunk from {document.get('name', 'document')}"
-                    )
-                    embedding = embedding_response['embedding']
-
-                    # CORREÇÃO 3: Adiciona o user_id ao chunk
-                    chunks_to_insert.append({
-                        'document_id': document_id,
-                        'workspace_id': workspace_id,
-                        'user_id': user_id,
-                        'content': chunk,
-                        'embedding': embedding,
-                        'metadata': {'page_number': page_num + 1}
-                    })
-        
-        pdf_document.close()
-
-        # 6. Insert all chunks in batches
-        if chunks_to_insert:
-            print(f"Inserting {len(chunks_to_insert)} chunks in batches...")
-            batch_size = 20 # Tamanho do lote
-            for i in range(0, len(chunks_to_insert), batch_size):
-                batch = chunks_to_insert[i:i + batch_size]
-                print(f"  Inserting batch {i//batch_size + 1}...")
-                supabase.table('document_chunks').insert(batch).execute()
-
-        # 7. Update document status to COMPLETED
-        print("Processing complete. Updating status to COMPLETED.")
-        supabase.table('documents').update({'status': 'COMPLETED'}).eq('id', document_id).execute()
+        with timer.stage("download"):
+            file = download_document(supabase, document)
+
+        # 3. Stream units (pages, paragraphs, row batches) -> chunks -> embeddings -> document_chunks
+        print("Extracting, embedding and inserting chunks...")
+        with file, open_document(document, file) as source:
+            page_count = source.unit_count or 0
+
+            if incremental:
+                # O plano incremental compara todas as páginas antes de processar qualquer uma
+                with timer.stage("extract"):
+                    page_hashes = unit_hashes(source)
+                inserted, deleted, total_chunks = run_incremental(
+                    supabase, document, source, old_hashes, page_hashes, timer)
+                print(f"Inserted {inserted} chunks, deleted {deleted} stale chunks.")
+            # Documentos grandes são divididos entre vários workers (só formatos com páginas)
+            elif (source.supports_ranges and settings.INGESTION_FANOUT_MIN_PAGES
+                    and page_count >= settings.INGESTION_FANOUT_MIN_PAGES):
+                dispatch_page_ranges(supabase, document, page_count)
+                return
+            else:
+                # Os hashes das páginas são calculados enquanto elas passam pelo pipeline
+                inserted, page_hashes = run_pipeline(supabase, document, source, timer)
+                total_chunks = resumed_chunks + inserted
+                print(f"Inserted {inserted} chunks.")
+
+        cache = get_embedding_cache()
+        if cache is not None:
+            print(f"Embedding cache stats: {cache.stats()}")
+
+        # 4. Update document status to COMPLETED, clear the checkpoint and store the page hashes
+        peak_rss = memory.stop()
+        print(f"Processing complete in {timer.as_dict()} (peak RSS {_format_bytes(peak_rss)}). "
+              "Updating status to COMPLETED.")
+        supabase.table('documents').update({
+            'status': 'COMPLETED', 'last_processed_page': None, 'page_hashes': page_hashes,
+            'processed_chunks': total_chunks, 'stage_seconds': timer.as_dict(),
+        }).eq('id', document_id).execute()
+        record_ingestion(timer, "completed", len(page_hashes), inserted, peak_rss)
+        # Os chunks do workspace mudaram: respostas em cache ficam obsoletas
+        invalidate_workspace(document['workspace_id'])
 
     except Exception as e:
         print(f"Error processing document {document_id}: {e}")
-        supabase.table('documents').update({'status': 'FAILED'}).eq('id', document_id).execute()
-        raise
\ No newline at end of file
+        # Só marca FAILED quando não haverá nova tentativa
+        if isinstance(e, ValueError) or self.request.retries >= self.max_retries:
+            record_ingestion(timer, "failed", len(page_hashes) or page_count, peak_rss=memory.stop())
+            supabase.table('documents').update(
+                {'status': 'FAILED', 'stage_seconds': timer.as_dict()}).eq('id', document_id).execute()
+            if document is not None:
+                invalidate_workspace(document['workspace_id'])
+        else:
+            record_ingestion(timer, "retried", len(page_hashes) or page_count, peak_rss=memory.stop())
+        raise
+
+    finally:
+        memory.stop()
+
+
+def _format_bytes(size: int | None) -> str:
+    return "unknown" if size is None else f"{size / (1024 * 1024):.0f} MiB"
+
+
+# --- Fan-out / Fan-in for Large Documents ---
+
+def dispatch_page_ranges(supabase: Client, document: dict, page_count: int) -> None:
+    '''
+    Plans page ranges and launches a chord of `process_page_range` subtasks
+    whose callback, `finalize_document`, sets the final status.
+    '''
+    document_id = document['id']
+    ranges = plan_page_ranges(page_count, settings.INGESTION_PAGE_RANGE_SIZE)
+    print(f"Fanning out document {document_id}: {page_count} pages in {len(ranges)} ranges.")
+
+    # Cada faixa é independente, então descarta chunks e checkpoint de execuções anteriores
+    discard_uncommitted_chunks(supabase, document_id, 0)
+    supabase.table('documents').update({'last_processed_page': None}).eq('id', document_id).execute()
+
+    header = [process_page_range.s(document_id, first, last) for first, last in ranges]
+    chord(header)(finalize_document.s(document_id, document['workspace_id']))
+
+
+@celery_app.task(bind=True, max_retries=settings.INGESTION_MAX_RETRIES)
+def process_page_range(self, document_id: int, first_page: int, last_page: int) -> dict:
+    '''
+    Embeds and inserts the chunks of pages first_page..last_page, and
+    returns the hashes of those pages for `finalize_document`.
+
+    Errors are retried with backoff; once retries are exhausted the failure
+    is returned (not raised) so the chord callback still runs.
+    '''
+    supabase = get_supabase_client()
+    configure_gemini()
+    timer = StageTimer()
+    pages = last_page - first_page + 1
+    memory = PeakMemoryMonitor().start()
+
+    try:
+        document = fetch_document(supabase, document_id)
+        with timer.stage("download"):
+            file = download_document(supabase, document)
+        with file, open_document(document, file) as source:
+            inserted, page_hashes = run_page_range(supabase, document, source, first_page, last_page, timer)
+        peak_rss = memory.stop()
+        print(f"Document {document_id} pages {first_page}-{last_page}: inserted {inserted} chunks "
+              f"(peak RSS {_format_bytes(peak_rss)}).")
+        record_ingestion(timer, None, pages, inserted, peak_rss)
+        return {'first_page': first_page, 'last_page': last_page, 'inserted': inserted, 'error': None,
+                'page_hashes': page_hashes, 'stage_seconds': timer.as_dict()}
+
+    except Exception as e:
+        print(f"Error processing document {document_id} pages {first_page}-{last_page}: {e}")
+        record_ingestion(timer, None, pages, peak_rss=memory.stop())
+        if not isinstance(e, ValueError) and self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        return {'first_page': first_page, 'last_page': last_page, 'inserted': 0, 'error': str(e),
+                'page_hashes': [], 'stage_seconds': timer.as_dict()}
+
+    finally:
+        memory.stop()
+
+
+@celery_app.task
+def finalize_document(results: list[dict], document_id: int, workspace_id: int, page_hashes: list[str] | None = None):
+    '''
+    Chord callback: marks the document COMPLETED, storing the page hashes
+    returned by the ranges, or FAILED if any range failed.
+
+    `page_hashes` is only passed by chords dispatched before the ranges
+    returned their own hashes.
+    '''
+    supabase = get_supabase_client()
+    # Os chunks do workspace mudaram: respostas em cache ficam obsoletas
+    invalidate_workspace(workspace_id)
+
+    failed = [r for r in results if r['error']]
+    inserted = sum(r['inserted'] for r in results)
+    # Tempo somado das faixas (trabalho total, não a duração de ponta a ponta)
+    stage_seconds: dict[str, float] = {}
+    for result in results:
+        for stage, seconds in (result.get('stage_seconds') or {}).items():
+            stage_seconds[stage] = round(stage_seconds.get(stage, 0.0) + seconds, 3)
+
+    if failed:
+        ranges = ", ".join(f"{r['first_page']}-{r['last_page']}" for r in failed)
+        print(f"Document {document_id} failed in page ranges {ranges}. Updating status to FAILED.")
+        INGESTION_DOCUMENTS.labels("failed").inc()
+        supabase.table('documents').update(
+            {'status': 'FAILED', 'stage_seconds': stage_seconds}).eq('id', document_id).execute()
+        return
+
+    if page_hashes is None:
+        # Hashes das faixas, na ordem das páginas
+        page_hashes = [value for result in sorted(results, key=lambda r: r['first_page'])
+                       for value in result.get('page_hashes') or []]
+    print(f"Document {document_id}: {inserted} chunks from {len(results)} ranges. Updating status to COMPLETED.")
+    INGESTION_DOCUMENTS.labels("completed").inc()
+    supabase.table('documents').update({
+        'status': 'COMPLETED', 'page_hashes': page_hashes,
+        'processed_chunks': inserted, 'stage_seconds': stage_seconds,
+    }).eq('id', document_id).execute()
+
+
+@celery_app.task
+def rebuild_search_indexes(workspace_id: int) -> int:
+    '''
+    Rebuilds the local search indexes of a workspace (IVF vector index and
+    BM25 lexical index, as enabled) from `document_chunks`.
+
+    Useful when enabling RETRIEVAL_BACKEND="ivf" or RETRIEVAL_HYBRID on
+    existing workspaces or to compact an index; ingestion keeps them up
+    to date afterwards.
+    '''
+    count = rebuild_workspace_indexes(get_supabase_client(), workspace_id)
+    print(f"Search indexes of workspace {workspace_id} rebuilt with {count} chunks.")
+    invalidate_workspace(workspace_id)
+    return count
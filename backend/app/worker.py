@@ -1,3 +1,21 @@
 # backend/app/worker.py
+import os
+
+from celery.signals import worker_init, worker_process_shutdown
+
 from .celery_instance import celery_app
+from .core.config import settings
+from .core.metrics import mark_process_dead, start_metrics_server
 import app.tasks
+
+
+@worker_init.connect
+def start_worker_metrics(**kwargs):
+    # Servidor de métricas no processo principal do worker
+    if settings.WORKER_METRICS_PORT:
+        start_metrics_server(settings.WORKER_METRICS_PORT)
+
+
+@worker_process_shutdown.connect
+def forget_worker_process(pid=None, **kwargs):
+    mark_process_dead(pid or os.getpid())
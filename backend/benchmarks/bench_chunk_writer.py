@@ -0,0 +1,101 @@
+# backend/benchmarks/bench_chunk_writer.py
+'''
+Insert throughput of `document_chunks` rows: binary COPY through
+`CopyChunkWriter` against a multi-row INSERT with JSON/text values (the
+shape of what PostgREST sends and parses), on the same Postgres.
+
+Needs a reachable Postgres with the pgvector extension. The benchmark
+creates TEMPORARY `documents`/`document_chunks` tables on its own
+connection, which shadow the real ones, so no persistent data is touched.
+
+    cd backend
+    python -m benchmarks.bench_chunk_writer --database-url postgresql://... --rows 20000
+'''
+
+import argparse
+import json
+import time
+import uuid
+
+import numpy as np
+
+from benchmarks._env import load_benchmark_env
+
+SCHEMA = '''
+CREATE TEMP TABLE documents (
+    id bigserial PRIMARY KEY, name text, workspace_id int8, user_id uuid, last_processed_page int4,
+    processed_chunks int4
+);
+CREATE TEMP TABLE document_chunks (
+    id bigserial PRIMARY KEY, content text, embedding vector({dim}), metadata jsonb,
+    document_id int8, workspace_id int8, user_id uuid
+);
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    load_benchmark_env(DATABASE_URL=args.database_url)
+
+    from psycopg2.extras import execute_values
+
+    from app.core.postgres_client import get_pg_connection
+    from app.services.chunking import Chunk
+    from app.services.copy_chunk_writer import CopyChunkWriter
+
+    user_id = str(uuid.uuid4())
+    connection = get_pg_connection()
+    with connection.cursor() as cursor:
+        cursor.execute(SCHEMA.format(dim=args.dim))
+        cursor.execute("INSERT INTO documents (name, workspace_id, user_id) VALUES ('bench.pdf', 1, %s) RETURNING id",
+                       (user_id,))
+        document_id = cursor.fetchone()[0]
+    connection.commit()
+    document = {'id': document_id, 'workspace_id': 1, 'user_id': user_id, 'name': 'bench.pdf'}
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.rows, args.dim)).astype(np.float32).tolist()
+    chunks = [Chunk(page_number=i // 10 + 1, content=f"Trecho {i} " + "lorem ipsum dolor " * 80,
+                    metadata={'page_number': i // 10 + 1}) for i in range(args.rows)]
+
+    writer = CopyChunkWriter(None, document, batch_size=args.batch_size)
+    started = time.perf_counter()
+    with writer:
+        for chunk, vector in zip(chunks, vectors):
+            writer.add(chunk, vector)
+        writer.flush(completed_page=chunks[-1].page_number)
+    copy_seconds = time.perf_counter() - started
+    sample = [{'document_id': document['id'], 'workspace_id': 1, 'user_id': document['user_id'],
+               'content': chunk.content, 'embedding': vector, 'metadata': chunk.metadata}
+              for chunk, vector in zip(chunks[:100], vectors[:100])]
+    copy_bytes = len(writer._copy_payload(sample)) // len(sample)
+
+    columns = "document_id, workspace_id, user_id, content, embedding, metadata"
+    started = time.perf_counter()
+    json_bytes = 0
+    with connection.cursor() as cursor:
+        for start in range(0, args.rows, args.batch_size):
+            batch = []
+            for chunk, vector in zip(chunks[start:start + args.batch_size], vectors[start:start + args.batch_size]):
+                embedding, metadata = json.dumps(vector), json.dumps(chunk.metadata)
+                json_bytes += len(embedding) + len(metadata) + len(chunk.content)
+                batch.append((document['id'], 1, document['user_id'], chunk.content, embedding, metadata))
+            execute_values(cursor, f"INSERT INTO document_chunks ({columns}) VALUES %s", batch)
+    connection.commit()
+    insert_seconds = time.perf_counter() - started
+
+    print(f"rows={args.rows} dim={args.dim} batch={args.batch_size}")
+    print(f"{'writer':>14} {'seconds':>8} {'rows/s':>9}")
+    print(f"{'copy binary':>14} {copy_seconds:>8.2f} {args.rows / copy_seconds:>9.0f}")
+    print(f"{'insert json':>14} {insert_seconds:>8.2f} {args.rows / insert_seconds:>9.0f}")
+    print(f"payload per row: copy ~{copy_bytes} bytes, json ~{json_bytes // args.rows} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# backend/benchmarks/bench_embedding.py
+'''
+Throughput benchmark for `app.services.embedding_service.embed_documents`.
+
+Runs the real Gemini SDK (REST transport) against the local fake server
+and compares one-request-per-chunk against batched, concurrent calls.
+
+    cd backend
+    python -m benchmarks.bench_embedding --chunks 2000 --latency-ms 80
+'''
+
+import argparse
+import time
+
+from benchmarks._env import load_benchmark_env
+from benchmarks.fake_gemini import FakeGeminiServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--per-item-ms", type=float, default=0.5)
+    parser.add_argument("--configs", default="1x1,20x1,100x1,100x4,50x8",
+                        help="Lista de BATCHxCONCORRÊNCIA separada por vírgula")
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(("127.0.0.1", 0), args.latency_ms, args.per_item_ms).start()
+    # Sem cache: cada configuração deve pagar todas as chamadas
+    load_benchmark_env(GEMINI_API_ENDPOINT=server.url, EMBEDDING_CACHE_BACKEND="none")
+
+    from app.services.embedding_service import embed_documents
+    from app.services.llm_service import configure_gemini
+
+    configure_gemini()
+    texts = [f"Cláusula {i}: o prazo de entrega é de {i % 90} dias úteis." for i in range(args.chunks)]
+
+    print(f"{'batch':>6} {'conc':>5} {'requests':>9} {'seconds':>9} {'chunks/s':>10}")
+    for config in args.configs.split(","):
+        batch_size, concurrency = (int(v) for v in config.split("x"))
+        requests_before = server.request_count
+        started = time.perf_counter()
+        vectors = embed_documents(texts, title="benchmark", batch_size=batch_size,
+                                  max_concurrency=concurrency)
+        elapsed = time.perf_counter() - started
+        assert len(vectors) == len(texts)
+        print(f"{batch_size:>6} {concurrency:>5} {server.request_count - requests_before:>9} "
+              f"{elapsed:>9.2f} {len(texts) / elapsed:>10.1f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# backend/benchmarks/bench_hybrid_retrieval.py
+'''
+Top-k quality of vector-only vs hybrid (vector + BM25, RRF) retrieval
+on questions about exact identifiers (CNPJs, clause numbers, codes).
+
+The corpus is synthetic contract text where every chunk carries one
+identifier. Embeddings are a hashed bag-of-words projection that ignores
+tokens containing digits, mimicking how embedding models blur
+identifiers; the numbers show how much the lexical stage recovers, not
+absolute quality.
+
+    cd backend
+    python -m benchmarks.bench_hybrid_retrieval --chunks 20000 --queries 300
+'''
+
+import argparse
+import hashlib
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks._env import load_benchmark_env
+
+TOPICS = (
+    "prazo de entrega multa rescisão contratual pagamento parcelas fornecedor",
+    "garantia assistência técnica peças substituição defeito fabricação",
+    "confidencialidade dados pessoais tratamento LGPD sigilo informações",
+    "reajuste anual índice IPCA correção monetária valores contrato",
+    "foro comarca disputas arbitragem mediação conflitos partes",
+    "seguro responsabilidade civil danos terceiros cobertura apólice",
+)
+
+
+def identifier(rng: np.random.Generator, kind: int) -> str:
+    if kind == 0:
+        digits = rng.integers(0, 10, 14)
+        d = "".join(map(str, digits))
+        return f"CNPJ {d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
+    if kind == 1:
+        return f"cláusula {rng.integers(1, 30)}.{rng.integers(1, 12)}.{rng.integers(1, 9)}"
+    return f"produto {''.join(rng.choice(list('ABCDEFGHJKLMNPRSTUVXZ'), 3))}-{rng.integers(1000, 9999)}"
+
+
+def embed(text: str, dim: int) -> np.ndarray:
+    '''Hashed bag-of-words embedding; tokens with digits are ignored.'''
+    vector = np.zeros(dim, np.float32)
+    for word in text.lower().split():
+        if any(char.isdigit() for char in word):
+            continue
+        seed = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+        vector += np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="lexical-index-")
+    load_benchmark_env(LEXICAL_INDEX_DIR=directory)
+
+    from app.services.lexical_index import LexicalIndexStore
+    from app.services.rag_service import reciprocal_rank_fusion
+
+    rng = np.random.default_rng(0)
+    texts, identifiers = [], []
+    for i in range(args.chunks):
+        ident = identifier(rng, i % 3)
+        topic = TOPICS[rng.integers(0, len(TOPICS))]
+        words = " ".join(rng.choice(topic.split(), 6))
+        texts.append(f"Conforme a {ident}, o contratante observará {words}. {words}.")
+        identifiers.append(ident)
+    chunk_ids = np.arange(1, args.chunks + 1, dtype=np.int64)
+    vectors = np.stack([embed(text, args.dim) for text in texts])
+
+    store = LexicalIndexStore(directory)
+    started = time.perf_counter()
+    store.rebuild(1, chunk_ids, np.ones_like(chunk_ids), texts)
+    print(f"chunks={args.chunks} bm25 build={time.perf_counter() - started:.1f}s")
+
+    targets = rng.integers(0, args.chunks, args.queries)
+    stats = {name: [0, 0, 0.0] for name in ("vector", f"vector@{args.candidates}", "hybrid")}
+    lexical_times = []
+    for target in targets:
+        question = f"O que diz o contrato sobre {identifiers[target]} e {texts[target].split()[-2]}?"
+        scores = vectors @ embed(question, args.dim)
+        vector_ranking = [int(chunk_ids[i]) for i in np.argsort(-scores)[:args.candidates]]
+
+        started = time.perf_counter()
+        lexical_ids, _ = store.search(1, question, args.candidates)
+        lexical_times.append(time.perf_counter() - started)
+        fused = [chunk_id for chunk_id, _ in
+                 reciprocal_rank_fusion([vector_ranking, lexical_ids.tolist()])[:args.k]]
+
+        expected = int(chunk_ids[target])
+        for name, ranking in (("vector", vector_ranking[:args.k]),
+                              (f"vector@{args.candidates}", vector_ranking), ("hybrid", fused)):
+            if expected in ranking:
+                stats[name][0] += ranking.index(expected) == 0
+                stats[name][1] += 1
+                stats[name][2] += 1 / (ranking.index(expected) + 1)
+
+    print(f"{'retrieval':>12} {'context':>8} {'hit@1':>7} {'hit@ctx':>8} {'MRR':>6}")
+    for name, (hits_1, hits_k, reciprocal) in stats.items():
+        context = args.candidates if name.startswith("vector@") else args.k
+        print(f"{name:>12} {context:>8} {hits_1 / args.queries:>7.3f} {hits_k / args.queries:>8.3f} "
+              f"{reciprocal / args.queries:>6.3f}")
+    print(f"bm25 search p50={np.percentile(lexical_times, 50) * 1000:.2f}ms "
+          f"p99={np.percentile(lexical_times, 99) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# backend/benchmarks/bench_mmr.py
+'''
+Cost of the MMR re-ranking stage of the chat, per query, over candidate
+sets of the size the chat over-fetches (MMR_CANDIDATES).
+
+Times the whole path after the RPC returns: JSON decode of the PostgREST
+payload, decode of the candidate embeddings and `mmr_select`
+(`app.services.rag_service._rerank`). The embeddings are compared in the
+two wire formats: `embedding_b64` (base64 of pgvector's binary
+`vector_send`, what migrations 005/006 return) and the pgvector text
+form ("[0.1,0.2,...]"). `mmr_select` alone is checked against a plain
+Python loop that computes each pairwise similarity.
+
+    cd backend
+    python -m benchmarks.bench_mmr --candidates 50,100,200,400 --k 5,10
+'''
+
+import argparse
+import base64
+import json
+import statistics
+import time
+
+import numpy as np
+
+from benchmarks._env import load_benchmark_env
+
+
+def naive_mmr(relevance: list[float], vectors: list[list[float]], k: int, lambda_: float) -> list[int]:
+    '''Reference MMR: recomputes every similarity to the picked set at each step.'''
+    def dot(a, b):
+        return sum(x * y for x, y in zip(a, b))
+
+    picked: list[int] = []
+    while len(picked) < min(k, len(relevance)):
+        best, best_score = None, float("-inf")
+        for i in range(len(relevance)):
+            if i in picked:
+                continue
+            penalty = max((dot(vectors[i], vectors[j]) for j in picked), default=float("-inf"))
+            score = lambda_ * relevance[i] - (1 - lambda_) * penalty
+            if score > best_score:
+                best, best_score = i, score
+        picked.append(best)
+    return picked
+
+
+def _median_us(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(timings)
+
+
+def _payloads(vectors: np.ndarray, relevance: np.ndarray) -> dict[str, str]:
+    '''RPC response bodies with the embeddings in each wire format.'''
+    rows = [{"id": i, "document_id": 1, "content": "x" * 800, "metadata": {"page": 1},
+             "document_name": "document.pdf", "similarity": float(score)}
+            for i, score in enumerate(relevance)]
+    header = np.array([vectors.shape[1], 0], dtype=">u2").tobytes()
+    binary = [base64.b64encode(header + vector.astype(">f4").tobytes()).decode() for vector in vectors]
+    # Texto do pgvector: floats com a precisão de float4
+    text = ["[" + ",".join(f"{value:.7g}" for value in vector) + "]" for vector in vectors]
+    return {
+        "base64": json.dumps([{**row, "embedding_b64": value} for row, value in zip(rows, binary)]),
+        "text": json.dumps([{**row, "embedding": value} for row, value in zip(rows, text)]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--candidates", default="50,100,200,400")
+    parser.add_argument("--k", default="5,10")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--lambda", dest="lambda_", type=float, default=0.7)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--naive-repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    load_benchmark_env(MMR_LAMBDA=str(args.lambda_))
+
+    from app.services import rag_service
+    from app.services.reranking import _normalize, mmr_select
+
+    def text_rerank(rows, k):
+        # Caminho antigo: o embedding chega como texto do pgvector
+        for row in rows:
+            row["embedding"] = np.fromstring(row["embedding"].strip("[]"), dtype=np.float32, sep=",")
+        return rag_service._rerank(rows, k)
+
+    rng = np.random.default_rng(0)
+    print(f"{'n':>5} {'k':>4} {'format':>7} {'payload KB':>11} {'json µs':>8} {'rerank µs':>10} "
+          f"{'total µs':>9} {'µs/vector':>10} {'mmr µs':>7} {'python µs':>10}")
+    for count in (int(n) for n in args.candidates.split(",")):
+        # Candidatos em grupos de quase-duplicatas, como trechos repetidos entre documentos
+        centers = rng.standard_normal((max(1, count // 4), args.dim)).astype(np.float32)
+        vectors = _normalize(centers[rng.integers(0, len(centers), count)]
+                             + 0.3 * rng.standard_normal((count, args.dim)).astype(np.float32))
+        relevance = np.sort(rng.uniform(0.3, 0.9, count).astype(np.float32))[::-1].copy()
+        relevance_list, vectors_list = relevance.tolist(), vectors.tolist()
+        payloads = _payloads(vectors, relevance)
+        for k in (int(k) for k in args.k.split(",")):
+            fast = mmr_select(relevance, vectors, k, args.lambda_)
+            reference = naive_mmr(relevance_list, vectors_list, k, args.lambda_)
+            assert fast.tolist() == reference, "vectorized MMR differs from the reference loop"
+            picked = [row["id"] for row in rag_service._rerank(json.loads(payloads["base64"]), k)]
+            assert picked == reference, "base64 embeddings change the MMR selection"
+
+            mmr_us = _median_us(lambda: mmr_select(relevance, vectors, k, args.lambda_), args.repeat)
+            python_us = _median_us(
+                lambda: naive_mmr(relevance_list, vectors_list, k, args.lambda_), args.naive_repeat)
+            for name, rerank in (("base64", rag_service._rerank), ("text", text_rerank)):
+                payload = payloads[name]
+                json_us = _median_us(lambda: json.loads(payload), args.repeat)
+                total_us = _median_us(lambda: rerank(json.loads(payload), k), args.repeat)
+                print(f"{count:>5} {k:>4} {name:>7} {len(payload) / 1024:>11.0f} {json_us:>8.0f} "
+                      f"{total_us - json_us:>10.0f} {total_us:>9.0f} {(total_us - mmr_us) / count:>10.1f} "
+                      f"{mmr_us:>7.0f} {python_us:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# backend/benchmarks/bench_pdf_extraction.py
+'''
+Benchmark for `app.services.pdf_extraction.extract_pages` on synthetic
+multi-hundred-page PDFs, serial versus the process pool.
+
+    cd backend
+    python -m benchmarks.bench_pdf_extraction --pages 200,500,1000 --workers 1,2,4
+'''
+
+import argparse
+import time
+
+from benchmarks._env import load_benchmark_env
+from benchmarks.synthetic_pdf import make_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", default="200,500")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    load_benchmark_env(PDF_PARALLEL_MIN_PAGES="1")
+
+    import fitz
+    from app.core.config import settings
+    from app.services.pdf_extraction import extract_pages
+
+    print(f"{'pages':>6} {'workers':>8} {'best s':>8} {'pages/s':>9}")
+    for pages in (int(p) for p in args.pages.split(",")):
+        pdf_bytes = make_pdf(pages)
+        baseline = None
+        for workers in (int(w) for w in args.workers.split(",")):
+            settings.PDF_EXTRACTION_WORKERS = workers
+            best = float("inf")
+            for _ in range(args.repeat):
+                with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+                    started = time.perf_counter()
+                    texts = list(extract_pages(pdf_document, pdf_bytes))
+                    best = min(best, time.perf_counter() - started)
+            assert [number for number, _ in texts] == list(range(1, pages + 1))
+            baseline = baseline or texts
+            assert texts == baseline, "parallel output differs from serial"
+            print(f"{pages:>6} {workers:>8} {best:>8.3f} {pages / best:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
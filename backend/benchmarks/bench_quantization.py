@@ -0,0 +1,124 @@
+# backend/benchmarks/bench_quantization.py
+'''
+Storage, memory and recall of the quantized two-stage search
+(EMBEDDING_QUANTIZATION "int8"/"binary") against the exact float path.
+
+Reports the bytes per embedding of each representation (Postgres column,
+PostgREST JSON, local index files), the bytes a query reads from the
+index (codes of the probed lists plus the float rows of the shortlist),
+and recall@k / latency against exact search for several
+QUANTIZED_RESCORE_FACTOR values.
+
+    cd backend
+    python -m benchmarks.bench_quantization --chunks 100000 --factors 1,4,10,20
+'''
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks._env import load_benchmark_env
+from benchmarks.bench_vector_index import percentile_ms, synthetic_embeddings
+
+
+def _file_mb(path: Path) -> float:
+    return path.stat().st_size / 2 ** 20 if path.exists() else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=32)
+    parser.add_argument("--factors", default="1,4,10,20")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="quantization-")
+    load_benchmark_env(VECTOR_INDEX_DIR=directory)
+
+    from app.core.config import settings
+    from app.services.quantization import bit_string
+    from app.services.vector_index import VectorIndexStore
+
+    vectors = synthetic_embeddings(args.chunks, args.dim, args.clusters)
+    chunk_ids = np.arange(1, args.chunks + 1, dtype=np.int64)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, args.chunks, args.queries)] \
+        + 0.3 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+
+    # Tamanho por embedding: colunas do Postgres (varlena + cabeçalho) e o JSON do PostgREST
+    sample = vectors[:200]
+    json_bytes = np.mean([len(json.dumps(vector.tolist())) for vector in sample])
+    bit_json_bytes = np.mean([len(json.dumps(bit_string(vector))) for vector in sample])
+    print(f"chunks={args.chunks} dim={args.dim} k={args.k} nprobe={args.nprobe}")
+    print(f"{'representation':>28} {'bytes/vector':>13} {'total MB':>9}")
+    for name, size in (
+        ("vector(768) column", 4 * args.dim + 8),
+        ("vector as PostgREST JSON", json_bytes),
+        ("bit(768) column", args.dim // 8 + 8),
+        ("bit(768) as PostgREST JSON", bit_json_bytes),
+        ("int8 codes + scale", args.dim + 4),
+    ):
+        print(f"{name:>28} {size:>13.0f} {size * args.chunks / 2 ** 20:>9.1f}")
+
+    # Verdade: busca exata sobre todos os vetores
+    truth, exact_times = [], []
+    for query in queries:
+        started = time.perf_counter()
+        scores = vectors @ (query / np.linalg.norm(query))
+        top = np.argpartition(scores, -args.k)[-args.k:]
+        exact_times.append(time.perf_counter() - started)
+        truth.append(set(chunk_ids[top].tolist()))
+
+    print()
+    print(f"{'search':>14} {'index MB':>9} {'read KB/query':>14} {'recall@' + str(args.k):>10} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    print(f"{'exact scan':>14} {vectors.nbytes / 2 ** 20:>9.1f} {vectors.nbytes / 1024:>14.0f} {1.0:>10.3f} "
+          f"{percentile_ms(exact_times, 50):>8.2f} {percentile_ms(exact_times, 99):>8.2f}")
+
+    for mode in ("", "int8", "binary"):
+        settings.EMBEDDING_QUANTIZATION = mode
+        store = VectorIndexStore(Path(directory) / (mode or "float"))
+        store.rebuild(1, chunk_ids, np.ones_like(chunk_ids), vectors)
+        snapshot = store.snapshot(1)
+        version = store.root / "1" / (store.root / "1" / "CURRENT").read_text().strip()
+        codes_mb = _file_mb(version / "codes.npy") + _file_mb(version / "scales.npy")
+        # Memória da varredura: os códigos (ou vetores) ficam residentes; o resto é lido sob demanda
+        index_mb = codes_mb if mode else _file_mb(version / "vectors.npy")
+        row_bytes = snapshot.codes.shape[1] + (4 if mode == "int8" else 0) if mode else 4 * args.dim
+
+        # Linhas varridas por consulta: as listas visitadas pelo nprobe
+        nlist = len(snapshot.centroids)
+        list_sizes = np.diff(snapshot.offsets)
+        scanned = np.mean([
+            list_sizes[np.argpartition(snapshot.centroids @ query, -args.nprobe)[-args.nprobe:]].sum()
+            if nlist > args.nprobe else args.chunks
+            for query in queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        ])
+
+        for factor in (int(value) for value in args.factors.split(",")) if mode else (None,):
+            if factor is not None:
+                settings.QUANTIZED_RESCORE_FACTOR = factor
+            times, hits = [], 0
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                ids, _ = store.search(1, query, args.k, args.nprobe)
+                times.append(time.perf_counter() - started)
+                hits += len(expected & set(ids.tolist()))
+            shortlist = args.k * factor if factor else 0
+            read_kb = (scanned * row_bytes + shortlist * 4 * args.dim) / 1024
+            name = f"{mode}/x{factor}" if mode else "ivf float"
+            print(f"{name:>14} {index_mb:>9.1f} {read_kb:>14.0f} {hits / (args.k * len(queries)):>10.3f} "
+                  f"{percentile_ms(times, 50):>8.2f} {percentile_ms(times, 99):>8.2f}")
+    settings.EMBEDDING_QUANTIZATION = ""
+
+
+if __name__ == "__main__":
+    main()
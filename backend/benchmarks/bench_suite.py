@@ -0,0 +1,291 @@
+# backend/benchmarks/bench_suite.py
+'''
+End-to-end benchmark suite that runs fully offline.
+
+Starts the fake Gemini and fake Supabase servers, uploads a synthetic
+PDF corpus, runs `process_document` on every document (in-process, like
+a worker) and then load-tests the chat endpoints over HTTP (uvicorn in a
+thread). Reports ingestion docs/min and chunks/s, chat latency
+percentiles and streamed time-to-first-token, and writes everything as
+JSON for regression tracking:
+
+    cd backend
+    python -m benchmarks.bench_suite --documents 20 --pages 30 --output results.json
+    python -m benchmarks.bench_suite --baseline results.json --max-regression 0.15
+
+With --baseline the run fails (exit code 1) when a key metric is worse
+than the baseline by more than --max-regression. The absolute numbers
+depend on the fake latencies (--gemini-latency-ms etc.), so only compare
+runs made with the same options.
+'''
+
+import argparse
+import json
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks._env import load_benchmark_env
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fake_supabase import FakeSupabaseServer
+from benchmarks.synthetic_pdf import make_pdf
+
+USER_ID = "00000000-0000-4000-8000-000000000001"
+WORKSPACE_ID = 1
+
+# (seção, métrica, maior é melhor) comparadas com o baseline
+KEY_METRICS = (
+    ("ingestion", "docs_per_min", True),
+    ("ingestion", "chunks_per_sec", True),
+    ("chat", "latency_ms.p95", False),
+    ("chat", "throughput_rps", True),
+    ("chat_stream", "first_token_ms.p95", False),
+)
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {}
+    array = np.asarray(values)
+    return {"p50": round(float(np.percentile(array, 50)), 2), "p95": round(float(np.percentile(array, 95)), 2),
+            "p99": round(float(np.percentile(array, 99)), 2), "mean": round(float(array.mean()), 2)}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_ingestion(args, supabase_server: FakeSupabaseServer, gemini: FakeGeminiServer) -> dict:
+    from app.tasks import process_document
+
+    sizes = [int(size) for size in str(args.pages).split(",")]
+    documents = []
+    for index in range(args.documents):
+        pages = sizes[index % len(sizes)]
+        path = f"{WORKSPACE_ID}/bench-{index:04d}.pdf"
+        supabase_server.put_object("workspaces_data", path, make_pdf(pages, seed=index))
+        documents.append({"id": index + 1, "name": f"bench-{index:04d}.pdf", "path": path, "status": "PENDING",
+                          "workspace_id": WORKSPACE_ID, "user_id": USER_ID, "last_processed_page": None,
+                          "page_hashes": None, "processed_chunks": None, "stage_seconds": None})
+    supabase_server.insert_rows("documents", documents)
+    requests_before = gemini.request_count
+
+    def ingest(document_id: int) -> float:
+        started = time.perf_counter()
+        process_document.apply(args=[document_id], throw=True)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.ingest_workers) as pool:
+        document_seconds = list(pool.map(ingest, [doc["id"] for doc in documents]))
+    wall = time.perf_counter() - started
+
+    rows = supabase_server.tables["documents"]
+    chunks = len(supabase_server.tables.get("document_chunks", []))
+    pages = sum(len(row.get("page_hashes") or []) for row in rows)
+    stage_seconds: dict[str, float] = {}
+    for row in rows:
+        for stage, seconds in (row.get("stage_seconds") or {}).items():
+            stage_seconds[stage] = round(stage_seconds.get(stage, 0.0) + seconds, 3)
+    return {
+        "documents": len(documents),
+        "failed": sum(row["status"] != "COMPLETED" for row in rows),
+        "pages": pages,
+        "chunks": chunks,
+        "wall_seconds": round(wall, 3),
+        "docs_per_min": round(len(documents) / wall * 60, 2),
+        "pages_per_sec": round(pages / wall, 2),
+        "chunks_per_sec": round(chunks / wall, 2),
+        "document_seconds": percentiles(document_seconds),
+        "stage_seconds": stage_seconds,
+        "gemini_requests": gemini.request_count - requests_before,
+    }
+
+
+def run_chat(args, base_url: str, token: str, questions: list[str]) -> tuple[dict, dict]:
+    '''
+    Questions are chunk texts: the fake embeddings only match identical
+    texts, so every question retrieves context and reaches generation.
+    '''
+    import httpx
+
+    from app.services.llm_service import NO_CONTEXT_ANSWER
+
+    headers = {"Authorization": f"Bearer {token}"}
+    local = threading.local()
+
+    def client() -> httpx.Client:
+        if not hasattr(local, "client"):
+            local.client = httpx.Client(base_url=base_url, headers=headers, timeout=60)
+        return local.client
+
+    def ask(index: int) -> float | None:
+        payload = {"workspace_id": WORKSPACE_ID, "question": questions[index % len(questions)]}
+        started = time.perf_counter()
+        response = client().post("/api/v1/chat/", json=payload)
+        if response.status_code != 200 or response.json()["answer"] == NO_CONTEXT_ANSWER:
+            return None
+        return (time.perf_counter() - started) * 1000
+
+    def ask_stream(index: int) -> tuple[float, float] | None:
+        payload = {"workspace_id": WORKSPACE_ID, "question": questions[(index + 1) % len(questions)]}
+        started = time.perf_counter()
+        first_token = None
+        with client().stream("POST", "/api/v1/chat/stream", json=payload) as response:
+            if response.status_code != 200:
+                return None
+            for line in response.iter_lines():
+                if first_token is None and line.startswith("event: token"):
+                    first_token = (time.perf_counter() - started) * 1000
+        if first_token is None:
+            return None
+        return first_token, (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(args.chat_concurrency) as pool:
+        started = time.perf_counter()
+        latencies = list(pool.map(ask, range(args.chat_requests)))
+        wall = time.perf_counter() - started
+        streamed = list(pool.map(ask_stream, range(args.chat_requests)))
+
+    ok = [latency for latency in latencies if latency is not None]
+    stream_ok = [result for result in streamed if result is not None]
+    chat = {
+        "requests": len(latencies),
+        "errors": len(latencies) - len(ok),  # inclui respostas sem contexto
+        "concurrency": args.chat_concurrency,
+        "latency_ms": percentiles(ok),
+        "throughput_rps": round(len(ok) / wall, 2),
+    }
+    chat_stream = {
+        "requests": len(streamed),
+        "errors": len(streamed) - len(stream_ok),
+        "first_token_ms": percentiles([first for first, _ in stream_ok]),
+        "total_ms": percentiles([total for _, total in stream_ok]),
+    }
+    return chat, chat_stream
+
+
+def _metric(results: dict, section: str, path: str):
+    value = results.get(section, {})
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list[str]:
+    '''Returns the key metrics that regressed beyond `max_regression`.'''
+    regressions = []
+    for section, path, higher_is_better in KEY_METRICS:
+        current, previous = _metric(results, section, path), _metric(baseline, section, path)
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > max_regression else "ok"
+        print(f"{section + '.' + path:<32} {previous:>10.2f} -> {current:>10.2f} ({change:+.1%}) {flag}")
+        if worse > max_regression:
+            regressions.append(f"{section}.{path}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=12)
+    parser.add_argument("--pages", default="10,30", help="Páginas por documento (lista, usada em ciclo)")
+    parser.add_argument("--ingest-workers", type=int, default=2)
+    parser.add_argument("--chat-requests", type=int, default=60)
+    parser.add_argument("--chat-concurrency", type=int, default=4)
+    parser.add_argument("--gemini-latency-ms", type=float, default=50.0)
+    parser.add_argument("--gemini-per-item-ms", type=float, default=0.5)
+    parser.add_argument("--gemini-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--gemini-token-interval-ms", type=float, default=30.0)
+    parser.add_argument("--gemini-rpm", type=float, default=0.0, help="Cota do Gemini falso (0 = sem limite)")
+    parser.add_argument("--supabase-latency-ms", type=float, default=2.0)
+    parser.add_argument("--output", help="Arquivo JSON de resultados")
+    parser.add_argument("--baseline", help="Resultados anteriores para comparação")
+    parser.add_argument("--max-regression", type=float, default=0.10)
+    args = parser.parse_args()
+
+    gemini = FakeGeminiServer(("127.0.0.1", 0), args.gemini_latency_ms, args.gemini_per_item_ms,
+                              args.gemini_first_token_ms, args.gemini_token_interval_ms, args.gemini_rpm).start()
+    supabase_server = FakeSupabaseServer(("127.0.0.1", 0), args.supabase_latency_ms).start()
+    load_benchmark_env(
+        SUPABASE_URL=supabase_server.url,
+        GEMINI_API_ENDPOINT=gemini.url,
+        # Mede o caminho completo: sem caches de embeddings ou de respostas
+        EMBEDDING_CACHE_BACKEND="none",
+        QUERY_CACHE_BACKEND="none",
+        INGESTION_FANOUT_MIN_PAGES="0",
+        CELERY_BROKER_URL="memory://",
+        CELERY_RESULT_BACKEND="cache+memory://",
+    )
+
+    import uvicorn
+    from jose import jwt
+
+    from app.core.config import settings
+    from app.main import app
+
+    print(f"Ingesting {args.documents} documents ({args.pages} pages) with {args.ingest_workers} workers...")
+    ingestion = run_ingestion(args, supabase_server, gemini)
+    print(json.dumps(ingestion, indent=2))
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    token = jwt.encode({"sub": USER_ID, "aud": settings.SUPABASE_JWT_AUDIENCE, "exp": int(time.time()) + 3600},
+                       settings.SUPABASE_JWT_SECRET, algorithm="HS256")
+    print(f"Chat: {args.chat_requests} requests per endpoint, concurrency {args.chat_concurrency}...")
+    contents = [chunk["content"] for chunk in supabase_server.tables.get("document_chunks", [])]
+    rng = np.random.default_rng(0)
+    questions = [contents[i] for i in rng.choice(len(contents), min(len(contents), args.chat_requests), replace=False)]
+    chat, chat_stream = run_chat(args, f"http://127.0.0.1:{port}", token, questions)
+    server.should_exit = True
+    print(json.dumps({"chat": chat, "chat_stream": chat_stream}, indent=2))
+
+    results = {
+        "suite": "oraculo-backend",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "options": vars(args) | {"baseline": None, "output": None},
+        "ingestion": ingestion,
+        "chat": chat,
+        "chat_stream": chat_stream,
+        "gemini": {"requests": gemini.request_count, "throttled": gemini.throttled_count},
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            regressions = compare(results, json.load(handle), args.max_regression)
+        if regressions:
+            print(f"Regressions beyond {args.max_regression:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# backend/benchmarks/bench_supabase_client.py
+'''
+Compares a new Supabase client per request (the old `get_db` behaviour)
+against the shared, pooled client from `app.core.supabase_client`.
+
+Runs against the local fake PostgREST server, so the numbers reflect
+client construction and connection setup rather than database work.
+
+    cd backend
+    python -m benchmarks.bench_supabase_client --requests 2000 --threads 8
+'''
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks._env import load_benchmark_env
+from benchmarks.fake_supabase import FakeSupabaseServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeSupabaseServer(("127.0.0.1", 0), args.latency_ms).start()
+    server.insert_rows("workspaces", [{"id": i, "name": f"Workspace {i}", "owner_id": "bench"} for i in range(50)])
+    load_benchmark_env(SUPABASE_URL=server.url)
+
+    from supabase import create_client
+
+    from app.core.config import settings
+    from app.core.supabase_client import get_supabase_client
+
+    def per_request(i: int):
+        client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+        return client.table("workspaces").select("*").eq("id", i % 50).execute()
+
+    def shared(i: int):
+        return get_supabase_client().table("workspaces").select("*").eq("id", i % 50).execute()
+
+    print(f"{'client':>12} {'requests':>9} {'connections':>12} {'seconds':>9} {'req/s':>9}")
+    for name, call in (("per-request", per_request), ("shared", shared)):
+        connections_before = server.connection_count
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            results = list(pool.map(call, range(args.requests)))
+        elapsed = time.perf_counter() - started
+        assert all(len(result.data) == 1 for result in results)
+        print(f"{name:>12} {args.requests:>9} {server.connection_count - connections_before:>12} "
+              f"{elapsed:>9.2f} {args.requests / elapsed:>9.1f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# backend/benchmarks/bench_vector_index.py
+'''
+Recall and latency of the IVF workspace index against exact search.
+
+Builds an index over synthetic clustered embeddings, then compares
+exact cosine search (a full scan, as `match_document_chunks` does
+without an ANN index) with IVF search at several `nprobe` values.
+
+    cd backend
+    python -m benchmarks.bench_vector_index --chunks 200000 --queries 200
+'''
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks._env import load_benchmark_env
+
+
+def synthetic_embeddings(count: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    '''Unit vectors drawn around random topic centres, like document embeddings.'''
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + 0.6 * rng.normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def percentile_ms(samples: list[float], q: float) -> float:
+    return float(np.percentile(samples, q) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", default="4,8,16,32,64")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="vector-index-")
+    load_benchmark_env(VECTOR_INDEX_DIR=directory)
+
+    from app.services.vector_index import VectorIndexStore
+
+    vectors = synthetic_embeddings(args.chunks, args.dim, args.clusters)
+    chunk_ids = np.arange(1, args.chunks + 1, dtype=np.int64)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, args.chunks, args.queries)] \
+        + 0.3 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+
+    store = VectorIndexStore(directory)
+    started = time.perf_counter()
+    store.rebuild(1, chunk_ids, np.ones_like(chunk_ids), vectors)
+    build_seconds = time.perf_counter() - started
+
+    # Novo store = novo processo da API: mede o carregamento via mmap
+    reader = VectorIndexStore(directory)
+    started = time.perf_counter()
+    snapshot = reader.snapshot(1)
+    load_ms = (time.perf_counter() - started) * 1000
+    print(f"chunks={args.chunks} dim={args.dim} nlist={len(snapshot.centroids)} "
+          f"build={build_seconds:.1f}s load={load_ms:.1f}ms")
+
+    truth, exact_times = [], []
+    for query in queries:
+        started = time.perf_counter()
+        scores = vectors @ (query / np.linalg.norm(query))
+        top = np.argpartition(scores, -args.k)[-args.k:]
+        exact_times.append(time.perf_counter() - started)
+        truth.append(set(chunk_ids[top].tolist()))
+
+    print(f"{'search':>10} {'recall@' + str(args.k):>9} {'p50 ms':>8} {'p99 ms':>8}")
+    print(f"{'exact':>10} {1.0:>9.3f} {percentile_ms(exact_times, 50):>8.2f} {percentile_ms(exact_times, 99):>8.2f}")
+    for nprobe in (int(value) for value in args.nprobe.split(",")):
+        times, hits = [], 0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            ids, _ = reader.search(1, query, args.k, nprobe)
+            times.append(time.perf_counter() - started)
+            hits += len(expected & set(ids.tolist()))
+        print(f"{'ivf/' + str(nprobe):>10} {hits / (args.k * len(queries)):>9.3f} "
+              f"{percentile_ms(times, 50):>8.2f} {percentile_ms(times, 99):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# backend/benchmarks/fake_gemini.py
+'''
+Local stand-in for the Gemini REST API used by the benchmarks.
+
+Implements `embedContent` and `batchEmbedContents` with a configurable
+per-request latency, returning deterministic vectors derived from the
+text so results are reproducible. `generateContent` and
+`streamGenerateContent` answer with a canned text, the stream emitting
+one piece every `token_interval_ms` after `first_token_ms`.
+
+With `rpm_limit` the server enforces a requests-per-minute quota (token
+bucket, bursts up to one second of quota) and answers 429
+RESOURCE_EXHAUSTED beyond it, like the real API.
+'''
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIM = 768
+
+
+def fake_vector(text: str, dim: int = EMBEDDING_DIM) -> list[float]:
+    '''Returns a deterministic unit-ish vector for `text`.'''
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    return [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+
+
+FAKE_ANSWER = (
+    "De acordo com os documentos analisados, o prazo de entrega é de 30 dias "
+    "corridos contados da assinatura do contrato, conforme a cláusula quinta."
+)
+
+
+def _content_text(content: dict) -> str:
+    return "".join(part.get("text", "") for part in content.get("parts", []))
+
+
+def _generation(text: str) -> dict:
+    return {"candidates": [{
+        "content": {"role": "model", "parts": [{"text": text}]},
+        "finishReason": "STOP",
+        "index": 0,
+    }]}
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        latency_ms: float = 50.0,
+        per_item_ms: float = 0.5,
+        first_token_ms: float = 300.0,
+        token_interval_ms: float = 30.0,
+        rpm_limit: float = 0.0,
+    ):
+        super().__init__(address, _Handler)
+        self.latency_ms = latency_ms
+        self.per_item_ms = per_item_ms
+        self.first_token_ms = first_token_ms
+        self.token_interval_ms = token_interval_ms
+        self.rpm_limit = rpm_limit
+        self.request_count = 0
+        self.item_count = 0
+        self.throttled_count = 0
+        self._lock = threading.Lock()
+        self._tokens = rpm_limit / 60.0
+        self._refilled_at = time.monotonic()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, items: int) -> None:
+        with self._lock:
+            self.request_count += 1
+            self.item_count += items
+
+    def admit(self) -> bool:
+        '''Takes a token from the quota bucket; False means the request is throttled.'''
+        if not self.rpm_limit:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            rate = self.rpm_limit / 60.0
+            # Rajadas de até um segundo de cota (no mínimo uma requisição)
+            self._tokens = min(max(rate, 1.0), self._tokens + (now - self._refilled_at) * rate)
+            self._refilled_at = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            self.throttled_count += 1
+            return False
+
+    def start(self) -> "FakeGeminiServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeGeminiServer
+
+    def log_message(self, format, *args):  # noqa: A002 - silencia o log padrão
+        pass
+
+    def _reply(self, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _sleep(self, items: int) -> None:
+        time.sleep((self.server.latency_ms + self.server.per_item_ms * items) / 1000.0)
+
+    def _stream(self, answer: str) -> None:
+        # A API REST devolve um array JSON cujos elementos chegam aos poucos
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        words = answer.split(" ")
+        pieces = [" ".join(words[i:i + 4]) + " " for i in range(0, len(words), 4)]
+        time.sleep(self.server.first_token_ms / 1000.0)
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(self.server.token_interval_ms / 1000.0)
+            prefix = "[" if index == 0 else ","
+            self.wfile.write((prefix + json.dumps(_generation(piece))).encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"]")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.split("?", 1)[0]
+
+        if not self.server.admit():
+            self._reply(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                                        "message": "Quota exceeded (fake rate limit)."}})
+        elif path.endswith(":batchEmbedContents"):
+            requests = body.get("requests", [])
+            self._sleep(len(requests))
+            self.server.record(len(requests))
+            self._reply(200, {"embeddings": [
+                {"values": fake_vector(_content_text(r.get("content", {})))} for r in requests
+            ]})
+        elif path.endswith(":embedContent"):
+            self._sleep(1)
+            self.server.record(1)
+            self._reply(200, {"embedding": {"values": fake_vector(_content_text(body.get("content", {})))}})
+        elif path.endswith(":generateContent"):
+            time.sleep((self.server.first_token_ms + self.server.token_interval_ms * 10) / 1000.0)
+            self.server.record(1)
+            self._reply(200, _generation(FAKE_ANSWER))
+        elif path.endswith(":streamGenerateContent"):
+            self.server.record(1)
+            self._stream(FAKE_ANSWER)
+        else:
+            self._reply(404, {"error": {"code": 404, "message": f"Unknown path {path}"}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--per-item-ms", type=float, default=0.5)
+    parser.add_argument("--first-token-ms", type=float, default=300.0)
+    parser.add_argument("--token-interval-ms", type=float, default=30.0)
+    parser.add_argument("--rpm", type=float, default=0.0, help="Requisições por minuto (0 = sem limite)")
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(("127.0.0.1", args.port), args.latency_ms, args.per_item_ms,
+                              args.first_token_ms, args.token_interval_ms, args.rpm)
+    print(f"Fake Gemini listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# backend/benchmarks/fake_supabase.py
+'''
+Local stand-in for the Supabase REST (PostgREST) and Storage APIs.
+
+Tables live in memory. Supports the subset of PostgREST used by the
+backend: select/insert/update/delete with eq, neq, gt, gte, lt, lte and
+in filters (including `metadata->key` JSON paths), `order`, `limit`,
+single-object responses and the `match_document_chunks` RPC. Storage
+objects can be seeded with `put_object` and downloaded over HTTP.
+
+Connections are kept alive (HTTP/1.1) so client-side pooling is visible.
+'''
+
+import argparse
+import base64
+import json
+import math
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+
+def _vector_b64(vector: list[float]) -> str:
+    '''`encode(vector_send(v), 'base64')`: int16 dim, int16 unused, big-endian float4s.'''
+    return base64.b64encode(struct.pack(f">HH{len(vector)}f", len(vector), 0, *vector)).decode()
+
+
+def _column_value(row: dict, column: str):
+    '''Resolves `col`, `col->key` and `col->>key` paths.'''
+    text = "->>" in column
+    parts = column.replace("->>", "->").split("->")
+    value = row.get(parts[0])
+    for part in parts[1:]:
+        value = value.get(part) if isinstance(value, dict) else None
+    return str(value) if text and value is not None else value
+
+
+def _coerce(raw: str, like):
+    if isinstance(like, bool):
+        return raw == "true"
+    if isinstance(like, (int, float)):
+        try:
+            return type(like)(float(raw)) if isinstance(like, float) else int(float(raw))
+        except ValueError:
+            return raw
+    if raw == "null":
+        return None
+    return raw
+
+
+def _matches(row: dict, column: str, expression: str) -> bool:
+    operator, _, raw = expression.partition(".")
+    value = _column_value(row, column)
+    if operator == "is":
+        return value is None if raw == "null" else str(value).lower() == raw
+    if operator == "in":
+        options = [option.strip('"') for option in raw.strip("()").split(",") if option]
+        return str(value) in options
+    if value is None:
+        return False
+    target = _coerce(raw, value)
+    if isinstance(value, str) and not isinstance(target, str):
+        target = str(target)
+    try:
+        return {
+            "eq": value == target, "neq": value != target,
+            "gt": value > target, "gte": value >= target,
+            "lt": value < target, "lte": value <= target,
+        }[operator]
+    except (KeyError, TypeError):
+        return False
+
+
+def _cosine(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class FakeSupabaseServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms: float = 0.0):
+        super().__init__(address, _Handler)
+        self.latency_ms = latency_ms
+        self.tables: dict[str, list[dict]] = {}
+        self.objects: dict[str, bytes] = {}
+        self.request_count = 0
+        self.connection_count = 0
+        self._next_id: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeSupabaseServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connection_count += 1
+        super().process_request(request, client_address)
+
+    # --- Seeding helpers ---
+
+    def insert_rows(self, table: str, rows: list[dict]) -> list[dict]:
+        with self.lock:
+            stored = []
+            for row in rows:
+                row = dict(row)
+                if "id" not in row:
+                    self._next_id[table] = self._next_id.get(table, 0) + 1
+                    row["id"] = self._next_id[table]
+                row.setdefault("created_at", time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime()))
+                self.tables.setdefault(table, []).append(row)
+                stored.append(row)
+            return stored
+
+    def put_object(self, bucket: str, path: str, data: bytes) -> None:
+        self.objects[f"{bucket}/{path}"] = data
+
+    # --- RPCs ---
+
+    def match_document_chunks(self, params: dict, with_embedding: bool = False) -> list[dict]:
+        query = params["query_embedding"]
+        if isinstance(query, str):
+            query = json.loads(query)
+        documents = {doc["id"]: doc for doc in self.tables.get("documents", [])}
+        scored = []
+        for chunk in self.tables.get("document_chunks", []):
+            if chunk.get("workspace_id") != params["p_workspace_id"]:
+                continue
+            embedding = chunk["embedding"]
+            if isinstance(embedding, str):
+                embedding = json.loads(embedding)
+            similarity = _cosine(query, embedding)
+            if similarity > params.get("match_threshold", 0.0):
+                scored.append((similarity, chunk, embedding))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [{
+            "id": chunk["id"],
+            "document_id": chunk["document_id"],
+            "content": chunk["content"],
+            "metadata": chunk.get("metadata"),
+            "document_name": documents.get(chunk["document_id"], {}).get("name", "document"),
+            "similarity": similarity,
+            **({"embedding_b64": _vector_b64(embedding)} if with_embedding else {}),
+        } for similarity, chunk, embedding in scored[:params.get("match_count", 5)]]
+
+    def match_document_chunks_with_embedding(self, params: dict) -> list[dict]:
+        return self.match_document_chunks(params, with_embedding=True)
+
+    def match_document_chunks_binary(self, params: dict) -> list[dict]:
+        # Mesmas duas etapas da função SQL: Hamming sobre embedding_binary, cosseno exato na shortlist
+        query = params["query_embedding"]
+        if isinstance(query, str):
+            query = json.loads(query)
+        query_bits = "".join("1" if value > 0 else "0" for value in query)
+        chunks = [chunk for chunk in self.tables.get("document_chunks", [])
+                  if chunk.get("workspace_id") == params["p_workspace_id"] and chunk.get("embedding_binary")]
+        chunks.sort(key=lambda chunk: sum(a != b for a, b in zip(chunk["embedding_binary"], query_bits)))
+        shortlist = {chunk["id"] for chunk in chunks[:params.get("shortlist_count", 100)]}
+        rows = self.match_document_chunks({**params, "match_count": len(self.tables["document_chunks"])},
+                                          with_embedding=params.get("with_embedding", False))
+        return [row for row in rows if row["id"] in shortlist][:params.get("match_count", 5)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeSupabaseServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002 - silencia o log padrão
+        pass
+
+    # --- Response helpers ---
+
+    def _send(self, status: int, payload: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _json(self, status: int, body) -> None:
+        self._send(status, json.dumps(body, default=str).encode("utf-8"))
+
+    def _body(self):
+        return json.loads(self.raw_body) if self.raw_body else None
+
+    def _route(self, method: str) -> None:
+        # Lê o corpo de toda requisição (o postgrest-py envia "{}" no DELETE)
+        # para não corromper a próxima requisição da conexão keep-alive
+        length = int(self.headers.get("Content-Length") or 0)
+        self.raw_body = self.rfile.read(length) if length else b""
+        if self.server.latency_ms:
+            time.sleep(self.server.latency_ms / 1000.0)
+        with self.server.lock:
+            self.server.request_count += 1
+
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        params = parse_qsl(url.query, keep_blank_values=True)
+
+        if path.startswith("/rest/v1/rpc/"):
+            return self._rpc(path.rsplit("/", 1)[-1])
+        if path.startswith("/rest/v1/"):
+            return self._table(method, path[len("/rest/v1/"):], params)
+        if path.startswith("/storage/v1/object/"):
+            return self._storage(method, path[len("/storage/v1/object/"):])
+        self._json(404, {"message": f"Unknown path {path}"})
+
+    # --- PostgREST ---
+
+    def _rpc(self, name: str) -> None:
+        body = self._body() or {}
+        handler = getattr(self.server, name, None)
+        if handler is None:
+            # Mesmo formato do PostgREST para função inexistente
+            return self._json(404, {"code": "PGRST202", "details": None, "hint": None,
+                                    "message": f"Could not find the function public.{name}"})
+        with self.server.lock:
+            result = handler(body)
+        self._json(200, result)
+
+    def _table(self, method: str, table: str, params: list[tuple[str, str]]) -> None:
+        filters = [(k, v) for k, v in params
+                   if k not in ("select", "order", "limit", "offset", "on_conflict", "columns")]
+        options = dict(params)
+        body = self._body()
+
+        if method == "POST":
+            rows = body if isinstance(body, list) else [body]
+            result = self.server.insert_rows(table, rows)
+        else:
+            with self.server.lock:
+                rows = self.server.tables.setdefault(table, [])
+                selected = [row for row in rows
+                            if all(_matches(row, column, expression) for column, expression in filters)]
+                if method == "PATCH":
+                    for row in selected:
+                        row.update(body or {})
+                elif method == "DELETE":
+                    self.server.tables[table] = [row for row in rows if row not in selected]
+                result = [dict(row) for row in selected]
+
+            if "order" in options:
+                column, _, direction = options["order"].partition(".")
+                result.sort(key=lambda row: (_column_value(row, column) is None, _column_value(row, column)),
+                            reverse=direction.startswith("desc"))
+            offset = int(options.get("offset", 0))
+            if "limit" in options:
+                result = result[offset:offset + int(options["limit"])]
+            elif offset:
+                result = result[offset:]
+            if options.get("select") and options["select"] != "*":
+                columns = [column.strip() for column in options["select"].split(",")]
+                result = [{column: row.get(column) for column in columns} for row in result]
+
+        if "vnd.pgrst.object" in (self.headers.get("Accept") or ""):
+            if len(result) != 1:
+                return self._json(406, {"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned",
+                                        "details": f"The result contains {len(result)} rows", "hint": None})
+            return self._json(200, result[0])
+        self._json(200 if method != "POST" else 201, result)
+
+    # --- Storage ---
+
+    def _storage(self, method: str, key: str) -> None:
+        if method == "GET":
+            data = self.server.objects.get(key)
+            if data is None:
+                return self._json(404, {"statusCode": "404", "error": "not_found", "message": "Object not found"})
+            return self._send(200, data, "application/octet-stream")
+        if method == "POST":
+            self.server.objects[key] = self.raw_body
+            return self._json(200, {"Key": key})
+        if method == "DELETE":
+            self.server.objects.pop(key, None)
+            return self._json(200, {"message": "Successfully deleted"})
+        self._json(405, {"message": "Method not allowed"})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PATCH(self):
+        self._route("PATCH")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+    def do_HEAD(self):
+        self._route("GET")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeSupabaseServer(("127.0.0.1", args.port), args.latency_ms)
+    print(f"Fake Supabase listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# backend/benchmarks/synthetic_pdf.py
+'''
+Synthetic PDF generator for the ingestion benchmarks.
+
+Pages are filled with pseudo-contractual Portuguese text (clauses,
+CNPJs, amounts) so extraction and chunking see realistic density.
+'''
+
+import argparse
+import random
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+_WORDS = (
+    "contrato prazo entrega cláusula pagamento multa rescisão fornecedor contratante "
+    "obrigações vigência reajuste garantia seguro responsabilidade prestação serviços "
+    "parcela medição aditivo notificação foro comarca partes objeto valor total"
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(_WORDS, k=rng.randint(8, 20))
+    words[0] = words[0].capitalize()
+    return " ".join(words) + "."
+
+
+def page_text(rng: random.Random, page_number: int, paragraphs: int = 6) -> str:
+    '''Returns the text of one synthetic page.'''
+    lines = [f"CLÁUSULA {page_number}ª - DISPOSIÇÕES GERAIS"]
+    for paragraph in range(paragraphs):
+        cnpj = f"{rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}/0001-{rng.randint(10, 99)}"
+        sentences = " ".join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+        lines.append(f"{page_number}.{paragraph + 1}. {sentences} CNPJ {cnpj}, "
+                     f"valor de R$ {rng.randint(1_000, 999_999):,},00.")
+    return "\n\n".join(lines)
+
+
+def make_pdf(pages: int, seed: int = 0, paragraphs: int = 6) -> bytes:
+    '''Builds an in-memory PDF with `pages` pages of synthetic text.'''
+    rng = random.Random(seed)
+    document = fitz.open()
+    for page_number in range(1, pages + 1):
+        page = document.new_page()
+        page.insert_textbox(page.rect + (50, 50, -50, -50), page_text(rng, page_number, paragraphs),
+                            fontsize=9)
+    data = document.tobytes(garbage=3, deflate=True)
+    document.close()
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("output_dir", type=Path)
+    parser.add_argument("--sizes", default="10,100,300,800", help="Páginas por arquivo")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    for index, pages in enumerate(int(size) for size in args.sizes.split(",")):
+        path = args.output_dir / f"synthetic_{pages:04d}p.pdf"
+        path.write_bytes(make_pdf(pages, seed=args.seed + index))
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+-- Checkpoint do pipeline de ingestão: última página cujos chunks já foram
+-- gravados em document_chunks. Uma nova tentativa de process_document
+-- retoma a partir da página seguinte. NULL = sem processamento em andamento.
+ALTER TABLE public.documents
+    ADD COLUMN IF NOT EXISTS last_processed_page integer;
+
+-- Acelera a remoção dos chunks parciais de um documento ao retomar
+CREATE INDEX IF NOT EXISTS document_chunks_document_id_idx
+    ON public.document_chunks (document_id);
@@ -0,0 +1,6 @@
+-- Reingestão incremental: hash (blake2b, 8 bytes em hex) do texto de cada
+-- página/unidade da última versão processada, indexado por página - 1.
+-- Reprocessar o documento só refaz os chunks das páginas cujo hash mudou.
+-- NULL = documento nunca processado por completo (processa tudo).
+ALTER TABLE public.documents
+    ADD COLUMN IF NOT EXISTS page_hashes jsonb;
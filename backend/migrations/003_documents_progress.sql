@@ -0,0 +1,7 @@
+-- Progresso e tempos da ingestão, visíveis na própria linha do documento.
+-- processed_chunks: chunks já gravados (atualizado a cada checkpoint).
+-- stage_seconds: segundos gastos em cada estágio (download, extract, chunk,
+-- embed, insert) na última execução, ex.: {"embed": 41.2, "insert": 3.9, ...}
+ALTER TABLE public.documents
+    ADD COLUMN IF NOT EXISTS processed_chunks integer,
+    ADD COLUMN IF NOT EXISTS stage_seconds jsonb;
@@ -0,0 +1,6 @@
+-- Índices das listagens paginadas por chave da API: filtro pelo dono (e
+-- workspace) e ordem por id, sem ordenar a tabela inteira a cada página.
+CREATE INDEX IF NOT EXISTS documents_workspace_user_id_idx
+    ON public.documents (workspace_id, user_id, id);
+CREATE INDEX IF NOT EXISTS workspaces_user_id_id_idx
+    ON public.workspaces (user_id, id);
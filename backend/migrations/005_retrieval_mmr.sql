@@ -0,0 +1,42 @@
+-- Re-ranking MMR da busca: número final de chunks por workspace (NULL usa
+-- CONTEXT_CANDIDATES) e uma variante de match_document_chunks que devolve
+-- também o embedding de cada candidato, para o MMR rodar na API. O vetor vai
+-- no formato binário do pgvector (vector_send) em base64: ~4 KB por vetor
+-- contra ~15 KB do texto, e decodificado sem parser de texto na API.
+ALTER TABLE public.workspaces
+    ADD COLUMN IF NOT EXISTS retrieval_top_k integer
+    CHECK (retrieval_top_k IS NULL OR retrieval_top_k BETWEEN 1 AND 50);
+
+DROP FUNCTION IF EXISTS public.match_document_chunks_with_embedding(vector, bigint, float, int);
+CREATE FUNCTION public.match_document_chunks_with_embedding(
+    query_embedding vector(768),
+    p_workspace_id bigint,
+    match_threshold float,
+    match_count int
+)
+RETURNS TABLE (
+    id bigint,
+    document_id bigint,
+    content text,
+    metadata jsonb,
+    document_name text,
+    similarity float,
+    embedding_b64 text
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT
+        dc.id,
+        dc.document_id,
+        dc.content,
+        dc.metadata,
+        d.name AS document_name,
+        1 - (dc.embedding <=> query_embedding) AS similarity,
+        encode(vector_send(dc.embedding), 'base64') AS embedding_b64
+    FROM public.document_chunks dc
+    JOIN public.documents d ON d.id = dc.document_id
+    WHERE dc.workspace_id = p_workspace_id
+      AND 1 - (dc.embedding <=> query_embedding) > match_threshold
+    ORDER BY dc.embedding <=> query_embedding
+    LIMIT match_count;
+$$;
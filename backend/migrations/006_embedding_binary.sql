@@ -0,0 +1,68 @@
+-- Busca em duas etapas com EMBEDDING_QUANTIZATION="binary": bits de sinal
+-- de cada embedding (1 bit por dimensão, 96 bytes contra ~3 KB do vetor),
+-- varridos pela distância de Hamming; só a shortlist é reavaliada com o
+-- cosseno exato. Requer pgvector >= 0.7 (binary_quantize) e PostgreSQL >= 14
+-- (bit_count).
+-- O UPDATE preenche as linhas antigas e pode ser reexecutado depois de
+-- ativar a opção (linhas gravadas com ela desativada ficam sem os bits).
+ALTER TABLE public.document_chunks
+    ADD COLUMN IF NOT EXISTS embedding_binary bit(768);
+
+UPDATE public.document_chunks
+    SET embedding_binary = binary_quantize(embedding)::bit(768)
+    WHERE embedding_binary IS NULL AND embedding IS NOT NULL;
+
+-- A varredura de Hamming é exata e restrita ao workspace: um HNSW global
+-- filtraria o workspace depois de percorrer o grafo (ef_search candidatos
+-- de todos os workspaces), deixando a shortlist de workspaces pequenos
+-- curta ou vazia. O índice por workspace inclui os bits, então a varredura
+-- lê ~100 bytes por chunk do workspace (index-only scan) e não a tabela.
+DROP INDEX IF EXISTS public.document_chunks_embedding_binary_idx;
+CREATE INDEX IF NOT EXISTS document_chunks_workspace_binary_idx
+    ON public.document_chunks (workspace_id) INCLUDE (id, embedding_binary);
+
+DROP FUNCTION IF EXISTS public.match_document_chunks_binary(vector, bigint, float, int, int, boolean);
+CREATE FUNCTION public.match_document_chunks_binary(
+    query_embedding vector(768),
+    p_workspace_id bigint,
+    match_threshold float,
+    match_count int,
+    shortlist_count int DEFAULT 100,
+    with_embedding boolean DEFAULT false
+)
+RETURNS TABLE (
+    id bigint,
+    document_id bigint,
+    content text,
+    metadata jsonb,
+    document_name text,
+    similarity float,
+    embedding_b64 text
+)
+LANGUAGE sql STABLE
+AS $$
+    WITH shortlist AS (
+        -- bit_count(a # b) é a distância de Hamming; ao contrário de <~>, não
+        -- casa com nenhum índice HNSW, então a ordenação é sempre exata
+        SELECT dc.id
+        FROM public.document_chunks dc
+        WHERE dc.workspace_id = p_workspace_id
+          AND dc.embedding_binary IS NOT NULL
+        ORDER BY bit_count(dc.embedding_binary # binary_quantize(query_embedding)::bit(768))
+        LIMIT shortlist_count
+    )
+    SELECT
+        s.id,
+        s.document_id,
+        s.content,
+        s.metadata,
+        d.name AS document_name,
+        1 - (s.embedding <=> query_embedding) AS similarity,
+        CASE WHEN with_embedding THEN encode(vector_send(s.embedding), 'base64') END AS embedding_b64
+    FROM shortlist
+    JOIN public.document_chunks s ON s.id = shortlist.id
+    JOIN public.documents d ON d.id = s.document_id
+    WHERE 1 - (s.embedding <=> query_embedding) > match_threshold
+    ORDER BY s.embedding <=> query_embedding
+    LIMIT match_count;
+$$;
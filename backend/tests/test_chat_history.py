@@ -0,0 +1,166 @@
+import pytest
+from postgrest.exceptions import APIError
+
+from app.services import chat_history
+from app.services.chat_history import MemoryChatHistory, RedisChatHistory, is_permanent_error
+
+
+def _api_error(code: str) -> APIError:
+    return APIError({"code": code, "message": "rejected", "hint": None, "details": None})
+
+
+class _Database:
+    '''Records inserted batches; rejects rows whose content is "bad" and can be switched off.'''
+
+    def __init__(self):
+        self.batches: list[list[str]] = []
+        self.down = False
+
+    def insert(self, db, rows):
+        if self.down:
+            raise ConnectionError("database unavailable")
+        if any(row['content'] == "bad" for row in rows):
+            raise _api_error("23514")
+        self.batches.append([row['content'] for row in rows])
+
+    @property
+    def written(self) -> list[str]:
+        return [content for batch in self.batches for content in batch]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = _Database()
+    monkeypatch.setattr(chat_history, "insert_messages", database.insert)
+    monkeypatch.setattr(chat_history, "get_supabase_client", lambda: None)
+    return database
+
+
+def _queue(history, *contents):
+    for content in contents:
+        history._push([{'content': content}])
+
+
+def test_permanent_errors_are_the_data_ones():
+    assert is_permanent_error(_api_error("23505"))
+    assert is_permanent_error(_api_error("22P02"))
+    assert not is_permanent_error(_api_error("42703"))
+    assert not is_permanent_error(_api_error("PGRST301"))
+    assert not is_permanent_error(ConnectionError())
+
+
+def test_flush_writes_the_queue_in_batches(database):
+    history = MemoryChatHistory(batch_size=2, flush_seconds=60, max_pending=100)
+    _queue(history, "a", "b", "c", "d", "e")
+
+    history.flush()
+    assert database.batches == [["a", "b"], ["c", "d"], ["e"]]
+    assert history._pending() == 0
+
+
+def test_transient_failures_keep_the_batch_queued(database):
+    history = MemoryChatHistory(batch_size=10, flush_seconds=60, max_pending=100)
+    _queue(history, "a", "b")
+
+    database.down = True
+    history.flush()
+    assert history._pending() == 2 and history._failures == 1
+
+    database.down = False
+    history.flush()
+    assert database.written == ["a", "b"]
+    assert history._failures == 0
+
+
+def test_rejected_messages_are_isolated_and_dropped(database):
+    history = MemoryChatHistory(batch_size=8, flush_seconds=60, max_pending=100)
+    _queue(history, "a", "b", "c", "bad", "e", "f", "g", "h", "i")
+
+    history.flush()
+    assert database.written == ["a", "b", "c", "e", "f", "g", "h", "i"]
+    assert history._pending() == 0
+
+
+def test_memory_queue_drops_the_oldest_when_full(database):
+    history = MemoryChatHistory(batch_size=10, flush_seconds=60, max_pending=3)
+    _queue(history, "a", "b", "c", "d")
+
+    history.flush()
+    assert database.written == ["b", "c", "d"]
+
+
+class _Redis:
+    '''Just the list, key and script operations RedisChatHistory uses.'''
+
+    def __init__(self):
+        self.lists: dict[str, list[bytes]] = {}
+        self.keys: dict[str, bytes] = {}
+
+    def set(self, key, value, nx, px):
+        if key in self.keys:
+            return False
+        self.keys[key] = value.encode()
+        return True
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def lrange(self, key, start, stop):
+        return self.lists.get(key, [])[start:stop + 1]
+
+    def ltrim(self, key, start, stop):
+        values = self.lists.get(key, [])
+        self.lists[key] = values[start:] if stop == -1 else values[start:stop + 1]
+
+    def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(v.encode() if isinstance(v, str) else v for v in values)
+        return len(self.lists[key])
+
+    def pipeline(self):
+        redis, calls = self, []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                return lambda *args: calls.append((name, args))
+
+            def execute(self):
+                for name, args in calls:
+                    getattr(redis, name)(*args)
+        return Pipeline()
+
+    def eval(self, script, key_count, key, *args):
+        if script == chat_history._PUSH_BOUNDED:
+            if self.llen(key) + len(args) - 1 > int(args[0]):
+                return -1
+            return self.rpush(key, *args[1:])
+        ours = self.keys.get(key) == args[0].encode()
+        if script == chat_history._RELEASE_LOCK and ours:
+            del self.keys[key]
+        return int(ours)
+
+
+def test_redis_queue_dead_letters_rejected_messages_and_is_bounded(monkeypatch, database):
+    redis = _Redis()
+    monkeypatch.setattr(chat_history, "get_redis", lambda: redis)
+    history = RedisChatHistory(batch_size=4, flush_seconds=60, max_pending=5)
+    _queue(history, "a", "bad", "c", "d", "e", "dropped")
+    redis.rpush(chat_history._QUEUE_KEY, b"{not json")
+
+    history.flush()
+    assert database.written == ["a", "c", "d", "e"]
+    assert redis.llen(chat_history._QUEUE_KEY) == 0
+    assert redis.lists[chat_history._DEAD_LETTER_KEY] == [b'{"content": "bad"}', b"{not json"]
+    # A trava foi liberada
+    assert chat_history._LOCK_KEY not in redis.keys
+
+
+def test_redis_flush_skips_when_another_process_holds_the_lock(monkeypatch, database):
+    redis = _Redis()
+    monkeypatch.setattr(chat_history, "get_redis", lambda: redis)
+    history = RedisChatHistory(batch_size=4, flush_seconds=60, max_pending=10)
+    _queue(history, "a")
+    redis.keys[chat_history._LOCK_KEY] = b"other"
+
+    history.flush()
+    assert database.written == []
+    assert redis.llen(chat_history._QUEUE_KEY) == 1
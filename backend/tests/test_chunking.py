@@ -0,0 +1,53 @@
+from app.core.config import settings
+from app.services.chunking import iter_document_chunks
+
+
+def _sentences(count: int, prefix: str) -> str:
+    return " ".join(f"{prefix} sentence number {i} ends here." for i in range(count))
+
+
+def test_chunks_respect_the_budget_and_cut_at_sentence_ends(monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_CHARS_PER_TOKEN", 4)
+    pages = [(1, _sentences(40, "First")), (2, _sentences(40, "Second"))]
+    chunks = list(iter_document_chunks(pages, max_tokens=50, min_tokens=20))
+
+    assert len(chunks) > 4
+    for chunk in chunks:
+        assert len(chunk.content) <= 200
+        assert chunk.content.endswith(".")
+    # Sem sobreposição nem perda de texto
+    text = " ".join(chunk.content for chunk in chunks)
+    assert text.split() == " ".join(text for _, text in pages).split()
+
+
+def test_paragraph_breaks_win_over_sentence_ends(monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_CHARS_PER_TOKEN", 4)
+    first = _sentences(3, "Intro")
+    second = _sentences(3, "Body")
+    chunks = list(iter_document_chunks([(1, f"{first}\n\n{second}")], max_tokens=40, min_tokens=10))
+
+    assert [chunk.content for chunk in chunks] == [first, second]
+
+
+def test_chunks_span_pages_with_offsets(monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_CHARS_PER_TOKEN", 4)
+    pages = [(1, "Short first page with one sentence."), (2, "", ), (3, "Third page text goes on.")]
+    chunks = list(iter_document_chunks(pages, max_tokens=100, min_tokens=10))
+
+    assert len(chunks) == 1
+    metadata = chunks[0].metadata
+    assert metadata == {'page_number': 1, 'page_start': 1, 'char_start': 0,
+                        'page_end': 3, 'char_end': len("Third page text goes on.")}
+    assert chunks[0].page_number == 1
+
+
+def test_text_without_breaks_is_cut_at_the_budget(monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_CHARS_PER_TOKEN", 1)
+    chunks = list(iter_document_chunks([(1, "x" * 250)], max_tokens=100, min_tokens=50))
+
+    assert [len(chunk.content) for chunk in chunks] == [100, 100, 50]
+    assert [chunk.metadata['char_start'] for chunk in chunks] == [0, 100, 200]
+
+
+def test_blank_pages_yield_no_chunks():
+    assert list(iter_document_chunks([(1, ""), (2, "   \n\n  ")])) == []
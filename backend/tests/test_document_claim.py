@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import tasks
+
+
+class _Query:
+    '''Minimal PostgREST query builder over an in-memory `documents` table.'''
+
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+        self.filters = []
+        self.changes = None
+
+    def select(self, *columns):
+        return self
+
+    def update(self, changes: dict):
+        self.changes = changes
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def single(self):
+        return self
+
+    def execute(self):
+        matched = [row for row in self.rows if all(match(row) for match in self.filters)]
+        if self.changes is None:
+            return SimpleNamespace(data=dict(matched[0]) if matched else None)
+        for row in matched:
+            row.update(self.changes)
+        return SimpleNamespace(data=[dict(row) for row in matched])
+
+
+class _Supabase:
+    def __init__(self, *rows: dict):
+        self.rows = list(rows)
+
+    def table(self, name):
+        assert name == "documents"
+        return _Query(self.rows)
+
+
+def _document(status: str) -> dict:
+    return {"id": 1, "status": status, "path": "1/a.pdf", "workspace_id": 1, "user_id": "u",
+            "last_processed_page": None, "page_hashes": None, "processed_chunks": None}
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    downloads = []
+    monkeypatch.setattr(tasks, "configure_gemini", lambda: None)
+    monkeypatch.setattr(tasks, "download_document", lambda supabase, document: downloads.append(document["id"]))
+    return downloads
+
+
+def test_only_one_of_two_dispatches_claims_the_document():
+    supabase = _Supabase(_document("PENDING"))
+
+    assert tasks.claim_document(supabase, 1, {"page_hashes": None}, retrying=False)
+    assert supabase.rows[0]["status"] == "PROCESSING"
+    assert not tasks.claim_document(supabase, 1, {"page_hashes": None}, retrying=False)
+    # Uma nova tentativa da tarefa que reivindicou continua com o documento
+    assert tasks.claim_document(supabase, 1, {}, retrying=True)
+
+
+def test_duplicate_dispatch_is_a_no_op(monkeypatch, downloads):
+    supabase = _Supabase(_document("PROCESSING"))
+    monkeypatch.setattr(tasks, "get_supabase_client", lambda: supabase)
+
+    tasks.process_document.apply(args=[1], throw=True)
+
+    assert downloads == []
+    assert supabase.rows == [_document("PROCESSING")]
+
+
+def test_completed_document_is_not_reprocessed_by_a_stale_dispatch(monkeypatch, downloads):
+    supabase = _Supabase({**_document("COMPLETED"), "page_hashes": ["h"]})
+    monkeypatch.setattr(tasks, "get_supabase_client", lambda: supabase)
+
+    tasks.process_document.apply(args=[1], throw=True)
+
+    assert downloads == []
+    assert supabase.rows[0]["status"] == "COMPLETED"
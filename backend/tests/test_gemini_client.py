@@ -0,0 +1,226 @@
+import asyncio
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from app.core.config import settings
+from app.services import gemini_client
+from app.services.gemini_client import (
+    BACKGROUND,
+    INTERACTIVE,
+    AdaptiveConcurrency,
+    GeminiLimiter,
+    MemoryTokenBucket,
+)
+
+
+class _Clock:
+    '''Fake `time` module: `sleep` only advances `monotonic`.'''
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+    perf_counter = staticmethod(time.perf_counter)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(gemini_client, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def limiter(monkeypatch, clock):
+    # 60 RPM com 10 s de rajada: capacidade 10, 1 ficha por segundo, reserva de 2 para o chat
+    monkeypatch.setattr(settings, "GEMINI_GENERATE_RPM", 60)
+    monkeypatch.setattr(settings, "GEMINI_BURST_SECONDS", 10.0)
+    monkeypatch.setattr(settings, "GEMINI_INTERACTIVE_RESERVE", 0.2)
+    monkeypatch.setattr(settings, "GEMINI_MAX_RETRIES", 3)
+    monkeypatch.setattr(settings, "GEMINI_CHAT_MAX_RETRIES", 1)
+    limiter = GeminiLimiter(MemoryTokenBucket(), max_concurrency=8)
+    monkeypatch.setattr(gemini_client, "_limiter", limiter)
+    return limiter
+
+
+def test_token_bucket_refills_at_its_rate_up_to_capacity(clock):
+    bucket = MemoryTokenBucket()
+
+    assert [bucket.take("embed", 2, 1.0, 0) for _ in range(2)] == [0, 0]
+    assert bucket.take("embed", 2, 1.0, 0) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.take("embed", 2, 1.0, 0) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.take("embed", 2, 1.0, 0) == 0
+    # Ficar ocioso não acumula além da capacidade
+    clock.now += 100
+    assert [bucket.take("embed", 2, 1.0, 0) for _ in range(3)][-1] == pytest.approx(1.0)
+    # Cada tipo tem seu próprio bucket
+    assert bucket.take("generate", 2, 1.0, 0) == 0
+
+
+def test_pause_holds_every_caller_of_the_kind(clock):
+    bucket = MemoryTokenBucket()
+    bucket.pause("generate", 3)
+
+    assert bucket.take("generate", 10, 1.0, 0) == pytest.approx(3)
+    assert bucket.take("embed", 10, 1.0, 0) == 0
+    clock.now += 3
+    assert bucket.take("generate", 10, 1.0, 0) == 0
+
+
+def test_background_calls_leave_the_interactive_reserve(limiter):
+    background = limiter._bucket("generate", BACKGROUND)
+    interactive = limiter._bucket("generate", INTERACTIVE)
+    assert background == (10.0, 1.0, 2.0)
+    assert interactive == (10.0, 1.0, 0.0)
+
+    assert [limiter.bucket.take("generate", *background) for _ in range(8)] == [0] * 8
+    assert limiter.bucket.take("generate", *background) > 0
+    # As duas últimas fichas ainda atendem o chat
+    assert [limiter.bucket.take("generate", *interactive) for _ in range(2)] == [0, 0]
+    assert limiter.bucket.take("generate", *interactive) > 0
+
+
+def test_wait_for_token_sleeps_until_a_token_is_available(limiter, clock):
+    for _ in range(8):
+        limiter.wait_for_token("generate", BACKGROUND)
+    assert clock.slept == []
+
+    limiter.wait_for_token("generate", BACKGROUND)
+    assert clock.slept and sum(clock.slept) >= 1.0
+
+
+def test_aimd_halves_once_per_second_and_recovers_additively(clock):
+    concurrency = AdaptiveConcurrency(8)
+    for _ in range(3):
+        concurrency.acquire()
+    concurrency.release(throttled=True)
+    # Uma rajada de 429 no mesmo segundo conta uma vez só
+    concurrency.release(throttled=True)
+    assert concurrency.limit == 4
+    clock.now += 1
+    concurrency.acquire()
+    concurrency.release(throttled=True)
+    concurrency.release(throttled=False)
+    assert concurrency.limit == pytest.approx(2 + 1 / 2)
+
+    # +1/limit por sucesso: uma vaga a cada `limit` sucessos, ~(8² - 2.5²) / 2 até o máximo
+    successes = 0
+    while concurrency.limit < 8:
+        concurrency.acquire()
+        concurrency.release(throttled=False)
+        successes += 1
+    assert 25 <= successes <= 32
+    assert concurrency.limit == 8
+
+
+def test_concurrency_limit_caps_calls_in_flight(clock):
+    concurrency = AdaptiveConcurrency(2)
+    concurrency.acquire()
+    concurrency.acquire()
+    assert not concurrency._try_acquire()
+    concurrency.release(throttled=False)
+    assert concurrency._try_acquire()
+
+
+def _failing(*errors, result="ok"):
+    '''SDK call that raises each of `errors` in turn, then returns `result`.'''
+    calls = []
+
+    def function():
+        calls.append(len(calls))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    function.calls = calls
+    return function
+
+
+def test_server_errors_are_retried_without_shrinking_the_limit(limiter):
+    function = _failing(google_exceptions.ServiceUnavailable("down"), TimeoutError())
+
+    assert gemini_client.call_gemini("generate", function, priority=BACKGROUND) == "ok"
+    assert len(function.calls) == 3
+    assert limiter.concurrency.limit == 8
+    assert limiter.concurrency._in_flight == 0
+
+
+def test_quota_errors_halve_the_limit_and_pause_the_bucket(limiter, clock):
+    function = _failing(google_exceptions.TooManyRequests("quota"))
+
+    assert gemini_client.call_gemini("generate", function, priority=BACKGROUND) == "ok"
+    assert limiter.concurrency.limit < 8
+    assert limiter.concurrency._in_flight == 0
+    assert limiter.bucket._cooldown_until.get("generate", 0) > 0
+
+
+def test_other_errors_are_not_retried(limiter):
+    function = _failing(ValueError("bad request"))
+
+    with pytest.raises(ValueError):
+        gemini_client.call_gemini("generate", function, priority=BACKGROUND)
+    assert len(function.calls) == 1
+    assert limiter.concurrency._in_flight == 0
+
+
+def test_interactive_calls_give_up_sooner(limiter):
+    errors = [google_exceptions.ServiceUnavailable("down")] * 5
+
+    interactive = _failing(*errors)
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        gemini_client.call_gemini("generate", interactive, priority=INTERACTIVE)
+    background = _failing(*errors)
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        gemini_client.call_gemini("generate", background, priority=BACKGROUND)
+
+    assert len(interactive.calls) == settings.GEMINI_CHAT_MAX_RETRIES + 1
+    assert len(background.calls) == settings.GEMINI_MAX_RETRIES + 1
+    assert limiter.concurrency._in_flight == 0
+
+
+def test_stream_holds_its_slot_until_exhausted(limiter):
+    stream = gemini_client.stream_gemini("generate", lambda: iter(["a", "b"]))
+
+    assert limiter.concurrency._in_flight == 1
+    assert next(stream) == "a"
+    assert limiter.concurrency._in_flight == 1
+    assert list(stream) == ["b"]
+    assert limiter.concurrency._in_flight == 0
+
+
+def test_closed_stream_releases_its_slot_once(limiter):
+    stream = gemini_client.stream_gemini("generate", lambda: iter(["a", "b"]))
+    next(stream)
+    stream.close()
+    stream.close()
+
+    assert limiter.concurrency._in_flight == 0
+
+
+def test_async_stream_holds_its_slot_until_exhausted(limiter):
+    async def chunks():
+        yield "a"
+        yield "b"
+
+    async def generate():
+        return chunks()
+
+    async def consume():
+        stream = await gemini_client.stream_gemini_async("generate", generate)
+        seen = []
+        async for chunk in stream:
+            seen.append((chunk, limiter.concurrency._in_flight))
+        return seen
+
+    assert asyncio.run(consume()) == [("a", 1), ("b", 1)]
+    assert limiter.concurrency._in_flight == 0
@@ -0,0 +1,80 @@
+import pytest
+
+from app.core.config import settings
+from app.services import rag_service
+from app.services.rag_service import reciprocal_rank_fusion
+
+
+def test_rrf_scores_are_summed_over_rankings():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+
+    assert [chunk_id for chunk_id, _ in fused] == [1, 3, 2]
+    scores = dict(fused)
+    assert scores[1] == pytest.approx(1 / 61 + 1 / 62)
+    assert scores[3] == pytest.approx(1 / 63 + 1 / 61)
+    assert scores[2] == pytest.approx(1 / 62)
+
+
+def test_rrf_k_trades_agreement_for_top_ranks():
+    # 2 está em terceiro nas duas listas; 1 e 3 lideram uma lista cada
+    rankings = [[1, 4, 2], [3, 5, 2]]
+    assert reciprocal_rank_fusion(rankings, k=60)[0][0] == 2
+    assert reciprocal_rank_fusion(rankings, k=0)[0][0] in (1, 3)
+
+
+def test_rrf_of_nothing_is_empty():
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+class _Retriever:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def retrieve(self, db, workspace_id, query_embedding, match_count, match_threshold, with_embedding=False):
+        return [dict(row) for row in self.rows[:match_count]]
+
+
+class _Lexical:
+    def __init__(self, ranking):
+        self.ranking = ranking
+
+    def search(self, workspace_id, query_text, k):
+        return self.ranking[:k], [1.0] * len(self.ranking[:k])
+
+
+@pytest.fixture
+def hybrid(monkeypatch):
+    monkeypatch.setattr(settings, "RETRIEVAL_HYBRID", True)
+    monkeypatch.setattr(settings, "RETRIEVAL_MMR", False)
+    monkeypatch.setattr(settings, "HYBRID_CANDIDATES", 10)
+    monkeypatch.setattr(settings, "HYBRID_RRF_K", 60)
+    vector_rows = [{'id': i, 'content': f"chunk {i}", 'similarity': 1 - i / 10} for i in (1, 2, 3)]
+    monkeypatch.setattr(rag_service, "get_retriever", lambda: _Retriever(vector_rows))
+    fetched = []
+
+    def fetch_chunks(db, chunk_ids):
+        fetched.extend(chunk_ids)
+        return {chunk_id: {'id': chunk_id, 'content': f"chunk {chunk_id}"} for chunk_id in chunk_ids}
+
+    monkeypatch.setattr(rag_service, "fetch_chunks", fetch_chunks)
+    return fetched
+
+
+def test_hybrid_retrieval_fuses_vector_and_lexical_candidates(monkeypatch, hybrid):
+    monkeypatch.setattr(rag_service, "get_lexical_index", lambda: _Lexical([9, 3, 1]))
+    rows = rag_service.retrieve_chunks(None, 1, [0.0], match_count=3, query_text="question")
+
+    assert [row['id'] for row in rows] == [1, 3, 9]
+    # Chunks só do BM25 são buscados no banco e não têm similaridade vetorial
+    assert hybrid == [9]
+    assert rows[2]['similarity'] is None
+    assert all('rrf_score' in row for row in rows)
+
+
+def test_hybrid_retrieval_without_a_lexical_index_is_vector_only(monkeypatch, hybrid):
+    monkeypatch.setattr(rag_service, "get_lexical_index", lambda: _Lexical(None))
+    monkeypatch.setattr(_Lexical, "search", lambda self, workspace_id, query_text, k: None)
+    rows = rag_service.retrieve_chunks(None, 1, [0.0], match_count=2, query_text="question")
+
+    assert [row['id'] for row in rows] == [1, 2]
+    assert hybrid == []
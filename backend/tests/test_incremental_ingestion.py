@@ -0,0 +1,67 @@
+from app.services.ingestion_pipeline import UnitLocations, page_hash, plan_incremental, unit_hashes
+
+
+def _hashes(*texts: str) -> list[str]:
+    return [page_hash(text) for text in texts]
+
+
+def test_unchanged_document_has_nothing_to_do():
+    hashes = _hashes("a", "b", "c")
+    spans = [(1, 1, 1), (2, 2, 3)]
+    assert plan_incremental(hashes, hashes, spans) == ([], [])
+
+
+def test_changed_page_is_rechunked_with_the_chunks_that_touch_it():
+    old = _hashes("a", "b", "c", "d", "e")
+    new = _hashes("a", "b", "C", "d", "e")
+    spans = [(10, 1, 1), (11, 2, 2), (12, 3, 3), (13, 4, 4), (14, 5, 5)]
+
+    assert plan_incremental(old, new, spans) == ([(3, 3)], [12])
+
+
+def test_chunks_across_pages_widen_the_dirty_range():
+    old = _hashes("a", "b", "c", "d", "e", "f")
+    new = _hashes("a", "b", "c", "D", "e", "f")
+    # 11 (2-4) e 12 (4-5) tocam a página 4; 11 leva a 2, que leva 13 (1-2) e daí o 10 (1)
+    spans = [(10, 1, 1), (13, 1, 2), (11, 2, 4), (12, 4, 5), (14, 6, 6)]
+
+    ranges, stale = plan_incremental(old, new, spans)
+    assert ranges == [(1, 5)]
+    assert stale == [10, 11, 12, 13]
+
+
+def test_added_and_removed_pages_are_dirty():
+    spans = [(10, 1, 1), (11, 2, 2), (12, 3, 3)]
+
+    assert plan_incremental(_hashes("a", "b", "c"), _hashes("a", "b", "c", "d"), spans) == ([(4, 4)], [])
+    # A página 3 sumiu: seus chunks ficam obsoletos e não há o que refazer
+    assert plan_incremental(_hashes("a", "b", "c"), _hashes("a", "b"), spans) == ([], [12])
+
+
+def test_separate_changes_give_separate_ranges():
+    old = _hashes("a", "b", "c", "d", "e")
+    new = _hashes("A", "b", "c", "d", "E")
+    spans = [(10, 1, 1), (11, 2, 2), (12, 3, 4), (13, 5, 5)]
+
+    assert plan_incremental(old, new, spans) == ([(1, 1), (5, 5)], [10, 13])
+
+
+class _Source:
+    '''Extractor de 5 páginas em que a 3 não tem texto (e não é emitida).'''
+    unit_count = 5
+    pages = {1: "a", 2: "b", 4: "d", 5: "e"}
+
+    def iter_units(self, start_unit=1, end_unit=None):
+        for number in range(start_unit, (end_unit or self.unit_count) + 1):
+            if number in self.pages:
+                yield number, self.pages[number], None
+
+
+def test_streamed_hashes_match_the_full_pass():
+    source = _Source()
+    locations = UnitLocations()
+    list(locations.track(source.iter_units(2)))
+
+    assert unit_hashes(source) == _hashes("a", "b", "", "d", "e")
+    assert unit_hashes(source, 2, 4) == _hashes("b", "", "d")
+    assert locations.hash_list(2, 5) == unit_hashes(source)[1:]
@@ -0,0 +1,70 @@
+import contextlib
+from types import SimpleNamespace
+
+import pytest
+
+from app import listener
+from app.core.config import settings
+
+
+class _Connection:
+    '''Stand-in for a psycopg2 connection: `poll` delivers the notifications that have "arrived".'''
+
+    def __init__(self, queued=(), arriving=()):
+        self.notifies = [SimpleNamespace(payload=str(payload)) for payload in queued]
+        self.arriving = [SimpleNamespace(payload=str(payload)) for payload in arriving]
+
+    def poll(self):
+        self.notifies.extend(self.arriving)
+        self.arriving = []
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+    monkeypatch.setattr(listener.celery_app, "producer_or_acquire", lambda: contextlib.nullcontext("producer"))
+    monkeypatch.setattr(listener.celery_app, "send_task",
+                        lambda name, args, producer: sent.append((name, args[0], producer)))
+    return sent
+
+
+@pytest.fixture
+def no_wait(monkeypatch):
+    monkeypatch.setattr(listener, "select", SimpleNamespace(select=lambda *args: ([], [], [])))
+
+
+def test_drain_batch_collects_until_the_window_closes(monkeypatch, no_wait):
+    monkeypatch.setattr(settings, "LISTENER_BATCH_WINDOW_MS", 0)
+    monkeypatch.setattr(settings, "LISTENER_MAX_BATCH", 100)
+    conn = _Connection(queued=[1, "bad", 2], arriving=[3])
+
+    assert listener.drain_batch(conn) == [1, 2, 3]
+    assert conn.notifies == []
+
+
+def test_drain_batch_stops_at_the_batch_limit_and_keeps_the_rest(monkeypatch, no_wait):
+    monkeypatch.setattr(settings, "LISTENER_BATCH_WINDOW_MS", 1000)
+    monkeypatch.setattr(settings, "LISTENER_MAX_BATCH", 2)
+    conn = _Connection(queued=[1, 2, 3, 4])
+
+    assert listener.drain_batch(conn) == [1, 2]
+    assert [notify.payload for notify in conn.notifies] == ["3", "4"]
+    assert listener.drain_batch(conn) == [3, 4]
+
+
+def test_dispatch_dedups_within_a_batch_only(sent):
+    dispatcher = listener.Dispatcher()
+
+    assert dispatcher.dispatch([5, 6, 5, 5]) == [5, 6]
+    # Um documento notificado de novo em outro lote (re-enfileirado) é despachado de novo
+    assert dispatcher.dispatch([5]) == [5]
+    assert [(doc_id, producer) for _, doc_id, producer in sent] == [(5, "producer"), (6, "producer"), (5, "producer")]
+    assert {name for name, _, _ in sent} == {listener.PROCESS_DOCUMENT_TASK}
+    assert dispatcher.dispatch([]) == []
+
+
+def test_backfill_discards_the_queued_notifications_it_covered():
+    conn = _Connection(queued=[1, 2], arriving=[3, 1])
+
+    assert listener.discard_backfilled(conn, [1, 2]) == 3
+    assert [notify.payload for notify in conn.notifies] == ["3"]
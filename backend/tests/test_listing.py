@@ -0,0 +1,173 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Request, Response
+from postgrest.exceptions import APIError
+
+from app.api.deps.pagination import KeysetParams, listing_response
+from app.crud import workspace_crud
+
+
+class _Query:
+    '''Chainable PostgREST query over in-memory rows (select/eq/gt/order/limit).'''
+
+    def __init__(self, database, table: str):
+        self.database = database
+        self.table = table
+        self.columns: list[str] = []
+        self.filters = []
+        self.page_size = None
+
+    def select(self, columns: str):
+        self.columns = columns.split(",")
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: str(row[column]) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row[column] > value)
+        return self
+
+    def order(self, column):
+        assert column == "id"
+        return self
+
+    def limit(self, size):
+        self.page_size = size
+        return self
+
+    def execute(self):
+        self.database.requests.append(self.columns)
+        missing = [column for column in self.columns if column in self.database.missing_columns]
+        if missing:
+            raise APIError({"code": "42703", "message": f"column {missing[0]} does not exist",
+                            "hint": None, "details": None})
+        rows = sorted((row for row in self.database.tables[self.table] if all(f(row) for f in self.filters)),
+                      key=lambda row: row["id"])
+        return SimpleNamespace(data=[{column: row.get(column) for column in self.columns}
+                                     for row in rows[:self.page_size]])
+
+
+class _Database:
+    def __init__(self, missing_columns=()):
+        self.tables: dict[str, list[dict]] = {"workspaces": [], "documents": []}
+        self.missing_columns = set(missing_columns)
+        self.requests: list[list[str]] = []
+
+    def from_(self, table):
+        return _Query(self, table)
+
+
+def _request(if_none_match: str | None = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""})
+
+
+def _documents(database: _Database, count: int, workspace_id: int = 1, user_id: str = "u"):
+    for index in range(count):
+        database.tables["documents"].append({
+            "id": 10 + index * 3, "name": f"doc-{index}.pdf", "status": "COMPLETED", "path": "p",
+            "workspace_id": workspace_id, "user_id": user_id, "created_at": "2024-01-01T00:00:00Z",
+        })
+
+
+def _list_documents(database, params: KeysetParams, if_none_match=None):
+    rows = workspace_crud.get_documents_by_workspace(
+        database, workspace_id=1, user_id="u", limit=params.limit and params.limit + 1, after=params.after)
+    response = Response()
+    return listing_response(_request(if_none_match), response, rows, params), response
+
+
+def test_cursor_walks_every_page_once():
+    database = _Database()
+    _documents(database, 7)
+    _documents(database, 2, workspace_id=2)
+
+    seen, after = [], None
+    while True:
+        rows, response = _list_documents(database, KeysetParams(limit=3, after=after))
+        seen.extend(row["id"] for row in rows)
+        if "X-Next-Cursor" not in response.headers:
+            break
+        after = int(response.headers["X-Next-Cursor"])
+        assert after == rows[-1]["id"]
+
+    assert seen == [10 + index * 3 for index in range(7)]
+
+
+def test_listing_without_limit_reads_every_page(monkeypatch):
+    monkeypatch.setattr(workspace_crud.settings, "LISTING_PAGE_SIZE", 2)
+    database = _Database()
+    _documents(database, 5)
+
+    rows, response = _list_documents(database, KeysetParams(limit=None, after=None))
+    assert len(rows) == 5
+    assert "X-Next-Cursor" not in response.headers
+    # 2 + 2 + 1 linhas
+    assert len(database.requests) == 3
+
+
+def test_same_page_gets_a_304_for_its_weak_etag():
+    database = _Database()
+    _documents(database, 4)
+    params = KeysetParams(limit=2, after=None)
+
+    rows, response = _list_documents(database, params)
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    not_modified, _ = _list_documents(database, params, if_none_match=etag)
+    assert isinstance(not_modified, Response) and not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    # Comparação fraca: a tag sem o W/ também vale
+    strong, _ = _list_documents(database, params, if_none_match=f'"other", {etag.removeprefix("W/")}')
+    assert isinstance(strong, Response) and strong.status_code == 304
+
+    # Outra página, ou a mesma depois de uma mudança, tem outro ETag
+    _, next_page = _list_documents(database, KeysetParams(limit=2, after=rows[-1]["id"]))
+    assert next_page.headers["ETag"] != etag
+    database.tables["documents"][0]["status"] = "PROCESSING"
+    changed, _ = _list_documents(database, params, if_none_match=etag)
+    assert isinstance(changed, list)
+
+
+@pytest.fixture
+def workspace_columns(monkeypatch):
+    monkeypatch.setattr(workspace_crud, "_workspace_columns", workspace_crud.WORKSPACE_COLUMNS)
+
+
+def _workspaces(database: _Database, count: int):
+    database.tables["workspaces"] = [{"id": index + 1, "name": f"w{index}", "user_id": "u",
+                                      "created_at": "2024-01-01T00:00:00Z", "retrieval_top_k": 8}
+                                     for index in range(count)]
+
+
+def test_workspace_listing_drops_optional_columns_missing_from_the_database(workspace_columns):
+    database = _Database(missing_columns=workspace_crud.OPTIONAL_WORKSPACE_COLUMNS)
+    _workspaces(database, 3)
+
+    rows = workspace_crud.get_workspaces_by_user(database, user_id="u")
+
+    assert [row["id"] for row in rows] == [1, 2, 3]
+    assert all("retrieval_top_k" not in row for row in rows)
+    # A coluna ausente fica registrada: as próximas listagens não tentam de novo
+    workspace_crud.get_workspaces_by_user(database, user_id="u")
+    assert ["retrieval_top_k" in columns for columns in database.requests] == [True, False, False]
+
+
+def test_workspace_listing_keeps_optional_columns_when_present(workspace_columns):
+    database = _Database()
+    _workspaces(database, 2)
+
+    rows = workspace_crud.get_workspaces_by_user(database, user_id="u")
+    assert [row["retrieval_top_k"] for row in rows] == [8, 8]
+
+
+def test_missing_required_column_still_fails(workspace_columns):
+    database = _Database(missing_columns={"name"})
+    _workspaces(database, 1)
+
+    with pytest.raises(APIError):
+        workspace_crud.get_workspaces_by_user(database, user_id="u")
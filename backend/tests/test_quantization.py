@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.quantization import (
+    binary_scores,
+    bit_string,
+    int8_scores,
+    quantization_mode,
+    quantize_binary,
+    quantize_int8,
+    shortlist_size,
+)
+from app.services.vector_index import VectorIndexStore
+
+
+def _unit(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_mode_is_validated(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_QUANTIZATION", "")
+    assert quantization_mode() is None
+    monkeypatch.setattr(settings, "EMBEDDING_QUANTIZATION", "INT8")
+    assert quantization_mode() == "int8"
+    monkeypatch.setattr(settings, "EMBEDDING_QUANTIZATION", "pq")
+    with pytest.raises(ValueError):
+        quantization_mode()
+
+
+def test_int8_codes_reconstruct_the_vectors():
+    vectors = _unit(50, 64)
+    codes, scales = quantize_int8(vectors)
+    assert codes.dtype == np.int8 and scales.dtype == np.float32
+    assert np.abs(codes).max() == 127
+    np.testing.assert_allclose(codes * scales[:, None], vectors, atol=scales.max() / 2 + 1e-7)
+
+    query = vectors[3]
+    np.testing.assert_allclose(int8_scores(codes, scales, query), vectors @ query, atol=0.02)
+    # Vetor nulo: escala 1, códigos zero
+    codes, scales = quantize_int8(np.zeros((1, 4), np.float32))
+    assert scales.tolist() == [1.0] and not codes.any()
+
+
+def test_binary_scores_are_the_dot_product_with_the_sign_vectors():
+    vectors = _unit(20, 70)
+    codes = quantize_binary(vectors)
+    assert codes.shape == (20, 9)
+
+    query = _unit(1, 70, seed=1)[0]
+    signs = np.where(vectors > 0, 1.0, -1.0)
+    np.testing.assert_allclose(binary_scores(codes, query), signs @ query, rtol=1e-5, atol=1e-5)
+
+
+def test_bit_string_matches_the_packed_bits():
+    vector = np.array([0.5, -0.1, 0.0, 2.0, -3.0, 0.1, 0.2, -0.2, 1.0], np.float32)
+    assert bit_string(vector) == "100101101"
+    assert np.unpackbits(quantize_binary(vector[None]), count=9).tolist() == [int(bit) for bit in bit_string(vector)]
+
+
+def test_shortlist_is_k_times_the_rescore_factor(monkeypatch):
+    monkeypatch.setattr(settings, "QUANTIZED_RESCORE_FACTOR", 10)
+    assert shortlist_size(5) == 50
+    monkeypatch.setattr(settings, "QUANTIZED_RESCORE_FACTOR", 0)
+    assert shortlist_size(5) == 5
+
+
+@pytest.mark.parametrize("mode", ["int8", "binary"])
+def test_two_stage_search_rescores_with_the_exact_vectors(tmp_path, monkeypatch, mode):
+    monkeypatch.setattr(settings, "EMBEDDING_QUANTIZATION", mode)
+    monkeypatch.setattr(settings, "QUANTIZED_RESCORE_FACTOR", 20)
+    monkeypatch.setattr(settings, "VECTOR_INDEX_MIN_IVF_SIZE", 100_000)
+    vectors = _unit(500, 64)
+    chunk_ids = np.arange(1, 501)
+    store = VectorIndexStore(tmp_path)
+    store.rebuild(1, chunk_ids, np.ones(500), vectors[:480])
+    store.add(1, chunk_ids[480:], np.ones(20), vectors[480:])
+    snapshot = store.snapshot(1)
+    assert snapshot.quantization() == mode
+    assert len(snapshot.delta_codes) == 20
+
+    recall = []
+    for row in (3, 250, 490):
+        query = vectors[row] + 0.05 * _unit(1, 64, seed=row)[0]
+        ids, scores = store.search(1, query, 5)
+        unit_query = query / np.linalg.norm(query)
+        # Os scores finais são os cossenos exatos, não os aproximados
+        np.testing.assert_allclose(scores, vectors[ids - 1] @ unit_query, rtol=1e-5)
+        assert ids[0] == row + 1
+        exact = set(np.argsort(-(vectors @ unit_query))[:5] + 1)
+        recall.append(len(exact & set(ids.tolist())) / 5)
+    assert np.mean(recall) >= 0.8
+
+
+def test_index_without_the_configured_codes_searches_exactly(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_QUANTIZATION", "")
+    vectors = _unit(50, 16)
+    store = VectorIndexStore(tmp_path)
+    store.rebuild(1, np.arange(1, 51), np.ones(50), vectors)
+
+    monkeypatch.setattr(settings, "EMBEDDING_QUANTIZATION", "int8")
+    assert store.snapshot(1).quantization() is None
+    assert store.search(1, vectors[9], 1)[0].tolist() == [10]
@@ -0,0 +1,83 @@
+import base64
+import struct
+
+import numpy as np
+
+from app.services.rag_service import _rerank, decode_vector_b64
+from app.services.reranking import _normalize, mmr_select, rerank_mmr
+
+
+def _reference_mmr(relevance, vectors, k, lambda_):
+    '''MMR recomputing every similarity to the picked set; the first pick is the most relevant.'''
+    picked = [int(np.argmax(relevance))]
+    while len(picked) < min(k, len(relevance)):
+        scores = [
+            lambda_ * relevance[i] - (1 - lambda_) * max(vectors[i] @ vectors[j] for j in picked)
+            if i not in picked else -np.inf
+            for i in range(len(relevance))
+        ]
+        picked.append(int(np.argmax(scores)))
+    return picked
+
+
+def _vector_b64(vector) -> str:
+    return base64.b64encode(struct.pack(f">HH{len(vector)}f", len(vector), 0, *vector)).decode()
+
+
+def test_mmr_matches_the_reference_loop():
+    rng = np.random.default_rng(3)
+    centers = rng.standard_normal((5, 16))
+    vectors = _normalize((centers[rng.integers(0, 5, 40)] + 0.2 * rng.standard_normal((40, 16))).astype(np.float32))
+    relevance = rng.uniform(0.3, 0.9, 40).astype(np.float32)
+
+    for lambda_ in (0.3, 0.7, 1.0):
+        assert mmr_select(relevance, vectors, 8, lambda_).tolist() == _reference_mmr(relevance, vectors, 8, lambda_)
+
+
+def test_mmr_skips_near_duplicates():
+    vectors = _normalize(np.array([[1, 0], [1, 0.01], [0, 1]], np.float32))
+    relevance = np.array([0.9, 0.89, 0.6], np.float32)
+
+    assert mmr_select(relevance, vectors, 2, 1.0).tolist() == [0, 1]
+    assert mmr_select(relevance, vectors, 2, 0.5).tolist() == [0, 2]
+    assert mmr_select(relevance, vectors, 0, 0.5).tolist() == []
+    assert mmr_select(relevance, vectors, 5, 0.5).tolist() == [0, 2, 1]
+
+
+def test_rerank_uses_the_fused_score_when_every_row_has_one():
+    rows = [{'id': 1, 'similarity': 0.1, 'rrf_score': 0.03},
+            {'id': 2, 'similarity': 0.9, 'rrf_score': 0.01},
+            {'id': 3, 'similarity': None, 'rrf_score': 0.02}]
+    vectors = np.eye(3, dtype=np.float32)
+
+    assert [row['id'] for row in rerank_mmr(rows, vectors, 2, lambda_=1.0)] == [1, 3]
+    del rows[2]['rrf_score']
+    assert [row['id'] for row in rerank_mmr(rows, vectors, 2, lambda_=1.0)] == [2, 1]
+
+
+def test_vector_send_base64_is_decoded():
+    vector = np.array([0.5, -1.25, 3.0], np.float32)
+    decoded = decode_vector_b64(_vector_b64(vector))
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, vector)
+    # O base64 do Postgres quebra linhas a cada 76 caracteres
+    long_vector = np.arange(100, dtype=np.float32)
+    encoded = _vector_b64(long_vector)
+    wrapped = "\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+    np.testing.assert_array_equal(decode_vector_b64(wrapped), long_vector)
+
+
+def test_rerank_stage_decodes_and_drops_the_embeddings():
+    rows = [{'id': 1, 'similarity': 0.9, 'embedding_b64': _vector_b64([1.0, 0.0])},
+            {'id': 2, 'similarity': 0.89, 'embedding_b64': _vector_b64([1.0, 0.01])},
+            {'id': 3, 'similarity': 0.6, 'embedding': np.array([0.0, 1.0], np.float32)},
+            {'id': 4, 'similarity': 0.5}]
+
+    picked = _rerank(rows, 2)
+    assert [row['id'] for row in picked] == [1, 3]
+    assert all('embedding' not in row and 'embedding_b64' not in row for row in rows)
+
+
+def test_rerank_stage_without_embeddings_keeps_the_order():
+    rows = [{'id': 1, 'similarity': 0.9}, {'id': 2, 'similarity': 0.8}, {'id': 3, 'similarity': 0.7}]
+    assert [row['id'] for row in _rerank(rows, 2)] == [1, 2]
@@ -0,0 +1,88 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from jose import JWTError, jwt
+
+from app.core import security
+from app.core.config import settings
+from app.core.security import ClaimsCache
+
+
+def _token(secret=None, **claims) -> str:
+    claims = {"sub": "user-1", "aud": settings.SUPABASE_JWT_AUDIENCE, "exp": int(time.time()) + 3600, **claims}
+    return jwt.encode(claims, secret or settings.SUPABASE_JWT_SECRET, algorithm="HS256")
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ClaimsCache(ttl_seconds=300, max_entries=100)
+    monkeypatch.setattr(security, "claims_cache", cache)
+    return cache
+
+
+def test_valid_token_is_verified_and_cached(cache):
+    token = _token()
+
+    assert security.verify_token(token)["sub"] == "user-1"
+    assert cache.get(token)["sub"] == "user-1"
+    assert security.get_current_user(token) == "user-1"
+
+
+def test_bad_signature_is_rejected(cache):
+    token = _token(secret="another-secret")
+
+    with pytest.raises(JWTError):
+        security.verify_token(token)
+    with pytest.raises(HTTPException) as error:
+        security.get_current_user(token)
+    assert error.value.status_code == 401
+    assert cache.get(token) is None
+
+
+def test_wrong_audience_is_rejected(cache):
+    with pytest.raises(JWTError):
+        security.verify_token(_token(aud="anon"))
+
+
+def test_expired_token_is_rejected_even_if_its_claims_were_cached(monkeypatch, cache):
+    exp = int(time.time()) - 10
+    token = _token(exp=exp)
+    # Claims guardados quando o token ainda era válido (antes do TTL vencer)
+    monkeypatch.setattr(security, "time", SimpleNamespace(time=lambda: exp - 60))
+    cache.set(token, jwt.get_unverified_claims(token))
+    assert cache.get(token) is not None
+    monkeypatch.setattr(security, "time", time)
+
+    with pytest.raises(JWTError):
+        security.verify_token(token)
+
+
+def test_cache_ttl_is_capped_at_the_token_exp(monkeypatch):
+    monkeypatch.setattr(security, "time", SimpleNamespace(time=lambda: 1000.0))
+    cache = ClaimsCache(ttl_seconds=300, max_entries=10)
+
+    cache.set("short", {"exp": 1010})
+    cache.set("long", {"exp": 5000})
+    assert cache._entries[cache._key("short")][0] == 1010
+    assert cache._entries[cache._key("long")][0] == 1300
+
+    monkeypatch.setattr(security, "time", SimpleNamespace(time=lambda: 1010.0))
+    assert cache.get("short") is None
+    assert cache.get("long") == {"exp": 5000}
+
+
+def test_cache_evicts_the_least_recently_used_entry(monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_CLAIMS_CACHE_MAX_ENTRIES", 2)
+    cache = ClaimsCache(settings.AUTH_CLAIMS_CACHE_TTL_SECONDS, settings.AUTH_CLAIMS_CACHE_MAX_ENTRIES)
+    exp = time.time() + 3600
+
+    cache.set("a", {"exp": exp, "sub": "a"})
+    cache.set("b", {"exp": exp, "sub": "b"})
+    assert cache.get("a")["sub"] == "a"
+    cache.set("c", {"exp": exp, "sub": "c"})
+
+    assert len(cache._entries) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import ingestion_pipeline
+from app.services.chunking import Chunk
+from app.services.vector_index import VectorIndexStore
+
+
+def _vectors(count: int, dim: int = 32, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+def _exact_top(vectors: np.ndarray, chunk_ids: np.ndarray, query: np.ndarray, k: int) -> set[int]:
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return set(chunk_ids[np.argsort(-(unit @ query))[:k]].tolist())
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_QUANTIZATION", "")
+    monkeypatch.setattr(settings, "VECTOR_INDEX_MIN_IVF_SIZE", 200)
+    monkeypatch.setattr(settings, "VECTOR_INDEX_REBUILD_RATIO", 0.2)
+    return VectorIndexStore(tmp_path)
+
+
+def test_ivf_search_matches_exact_search_when_probing_every_list(store):
+    vectors = _vectors(400)
+    chunk_ids = np.arange(1, 401)
+    store.rebuild(1, chunk_ids, np.ones(400), vectors)
+    snapshot = store.snapshot(1)
+    assert len(snapshot.centroids) == 20
+
+    query = vectors[7] / np.linalg.norm(vectors[7])
+    ids, scores = store.search(1, query, 10, nprobe=len(snapshot.centroids))
+    assert set(ids.tolist()) == _exact_top(vectors, chunk_ids, query, 10)
+    assert ids[0] == 8
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_add_goes_to_the_delta_until_the_rebuild_ratio(store):
+    vectors = _vectors(490)
+    store.rebuild(1, np.arange(1, 401), np.ones(400), vectors[:400])
+    base_version = store.snapshot(1).version
+
+    store.add(1, np.arange(401, 431), np.full(30, 2), vectors[400:430])
+    snapshot = store.snapshot(1)
+    assert len(snapshot.delta_chunk_ids) == 30
+    assert len(snapshot.chunk_ids) == 400
+    assert snapshot.version != base_version
+    # Chunks do delta são encontrados (busca exata no delta)
+    ids, _ = store.search(1, vectors[410], 1)
+    assert ids[0] == 411
+
+    # Ids já indexados são ignorados
+    store.add(1, np.arange(401, 431), np.full(30, 2), vectors[400:430])
+    assert store.snapshot(1).version == snapshot.version
+
+    store.add(1, np.arange(431, 461), np.full(30, 2), vectors[430:460])
+    assert len(store.snapshot(1).delta_chunk_ids) == 60
+
+    # 90 >= 0.2 * 400: o índice é reconstruído com tudo na base
+    store.add(1, np.arange(461, 491), np.full(30, 2), vectors[460:490])
+    snapshot = store.snapshot(1)
+    assert len(snapshot.delta_chunk_ids) == 0
+    assert sorted(snapshot.chunk_ids.tolist()) == list(range(1, 491))
+
+
+def test_first_add_builds_the_index_from_the_backfill(store):
+    vectors = _vectors(50)
+    store.add(1, [50], [1], vectors[49:], backfill=lambda: (np.arange(1, 51), np.ones(50), vectors))
+    assert sorted(store.snapshot(1).chunk_ids.tolist()) == list(range(1, 51))
+
+
+def test_removed_chunks_are_tombstoned_then_compacted(store):
+    vectors = _vectors(400)
+    store.rebuild(1, np.arange(1, 401), np.repeat([1, 2], 200), vectors)
+
+    store.remove_chunks(1, [8])
+    snapshot = store.snapshot(1)
+    assert snapshot.deleted.tolist() == [8]
+    assert 8 not in store.search(1, vectors[7], 5, nprobe=100)[0]
+
+    store.remove_document(1, 2)
+    snapshot = store.snapshot(1)
+    assert len(snapshot.deleted) == 0
+    assert sorted(snapshot.chunk_ids.tolist()) == [i for i in range(1, 201) if i != 8]
+
+
+def test_chunk_writer_updates_the_indexes_once_per_batch(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_QUANTIZATION", "")
+    monkeypatch.setattr(settings, "INDEX_UPDATE_BATCH_SIZE", 6)
+    monkeypatch.setattr(ingestion_pipeline, "local_indexes_enabled", lambda: True)
+    updates, checkpoints = [], []
+    monkeypatch.setattr(ingestion_pipeline, "index_inserted_chunks",
+                        lambda db, workspace_id, rows: updates.append([row['id'] for row in rows]))
+    monkeypatch.setattr(ingestion_pipeline, "save_checkpoint",
+                        lambda db, document_id, page, processed=None: checkpoints.append((page, processed)))
+
+    class Inserts:
+        next_id = 0
+
+        def table(self, name):
+            return self
+
+        def insert(self, rows):
+            self.rows = rows
+            return self
+
+        def execute(self):
+            ids = range(self.next_id + 1, self.next_id + len(self.rows) + 1)
+            self.next_id += len(self.rows)
+            return type("Result", (), {"data": [{**row, "id": i} for row, i in zip(self.rows, ids)]})()
+
+    document = {"id": 1, "workspace_id": 7, "user_id": "u"}
+    with ingestion_pipeline.ChunkWriter(Inserts(), document, batch_size=2) as writer:
+        for i in range(10):
+            writer.add(Chunk(i + 1, f"chunk {i}", {"page_number": i + 1}), [1.0, 0.0])
+        writer.flush(completed_page=10)
+
+    assert updates == [[1, 2, 3, 4, 5, 6], [7, 8, 9, 10]]
+    # O checkpoint só avança depois que os chunks dele foram indexados
+    assert checkpoints == [(3, 4), (5, 6), (10, 10)]